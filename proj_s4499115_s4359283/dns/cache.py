@@ -14,6 +14,8 @@ from dns.resource import ResourceRecord, RecordData
 from dns.rtypes import Type
 from dns.classes import Class
 import dns.consts as Consts
+import dns.log
+import dns.metrics
 import threading
 import time
 from copy import deepcopy
@@ -23,13 +25,26 @@ class RecordCache(object):
 
     def __init__(self, ttl):
         """ Initialize the RecordCache """
-        self.records = []
+        self.records = {}#(name, type, class) to the records with that name, type and class
+        self.responses = {}#(name, type, class) of a question to the response, see add_response
+        self.delegations = {}#(zone, NS, class) of a zone cut to the time it expires and the names of its nameservers, see add_delegation
         self.ttl = ttl if ttl > 0 else 0 
         self.lock = threading.Lock()
 
+        #Popularity of the entries, used to refresh popular ones before they expire
+        self.hits = {}
+        self.original_ttls = {}
+        self.prefetching = set()
+        self.prefetcher = None
+
         #Lees de cache in, update de ttls, gooi alle invalid data weg
         self.lastCleanup = int(time.time())
         self.read_cache_file()
+
+    @staticmethod
+    def key(dname, type_, class_):
+        """ Key of the entry for a domain name, type and class """
+        return (str(dname).rstrip('.').lower() + '.', type_, class_)
     
     def cleanup(self):
         """ Remove all entries in the cache whose TTL has expired """
@@ -37,10 +52,27 @@ class RecordCache(object):
         self.lock.acquire()
         curTime = int(time.time())
         elapsed = curTime - self.lastCleanup
-        self.records = [record for record in self.records if elapsed <= record.ttl]#Throw away expired records
+        records = {}
+        evicted = 0
+        for key, entry in self.records.items():
+            kept = [record for record in entry if elapsed <= record.ttl + Consts.STALE_WINDOW]#Throw away records that are too old to serve stale
+            evicted += len(entry) - len(kept)
+            if kept:
+                records[key] = kept
+        dns.metrics.cache_evictions.inc(evicted)
+        self.records = records
+        self.responses = {key: response for key, response in self.responses.items()
+                if response[1] + Consts.STALE_WINDOW >= curTime}
+        self.delegations = {key: delegation for key, delegation in self.delegations.items() if delegation[0] >= curTime}
+        for key in list(self.original_ttls):
+            if key not in records:
+                del self.original_ttls[key]
+                self.hits.pop(key, None)
+                self.prefetching.discard(key)
         #Update ttls
-        for record in self.records:
-            record.ttl -= elapsed
+        for entry in self.records.values():
+            for record in entry:
+                record.ttl -= elapsed
         self.lock.release()
 
         self.lastCleanup = int(time.time())#curTime
@@ -49,7 +81,8 @@ class RecordCache(object):
         """ Lookup resource records in cache
 
         Lookup for the resource records for a domain name with a specific type
-        and class.
+        and class. If the entry is popular and close to expiring, it is
+        refreshed in the background using the prefetcher.
         
         Args:
             dname (str): domain name
@@ -60,58 +93,276 @@ class RecordCache(object):
         if (int(time.time()) - self.lastCleanup >= 3600): #Cache al een uur lang niet gecleaned, dus doe het nu maar
             self.cleanup()
 
-        """
-        print("STARTING LOOKUP FOR",dname, type_, class_)
-        for record in self.records:
-            print("-----COMPARING")
-            print(type(str(record.name)),type(dname))
-            print(dname,type_,class_)
-            print(record.name,record.type_,record.class_)
-            print("---------------")
-            if str(record.name) == dname and record.type_ == type_ and record.class_ == class_:
-                print("MATCH")
-        """
         curTime = int(time.time())
         elapsed = curTime - self.lastCleanup
 
-        foundrecords = [record for record in self.records \
-                if str(record.name) == dname and record.type_ == type_ and record.class_ == class_ \
-                and elapsed <= record.ttl]
+        key = self.key(dname, type_, class_)
+        foundrecords = [record for record in self.records.get(key, []) if elapsed <= record.ttl]
+        if not foundrecords:
+            return []
         
         foundrecords = [deepcopy(record) for record in foundrecords]
         #Verschuif de ttl en timestamp naar nu
         for record in foundrecords:
             record.ttl -= elapsed
-            
+
+        self.hits[key] = self.hits.get(key, 0) + 1
+        self.check_prefetch(key, min(record.ttl for record in foundrecords))
+        return foundrecords
+
+    def lookup_stale(self, dname, type_, class_):
+        """ Lookup expired resource records that may still be served
+
+        Expired records are kept for STALE_WINDOW seconds, so they can be
+        served when the nameservers can't be reached in time. See RFC 8767.
+
+        Args:
+            dname (str): domain name
+            type_ (Type): type
+            class_ (Class): class
+
+        Returns:
+            records ([ResourceRecord]): copies of the expired records, with a ttl of STALE_TTL
+        """
+        elapsed = int(time.time()) - self.lastCleanup
+        key = self.key(dname, type_, class_)
+        foundrecords = [deepcopy(record) for record in self.records.get(key, [])
+                if record.ttl < elapsed <= record.ttl + Consts.STALE_WINDOW]
+        for record in foundrecords:
+            record.ttl = Consts.STALE_TTL
         return foundrecords
+
+    def add_response(self, dname, type_, class_, rcode, answers, authorities, additionals):
+        """ Add the response to a question to the cache
+
+        The answers are stored as RRsets like any other record, the response
+        only refers to them. This way a response is complete as long as its
+        RRsets are, and an RRset that is refreshed is refreshed for all
+        responses that use it. The authority and additional sections are kept
+        with the response only, so records that a server added to them are
+        never given as the answer to another question. Negative responses are
+        kept for as long as the SOA in their authority section says, see
+        section 5 of RFC 2308.
+
+        Args:
+            dname (str): domain name of the question
+            type_ (Type): type of the question
+            class_ (Class): class of the question
+            rcode (RCode): rcode of the response
+            answers ([ResourceRecord]): the answer section
+            authorities ([ResourceRecord]): the authority section
+            additionals ([ResourceRecord]): the additional section
+        """
+        if answers:
+            ttl = min(record.ttl for record in answers)
+        else:
+            soas = [record for record in authorities if record.type_ == Type.SOA]
+            if not soas:#Without a SOA we don't know how long the answer holds
+                return
+            ttl = min(soas[0].ttl, soas[0].rdata.minimum)
+        if self.ttl > 0:
+            ttl = self.ttl
+
+        answerkeys = []
+        for record in answers:
+            key = self.key(record.name, record.type_, record.class_)
+            if key not in answerkeys:
+                answerkeys.append(key)
+            self.add_record(deepcopy(record))
+        private = []
+        for section in (authorities, additionals):
+            records = [deepcopy(record) for record in section if record.type_ != Type.OPT]
+            if self.ttl > 0:
+                for record in records:
+                    record.ttl = self.ttl
+            private.append(records)
+
+        curTime = int(time.time())
+        with self.lock:
+            self.responses[self.key(dname, type_, class_)] = (rcode, curTime + ttl, answerkeys, private[0], private[1], curTime)
+
+    def lookup_response(self, dname, type_, class_, stale=False):
+        """ Lookup the response to a question in the cache
+
+        Args:
+            dname (str): domain name of the question
+            type_ (Type): type of the question
+            class_ (Class): class of the question
+            stale (bool): use expired data that is still within STALE_WINDOW
+
+        Returns:
+            rcode (RCode): rcode of the response,
+            answers ([ResourceRecord]): the answer section,
+            authorities ([ResourceRecord]): the authority section,
+            additionals ([ResourceRecord]): the additional section,
+            or None if the response isn't (completely) in the cache
+        """
+        response = self.responses.get(self.key(dname, type_, class_))
+        if response is None:
+            return None
+        rcode, expires, answerkeys, authorities, additionals, stored = response
+        if expires < time.time() and not (stale and expires + Consts.STALE_WINDOW >= time.time()):
+            return None
+
+        answers = []
+        for key in answerkeys:
+            found = self.lookup(*key)
+            if not found and stale:
+                found = self.lookup_stale(*key)
+            if not found:
+                return None
+            answers += found
+        age = int(time.time()) - stored
+        found_authorities = self.private_records(authorities, age, stale)
+        #Additional data may be left out, and so may the authority section of a positive answer
+        if not answers and len(found_authorities) < len(authorities):
+            return None
+        return rcode, answers, found_authorities, self.private_records(additionals, age, stale)
+
+    @staticmethod
+    def private_records(records, age, stale):
+        """ Copies of the records kept with a response that haven't expired
+
+        Args:
+            records ([ResourceRecord]): the records, with their ttl when they were stored
+            age (int): seconds since the records were stored
+            stale (bool): give expired records that are still within STALE_WINDOW a ttl of STALE_TTL
+
+        Returns:
+            records ([ResourceRecord]): the copies, with their ttl counted down
+        """
+        found = []
+        for record in records:
+            record = deepcopy(record)
+            record.ttl -= age
+            if record.ttl < 0:
+                if not stale or record.ttl + Consts.STALE_WINDOW < 0:
+                    continue
+                record.ttl = Consts.STALE_TTL
+            found.append(record)
+        return found
+
+    def check_prefetch(self, key, remaining):
+        """ Start refreshing an entry if it is popular and about to expire
+
+        Args:
+            key ((str, Type, Class)): key of the entry
+            remaining (int): seconds until the entry expires
+        """
+        original = self.original_ttls.get(key, 0)
+        if self.prefetcher is None or self.hits[key] < Consts.PREFETCH_MIN_HITS or \
+                remaining > original * Consts.PREFETCH_FRACTION:
+            return
+        with self.lock:
+            if key in self.prefetching:
+                return
+            self.prefetching.add(key)
+        self.prefetcher(*key)
         
+    def add_delegation(self, nameservers, addresses):
+        """ Add the NS records of a referral and the glue for them
+
+        The zone cut is kept apart from the RRsets, so NS records that come
+        with other responses can't change where resolutions start. The
+        resolver must only pass referrals and glue it checked, see
+        Resolver.follow_referral.
+
+        Args:
+            nameservers ([ResourceRecord]): the NS records of the zone cut, all with the same owner
+            addresses ([ResourceRecord]): A records of the nameservers
+        """
+        for record in addresses:
+            self.add_record(deepcopy(record))
+        ttl = self.ttl if self.ttl > 0 else min(record.ttl for record in nameservers)
+        with self.lock:
+            self.delegations[self.key(nameservers[0].name, Type.NS, nameservers[0].class_)] = \
+                    (int(time.time()) + ttl, [str(record.rdata.nsdname) for record in nameservers])
+
+    def find_delegation(self, dname, class_):
+        """ Find the closest zone cut above a name that can be asked about it
+
+        The zone cut is the name, or the closest ancestor of it, that was
+        added with add_delegation and of which at least one nameserver has a
+        cached address. Unlike lookup, this doesn't count as a hit of the
+        records or refresh them.
+
+        Args:
+            dname (str): the domain name
+            class_ (Class): class of the question
+
+        Returns:
+            zone (str): the zone cut, None if there is none,
+            addresses ([str]): addresses of the nameservers of the zone cut
+        """
+        curTime = int(time.time())
+        elapsed = curTime - self.lastCleanup
+        labels = self.key(dname, Type.NS, class_)[0].rstrip('.').split('.')
+        for index in range(len(labels) if labels != [''] else 0):
+            zone = ".".join(labels[index:]) + "."
+            delegation = self.delegations.get((zone, Type.NS, class_))
+            if delegation is None or delegation[0] < curTime:
+                continue
+            addresses = [str(record.rdata.address) for nsdname in delegation[1]
+                    for record in self.records.get(self.key(nsdname, Type.A, class_), []) if elapsed <= record.ttl]
+            if addresses:
+                return zone, addresses
+        return None, []
+
+    def find_zone_cut(self, dname, class_):
+        """ Find the closest zone cut above a name, whether its nameservers have an address or not
+
+        Args:
+            dname (str): the domain name
+            class_ (Class): class of the question
+
+        Returns:
+            zone (str): the zone cut, None if there is none
+        """
+        curTime = int(time.time())
+        labels = self.key(dname, Type.NS, class_)[0].rstrip('.').split('.')
+        for index in range(len(labels) if labels != [''] else 0):
+            zone = ".".join(labels[index:]) + "."
+            delegation = self.delegations.get((zone, Type.NS, class_))
+            if delegation is not None and delegation[0] >= curTime:
+                return zone
+        return None
+
     def add_record(self, new_rec):
         """ Add a new Record to the cache
+
+        If the record is already in the cache, its ttl is refreshed.
         
         Args:
             record (ResourceRecord): the record added to the cache
         """
 
         self.lock.acquire()
-        found = self.lookup(str(new_rec.name), new_rec.type_, new_rec.class_)
-        if not found:
-            #print("CACHE--Adding record..")
-            if self.ttl > 0:#TTL was a parameter, so use it
-                new_rec.ttl = self.ttl
-
-            #Instead of cleaning the entire cache to keep the timestamp (lastCleanup) correct, we compensate the new ttl by adding the elapsed time
-            curTime = int(time.time())
-            elapsed = curTime - self.lastCleanup
-            new_rec.ttl += elapsed
-            #print(new_rec.to_dict())
-            self.records.append(new_rec)
+        if self.ttl > 0:#TTL was a parameter, so use it
+            new_rec.ttl = self.ttl
+        ttl = new_rec.ttl
+
+        #Instead of cleaning the entire cache to keep the timestamp (lastCleanup) correct, we compensate the new ttl by adding the elapsed time
+        curTime = int(time.time())
+        elapsed = curTime - self.lastCleanup
+        new_rec.ttl += elapsed
+
+        key = self.key(new_rec.name, new_rec.type_, new_rec.class_)
+        rdata = new_rec.rdata.to_dict()
+        #Records are replaced instead of modified, so lookups never see a half updated entry
+        entry = [record for record in self.records.get(key, []) if record.rdata.to_dict() != rdata and elapsed <= record.ttl]
+        self.records[key] = entry + [new_rec]
+
+        if key in self.prefetching:#The entry was refreshed, it has to earn its popularity again
+            self.prefetching.discard(key)
+            self.hits[key] = self.hits.get(key, 0) // 2
+        self.original_ttls[key] = max(ttl, 1)
 
         self.lock.release()
 
     def read_cache_file(self, cache_file=Consts.CACHE_FILE):
         """ Read the cache file from disk """
         #Empty current cache
-        self.records = []
+        self.records = {}
 
         #Load from file
         try:
@@ -121,12 +372,15 @@ class RecordCache(object):
             with open(cache_file,"r") as infile:
                 curTime = int(time.time())
                 dcts = json.load(infile)
-                self.records = [ResourceRecord.from_dict(dct) for dct in dcts]
+                for record in [ResourceRecord.from_dict(dct) for dct in dcts]:
+                    key = self.key(record.name, record.type_, record.class_)
+                    self.records[key] = self.records.get(key, []) + [record]
+                    self.original_ttls[key] = max(record.ttl, 1)
                 #Don't add the entries whose TTL is expired and update the ttls
                 self.cleanup()
 
         except (ValueError, IOError, FileNotFoundError) as e:
-            print("An error has occured while loading cache from disk: " + str(e))
+            dns.log.logger.warning("An error has occured while loading cache from disk: %s", e)
 
             with open(cache_file, 'w') as outfile:
                 json.dump([], outfile, indent=2)
@@ -135,8 +389,8 @@ class RecordCache(object):
                 outfile.write(str(self.lastCleanup))
 
             if isinstance(e,FileNotFoundError):
-                print("Missing files were created")
-            self.records = []
+                dns.log.logger.info("Missing files were created")
+            self.records = {}
         #print("Loaded the following records:")
         #for rec in self.records:
         #    print(rec.to_dict())
@@ -144,7 +398,7 @@ class RecordCache(object):
     def write_cache_file(self):
         """ Write the cache file to disk """
         self.cleanup()
-        dcts = [record.to_dict() for record in self.records]
+        dcts = [record.to_dict() for entry in self.records.values() for record in entry]
         
         try:
             with open(Consts.CACHE_FILE, 'w') as outfile:
@@ -154,4 +408,4 @@ class RecordCache(object):
                 outfile.write(str(self.lastCleanup))
 
         except IOError as e:
-            print("An error has occured while writing cache to disk: " + str(e))
+            dns.log.logger.error("An error has occured while writing cache to disk: %s", e)
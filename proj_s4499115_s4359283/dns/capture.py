@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+""" Capture of queries and responses
+
+Like dnstap, the server can write every query it receives and every response
+it sends to a compact binary log, so real traffic can later be replayed
+against a test server (see dns_replay.py). The messages are written in the
+wire format, as they were received or sent, by a background thread: the
+handler threads only put them on a bounded queue, and messages are dropped
+when it is full.
+
+A capture file starts with MAGIC, followed by a frame per message: a header
+in the format of FRAME (kind, transport, time, address, port and length of
+the message) and then the message itself. Addresses are stored as 16 bytes,
+IPv4 addresses mapped into IPv6.
+"""
+
+import queue
+import socket
+import struct
+import threading
+
+import dns.consts as Consts
+import dns.metrics
+
+MAGIC = b"PYDNSCAP\x01"
+FRAME = struct.Struct("!BBd16sHH")
+
+#Kinds of frames
+QUERY = 1
+RESPONSE = 2
+
+TRANSPORTS = ("udp", "tcp")
+
+dropped = dns.metrics.registry.counter("dns_capture_dropped_total", "Captured messages that were not written")
+
+
+def pack_address(ip):
+    """ An IPv4 or IPv6 address as 16 bytes """
+    try:
+        return b"\x00" * 10 + b"\xff\xff" + socket.inet_pton(socket.AF_INET, ip)
+    except OSError:
+        return socket.inet_pton(socket.AF_INET6, ip)
+
+
+def unpack_address(packed):
+    """ An address packed by pack_address as a string """
+    if packed[:12] == b"\x00" * 10 + b"\xff\xff":
+        return socket.inet_ntop(socket.AF_INET, packed[12:])
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+
+def read_capture(infile):
+    """ Read the frames of a capture
+
+    Args:
+        infile (file): capture opened in binary mode
+
+    Yields:
+        kind (int): QUERY or RESPONSE,
+        transport (str): "udp" or "tcp",
+        timestamp (float): epoch time the message was received or sent,
+        address ((str, int)): address of the client,
+        data (bytes): the message in the wire format
+    """
+    if infile.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a capture file")
+    while True:
+        header = infile.read(FRAME.size)
+        if len(header) < FRAME.size:#End of the file, or a frame cut short by a crash
+            return
+        kind, transport, timestamp, packed, port, length = FRAME.unpack(header)
+        data = infile.read(length)
+        if len(data) < length:
+            return
+        yield kind, TRANSPORTS[transport], timestamp, (unpack_address(packed), port), data
+
+
+class Capture(object):
+    """ Writes the queries and responses of the server to a capture file """
+
+    def __init__(self):
+        """ Initialize the capture, it does nothing until it is started """
+        self.queue = None
+        self.thread = None
+
+    def start(self, path, queue_size=Consts.CAPTURE_QUEUE_SIZE):
+        """ Start writing to a capture file in the background
+
+        Args:
+            path (str): the capture file, it is overwritten
+            queue_size (int): number of messages that may wait to be written
+        """
+        outfile = open(path, "wb")
+        outfile.write(MAGIC)
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self.write, args=(self.queue, outfile), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """ Write the messages that are still queued and close the file """
+        if self.queue is None:
+            return
+        records = self.queue
+        self.queue = None
+        records.put(None)
+        self.thread.join()
+
+    def add(self, kind, transport, timestamp, address, data):
+        """ Capture a message, if the capture was started
+
+        Args:
+            kind (int): QUERY or RESPONSE
+            transport (str): "udp" or "tcp"
+            timestamp (float): epoch time the message was received or sent
+            address ((str, int)): address of the client
+            data (bytes): the message in the wire format
+        """
+        records = self.queue
+        if records is None:
+            return
+        try:
+            records.put_nowait((kind, transport, timestamp, address, data))
+        except queue.Full:
+            dropped.inc()
+
+    def write(self, records, outfile):
+        """ Write the captured messages until stop is called """
+        with outfile:
+            while True:
+                record = records.get()
+                if record is None:
+                    return
+                kind, transport, timestamp, address, data = record
+                outfile.write(FRAME.pack(kind, TRANSPORTS.index(transport), timestamp,
+                        pack_address(address[0]), address[1], len(data)) + data)
+
+
+#The capture of the server, disabled until it is started
+capture = Capture()
@@ -4,7 +4,9 @@
 
 This module contains an Enum of CLASS and QCLASS values. The Enum also contains
 a method for converting values to strings. See sections 3.2.4 and 3.2.5 of RFC
-1035 for more information.
+1035 for more information. Codes without a name become pseudo-members
+(CLASS<code>, RFC 3597) instead of raising, and CLASSES maps every code to its
+Class for decoding.
 """
 
 
@@ -25,6 +27,8 @@ class Class(IntEnum):
         <Class.IN: 1>
         >>> Class.IN == 1
         True
+        >>> Class(254)
+        <Class.CLASS254: 254>
     """
 
     IN = 1
@@ -35,3 +39,41 @@ class Class(IntEnum):
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def _missing_(cls, value):
+        """ A pseudo-member for a code without a name, like CLASS65280 (RFC 3597)
+
+        It keeps the code, so records of unknown classes can be passed on as they are.
+        """
+        if not isinstance(value, int) or not 0 <= value <= 0xffff:
+            return None
+        member = int.__new__(cls, value)
+        member._name_ = "CLASS" + str(value)
+        member._value_ = value
+        member = cls._value2member_map_.setdefault(value, member)
+        CLASSES[value] = member
+        return member
+
+    @classmethod
+    def from_name(cls, name):
+        """ The Class with a name, CLASS<code> for codes without a name """
+        if name in cls.__members__:
+            return cls.__members__[name]
+        if name.startswith("CLASS") and name[5:].isdigit():
+            return cls(int(name[5:]))
+        raise KeyError(name)
+
+
+#The Class of every 16-bit code, so decoding a code is an index instead of an Enum call
+CLASSES = [None] * 0x10000
+for _member in Class:
+    CLASSES[_member] = _member
+
+
+def class_from_code(code):
+    """ The Class of a code from a message, a pseudo-member if it has no name """
+    member = CLASSES[code]
+    if member is None:
+        member = Class(code)
+    return member
@@ -21,7 +21,168 @@ CACHE_FILE = "cache.json"
 #Relative path to the zone file's location on disk
 ZONE_FILE = "zone.txt"
 
+#Seconds between two checks of the zone file when watching it for changes
+ZONE_WATCH_INTERVAL = 1
+
 DEFAULT_TIMEOUT = 5
 
 #Default TTL for all cached records
 DEFAULT_TTL = 1000
+
+#Number of changes to a zone that are kept for incremental zone transfers
+JOURNAL_SIZE = 100
+
+#Number of records sent in a single message of a zone transfer
+TRANSFER_CHUNK_SIZE = 100
+
+#Seconds an idle TCP connection to the server is kept open
+TCP_IDLE_TIMEOUT = 10
+
+#Maximum number of idle TCP connections the resolver keeps open per nameserver
+TCP_POOL_SIZE = 2
+
+#Maximum size of a response sent over UDP, larger responses are truncated
+UDP_PAYLOAD_SIZE = 512
+
+#UDP payload size advertised with EDNS(0), small enough to avoid IP fragmentation
+EDNS_PAYLOAD_SIZE = 1232
+
+#Number of long-lived UDP sockets used for upstream queries
+UDP_POOL_SIZE = 4
+
+#Number of random source ports tried before letting the OS pick one
+UDP_BIND_ATTEMPTS = 10
+
+#Number of queries sent from a UDP socket before it is replaced by one on a new random port
+UDP_SOCKET_QUERIES = 64
+
+#Seconds a UDP receiver thread waits for a datagram before checking whether its socket was replaced
+UDP_POLL_INTERVAL = 1
+
+#Maximum number of nameservers a single query is sent to in parallel
+MAX_PARALLEL_QUERIES = 3
+
+#Round trip time in seconds assumed for a nameserver before any were measured
+INITIAL_RTT = 0.2
+
+#Retransmission timeout in seconds for a nameserver before any round trips were measured
+INITIAL_RTO = 1.0
+
+#Lower bound for the retransmission timeout of a nameserver
+MIN_RTO = 0.05
+
+#Maximum number of times the RTO of a failing nameserver is doubled
+MAX_RTO_DOUBLINGS = 3
+
+#Round trip time assumed when ordering nameservers we never heard from (as in Unbound)
+UNKNOWN_RTT = 0.376
+
+#Nameservers whose round trip times are within the same band are considered equally fast
+RTT_BAND = 0.05
+
+#Probability that a random other nameserver is asked first, so it gets measured
+EXPLORE_PROBABILITY = 0.05
+
+#Number of unanswered queries in a row before a nameserver is backed off
+BACKOFF_THRESHOLD = 3
+
+#Seconds a nameserver is backed off, doubled for every further failure
+BACKOFF_TIME = 10
+
+#Maximum number of seconds a nameserver is backed off
+MAX_BACKOFF_TIME = 900
+
+#Minimum seconds to wait for a nameserver before also asking the next one
+MIN_STAGGER_DELAY = 0.05
+
+#A cache entry is refreshed in the background when it is within this fraction of its ttl...
+PREFETCH_FRACTION = 0.1
+
+#...and has been looked up at least this many times
+PREFETCH_MIN_HITS = 3
+
+#Seconds that expired records are kept in the cache to be served stale (RFC 8767)
+STALE_WINDOW = 86400
+
+#Seconds a client waits for a fresh answer before it gets stale data instead
+STALE_ANSWER_TIMEOUT = 1.8
+
+#TTL of records that are served stale
+STALE_TTL = 30
+
+#Maximum length of a chain of CNAMEs that is followed
+MAX_CNAME_DEPTH = 8
+
+#Maximum number of queries sent to nameservers for one resolution, including those for the addresses of nameservers
+MAX_RESOLUTION_QUERIES = 50
+
+#Seconds after which a resolution is given up
+MAX_RESOLUTION_TIME = 10
+
+#Ask nameservers about one label more than the zone they serve instead of the whole name (RFC 9156)
+QNAME_MINIMISATION = True
+
+#Maximum number of minimised queries for one name, after that the whole name is asked (MAX_MINIMISE_COUNT of RFC 9156)
+MAX_MINIMISE_COUNT = 10
+
+#Load balancing policy used to pick an upstream resolver in forwarding mode
+FORWARD_POLICY = "round-robin"
+
+#Seconds between two health checks of the upstream resolvers
+HEALTH_CHECK_INTERVAL = 5
+
+#Number of resolutions a batch keeps in flight
+BATCH_CONCURRENCY = 64
+
+#TTL of the records of the fake authoritative servers used for benchmarks
+STUB_TTL = 3600
+
+#Number of times per second the same log message may be written...
+LOG_RATE = 10
+
+#...after a burst of this many
+LOG_BURST = 20
+
+#Number of log records that may wait for the writer thread, later ones are dropped
+LOG_QUEUE_SIZE = 10000
+
+#Share of the queries that is written to the query log
+QUERY_LOG_SAMPLE_RATE = 1.0
+
+#Seconds a profile started on a live server runs
+PROFILE_DURATION = 30
+
+#Seconds between two samples of the stacks of the threads
+PROFILE_INTERVAL = 0.005
+
+#Number of captured messages that may wait to be written, later ones are dropped
+CAPTURE_QUEUE_SIZE = 10000
+
+#Responses per second per client network and name when rate limiting is enabled...
+RRL_RATE = 20
+
+#...after a burst of this many
+RRL_BURST = 40
+
+#Every this many queries over the limit get a truncated response, the others are dropped
+RRL_SLIP = 2
+
+#Number of token buckets of the rate limiter
+RRL_TABLE_SIZE = 65536
+
+#Length of the prefixes that clients are grouped by for rate limiting
+RRL_IPV4_PREFIX = 24
+RRL_IPV6_PREFIX = 56
+
+#Number of labels at the end of a name that are rate limited together when the zone of the name isn't known
+RRL_DOMAIN_LABELS = 2
+
+#Maximum length of a label, and of a name in the wire format (section 2.3.4 of RFC 1035)
+MAX_LABEL_LENGTH = 63
+MAX_NAME_LENGTH = 255
+
+#Maximum number of compression pointers followed while reading a name, no valid name needs more than one per label
+MAX_POINTER_HOPS = 127
+
+#Number of parsed hostnames that are kept
+HOSTNAME_CACHE_SIZE = 4096
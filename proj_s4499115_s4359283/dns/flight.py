@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+""" Coalescing of concurrent identical calls
+
+When several threads ask for the same thing at the same time, only the first
+one does the work. The others wait for it and get the same result.
+"""
+
+import threading
+
+
+class Flight(object):
+    """ A call that is in progress """
+
+    def __init__(self):
+        """ Initialize the Flight """
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """ Lets concurrent callers with the same key share a single call """
+
+    def __init__(self):
+        """ Initialize the SingleFlight """
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, function, *args):
+        """ Call function, unless a call for key is already in progress
+
+        Args:
+            key: identifies calls that give the same result
+            function (callable): the function that does the work
+            args: the arguments for function
+
+        Returns:
+            the result of the call, shared by all callers with the same key
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+            else:
+                flight.waiters += 1
+
+        if leader:
+            try:
+                flight.result = function(*args)
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self.lock:
+                    del self.flights[key]
+                flight.done.set()
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
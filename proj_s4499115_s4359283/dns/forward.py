@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+""" Forwarding to upstream resolvers
+
+In forwarding mode the resolver doesn't iterate from the root servers itself,
+but sends its queries with recursion desired to a pool of upstream recursive
+resolvers. This module picks the upstream to ask according to a load
+balancing policy and keeps track of which upstreams are healthy.
+"""
+
+import threading
+import time
+
+import dns.consts as Consts
+
+
+class UpstreamPool(object):
+    """ The upstream resolvers that queries are forwarded to """
+
+    policies = ("round-robin", "least-outstanding", "lowest-latency")
+
+    def __init__(self, upstreams, policy, infra):
+        """ Initialize the pool
+
+        Args:
+            upstreams ([str]): IP addresses of the upstream resolvers
+            policy (str): one of policies, decides which upstream is asked first
+            infra (InfraCache): round trip times and failures of the upstreams
+        """
+        if policy not in self.policies:
+            raise ValueError("Unknown load balancing policy: " + str(policy))
+        self.upstreams = list(upstreams)
+        self.policy = policy
+        self.infra = infra
+        self.outstanding = {upstream: 0 for upstream in self.upstreams}#Queries sent that weren't answered yet
+        self.healthy = set(self.upstreams)
+        self.next = 0#Position of the round robin
+        self.lock = threading.Lock()
+
+    def is_healthy(self, upstream):
+        """ Check if an upstream passed its last health check and isn't backed off """
+        info = self.infra.get(upstream)
+        return upstream in self.healthy and (info is None or info.backoff_until <= time.time())
+
+    def order(self):
+        """ Order the upstreams in which a query is to be sent to them
+
+        Healthy upstreams come first, in the order of the policy. Unhealthy
+        ones come last, so they are only asked when all others fail.
+
+        Returns:
+            upstreams ([str]): IP addresses of the upstreams, most preferred first
+        """
+        healthy = [upstream for upstream in self.upstreams if self.is_healthy(upstream)]
+        unhealthy = [upstream for upstream in self.upstreams if upstream not in healthy]
+
+        with self.lock:
+            if healthy:#Rotate, so ties are broken differently every time
+                start = self.next % len(healthy)
+                healthy = healthy[start:] + healthy[:start]
+            self.next += 1
+            if self.policy == "least-outstanding":
+                healthy.sort(key=lambda upstream: self.outstanding[upstream])
+        if self.policy == "lowest-latency":
+            healthy = self.infra.order(healthy)
+        return healthy + unhealthy
+
+    def sent(self, upstream):
+        """ Note that a query was sent to an upstream """
+        with self.lock:
+            self.outstanding[upstream] += 1
+
+    def finished(self, upstreams):
+        """ Note that the queries sent to upstreams are answered or given up on """
+        with self.lock:
+            for upstream in upstreams:
+                self.outstanding[upstream] -= 1
+
+    def mark(self, upstream, healthy):
+        """ Record the result of a health check of an upstream """
+        with self.lock:
+            if healthy:
+                self.healthy.add(upstream)
+            else:
+                self.healthy.discard(upstream)
+
+
+class HealthChecker(threading.Thread):
+    """ Periodically checks if the upstreams of a pool are working """
+
+    def __init__(self, pool, probe, interval=Consts.HEALTH_CHECK_INTERVAL):
+        """ Initialize the checker thread
+
+        Args:
+            pool (UpstreamPool): the pool whose upstreams are checked
+            probe (callable): takes the IP address of an upstream, returns True if it works
+            interval (float): seconds between two rounds of checks
+        """
+        super(HealthChecker, self).__init__()
+        self.daemon = True
+        self.pool = pool
+        self.probe = probe
+        self.interval = interval
+
+    def run(self):
+        """ Run the checker thread """
+        while True:
+            for upstream in self.pool.upstreams:
+                self.pool.mark(upstream, self.probe(upstream))
+            time.sleep(self.interval)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+""" Infrastructure cache
+
+This module keeps track of how fast and how reliable upstream nameservers are,
+like the infrastructure cache of BIND and Unbound. Round trip times are
+smoothed as described in RFC 6298, which also gives the retransmission
+timeout (RTO) that is used when querying a server.
+"""
+
+import random
+import threading
+import time
+
+import dns.consts as Consts
+
+
+class ServerInfo(object):
+    """ What we know about a single nameserver """
+
+    def __init__(self):
+        """ Initialize the ServerInfo """
+        self.srtt = None
+        self.rttvar = None
+        self.failures = 0#Queries in a row that went unanswered
+        self.backoff_until = 0.0#Epoch time until which the server is avoided
+
+
+class InfraCache(object):
+    """ Round trip times and failures of nameservers """
+
+    def __init__(self, timeout):
+        """ Initialize the InfraCache
+
+        Args:
+            timeout (float): upper bound for the RTO of a server
+        """
+        self.timeout = timeout
+        self.servers = {}
+        self.lock = threading.Lock()
+
+    def get(self, server):
+        """ Get the info of a server, None if we never heard from it """
+        return self.servers.get(server)
+
+    def rto(self, server):
+        """ Time to wait for a response from a server before giving up on it
+
+        Args:
+            server (str): IP address of the server
+
+        Returns:
+            rto (float): timeout in seconds, doubled for every failure in a row
+        """
+        info = self.servers.get(server)
+        if info is None or info.srtt is None:
+            rto = Consts.INITIAL_RTO
+        else:
+            rto = info.srtt + 4 * info.rttvar
+        if info is not None:
+            rto *= 2 ** min(info.failures, Consts.MAX_RTO_DOUBLINGS)
+        return min(max(rto, Consts.MIN_RTO), self.timeout)
+
+    def stagger_delay(self, server):
+        """ Time to wait for a server before also asking the next one """
+        info = self.servers.get(server)
+        if info is None or info.srtt is None:
+            delay = 2 * Consts.INITIAL_RTT
+        else:
+            delay = 2 * info.srtt
+        return min(max(delay, Consts.MIN_STAGGER_DELAY), self.rto(server))
+
+    def record_rtt(self, server, rtt):
+        """ Update the smoothed round trip time of a server that answered
+
+        See section 2 of RFC 6298.
+
+        Args:
+            server (str): IP address of the server
+            rtt (float): measured round trip time in seconds
+        """
+        with self.lock:
+            info = self.servers.setdefault(server, ServerInfo())
+            if info.srtt is None:
+                info.srtt = rtt
+                info.rttvar = rtt / 2
+            else:
+                info.rttvar = 0.75 * info.rttvar + 0.25 * abs(info.srtt - rtt)
+                info.srtt = 0.875 * info.srtt + 0.125 * rtt
+            info.failures = 0
+            info.backoff_until = 0.0
+
+    def record_failure(self, server):
+        """ Note that a server didn't answer, backing it off if it keeps failing
+
+        Args:
+            server (str): IP address of the server
+        """
+        with self.lock:
+            info = self.servers.setdefault(server, ServerInfo())
+            info.failures += 1
+            if info.failures >= Consts.BACKOFF_THRESHOLD:
+                backoff = Consts.BACKOFF_TIME * 2 ** (info.failures - Consts.BACKOFF_THRESHOLD)
+                info.backoff_until = time.time() + min(backoff, Consts.MAX_BACKOFF_TIME)
+
+    def order(self, servers):
+        """ Sort servers so that the fastest ones are asked first
+
+        Servers whose smoothed round trip times are in the same band are
+        shuffled, servers we know nothing about are assumed to be moderately
+        slow and servers that are backed off come last. Once in a while a
+        random other server is put in front, so slower and unknown servers
+        still get measured.
+
+        Args:
+            servers ([str]): IP addresses of the servers
+
+        Returns:
+            servers ([str]): the same servers, most preferred first
+        """
+        now = time.time()
+
+        def key(server):
+            info = self.servers.get(server)
+            if info is None:
+                return (False, int(Consts.UNKNOWN_RTT / Consts.RTT_BAND))
+            srtt = info.srtt if info.srtt is not None else Consts.UNKNOWN_RTT
+            return (info.backoff_until > now, int(srtt / Consts.RTT_BAND))
+
+        servers = list(servers)
+        random.shuffle(servers)
+        servers.sort(key=key)
+        if len(servers) > 1 and random.random() < Consts.EXPLORE_PROBABILITY:
+            servers.insert(0, servers.pop(random.randrange(1, len(servers))))
+        return servers
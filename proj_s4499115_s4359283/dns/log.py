@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+""" Logging
+
+The server logs through the standard logging module, but its handlers never
+write on the thread that logs. Records are put on a bounded queue and written
+by a background thread (LogPipeline), so a slow terminal or disk can't hold up
+the handling of queries. When the queue is full, records are dropped instead
+of waiting.
+
+Every message (by its format string) may be logged a limited number of times
+per second, so an error that happens for every query can't flood the log.
+Besides the messages, a sample of the answered queries can be logged as JSON
+lines (QueryLog).
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+
+import dns.consts as Consts
+import dns.metrics
+
+logger = logging.getLogger("dns")
+query_logger = logging.getLogger("dns.queries")
+query_logger.propagate = False
+slow_logger = logging.getLogger("dns.slow")
+
+dropped = dns.metrics.registry.counter("dns_log_dropped_total", "Log records that were not written", ["reason"])
+
+
+class RateLimitFilter(logging.Filter):
+    """ Lets every message through at most rate times per second, with bursts of burst """
+
+    def __init__(self, rate=Consts.LOG_RATE, burst=Consts.LOG_BURST):
+        """ Initialize the filter
+
+        Args:
+            rate (float): number of times per second a message may be logged
+            burst (int): number of times a message may be logged in a row
+        """
+        super(RateLimitFilter, self).__init__()
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}#Format string of a message to its tokens, the time they were counted and the number suppressed
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        """ Check if a record may be logged, and mention the suppressed ones when it may """
+        now = time.monotonic()
+        with self.lock:
+            tokens, last, suppressed = self.buckets.get(record.msg, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.buckets[record.msg] = (tokens, now, suppressed + 1)
+                dropped.labels("ratelimit").inc()
+                return False
+            self.buckets[record.msg] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """ A queue handler that drops records when the queue is full """
+
+    def enqueue(self, record):
+        """ Put a record on the queue without waiting """
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped.labels("queue").inc()
+
+
+class PrefixFormatter(logging.Formatter):
+    """ Formats records like the server always printed them: "[+] - message" """
+
+    prefixes = {logging.DEBUG : "[*]", logging.INFO : "[+]", logging.WARNING : "[-]",
+                logging.ERROR : "[-]", logging.CRITICAL : "[-]"}
+
+    def format(self, record):
+        """ Format a record with the prefix of its level """
+        line = self.prefixes.get(record.levelno, "[?]") + " - " + super(PrefixFormatter, self).format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            line += " (" + str(suppressed) + " similar messages suppressed)"
+        return line
+
+
+class QueryLog(object):
+    """ Logs a random sample of the answered queries as JSON lines """
+
+    def __init__(self, sample_rate=0.0):
+        """ Initialize the query log
+
+        Args:
+            sample_rate (float): share of the queries that is logged, 0 disables the log
+        """
+        self.sample_rate = sample_rate
+        self.random = random.Random()
+
+    def log(self, client, question, rcode, elapsed, transport):
+        """ Log a query, if it is part of the sample
+
+        Args:
+            client ((str, int)): address of the client
+            question (Question): the question that was asked, None if there was none
+            rcode (RCode): rcode of the response
+            elapsed (float): seconds between receiving the query and sending the response
+            transport (str): "udp" or "tcp"
+        """
+        if self.sample_rate <= 0 or self.random.random() >= self.sample_rate:
+            return
+        entry = {"time" : round(time.time(), 3), "client" : client[0] if client else None, "transport" : transport,
+                 "qname" : None, "qtype" : None, "rcode" : str(rcode), "ms" : round(elapsed * 1000, 3)}
+        if question is not None:
+            entry["qname"], entry["qtype"] = str(question.qname), str(question.qtype)
+        query_logger.info(json.dumps(entry, separators=(",", ":")))
+
+
+class LogPipeline(object):
+    """ Writes the log records of the server on a background thread """
+
+    def __init__(self, level=logging.INFO, stream=None, query_log=None, sample_rate=Consts.QUERY_LOG_SAMPLE_RATE,
+            rate=Consts.LOG_RATE, burst=Consts.LOG_BURST, queue_size=Consts.LOG_QUEUE_SIZE, slow_log=None):
+        """ Initialize the pipeline
+
+        Args:
+            level (int): lowest level that is logged
+            stream (file): where messages are written, stdout by default
+            query_log (str): file the sampled queries are appended to, None to not log queries
+            sample_rate (float): share of the queries that is logged
+            rate (float): number of times per second a message may be logged
+            burst (int): number of times a message may be logged in a row
+            queue_size (int): number of records that may wait to be written
+            slow_log (str): file the traces of slow queries are appended to, None to log them with the other messages
+        """
+        self.level = level
+        self.queue = queue.Queue(queue_size)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.handler.addFilter(RateLimitFilter(rate, burst))
+        output = logging.StreamHandler(stream if stream is not None else sys.stdout)
+        output.setFormatter(PrefixFormatter())
+        self.listeners = [logging.handlers.QueueListener(self.queue, output)]
+
+        self.query_handler = self.add_file(query_log, queue_size)
+        self.sample_rate = sample_rate
+        self.slow_handler = self.add_file(slow_log, queue_size)
+
+    def add_file(self, path, queue_size):
+        """ Add a writer thread that appends the messages of a logger to a file
+
+        Returns:
+            handler (NonBlockingQueueHandler): handler that passes records to the writer, None if path is None
+        """
+        if path is None:
+            return None
+        records = queue.Queue(queue_size)
+        writer = logging.FileHandler(path)
+        writer.setFormatter(logging.Formatter("%(message)s"))
+        self.listeners.append(logging.handlers.QueueListener(records, writer))
+        return NonBlockingQueueHandler(records)
+
+    def start(self):
+        """ Start the writer threads and send the logs of the server through them """
+        for listener in self.listeners:
+            listener.start()
+        logger.addHandler(self.handler)
+        logger.setLevel(self.level)
+        if self.query_handler is not None:
+            query_logger.addHandler(self.query_handler)
+            query_logger.setLevel(logging.INFO)
+            queries.sample_rate = self.sample_rate
+        if self.slow_handler is not None:
+            slow_logger.addHandler(self.slow_handler)
+            slow_logger.propagate = False
+
+    def stop(self):
+        """ Write the records that are still queued and stop the writer threads """
+        logger.removeHandler(self.handler)
+        if self.query_handler is not None:
+            queries.sample_rate = 0.0
+            query_logger.removeHandler(self.query_handler)
+        if self.slow_handler is not None:
+            slow_logger.removeHandler(self.slow_handler)
+            slow_logger.propagate = True
+        for listener in self.listeners:
+            listener.stop()
+
+
+#The query log of the server, disabled until a pipeline with a query log is started
+queries = QueryLog()
@@ -9,10 +9,11 @@ question fields. See section 4 of RFC 1035 for more info.
 
 import struct
 
-from dns.classes import Class
+from dns.classes import Class, class_from_code
+import dns.consts as Consts
 from dns.name import Name
-from dns.resource import ResourceRecord
-from dns.rtypes import Type
+from dns.resource import ResourceRecord, OPTRecordData
+from dns.rtypes import Type, type_from_code
 
 
 class Message:
@@ -60,6 +61,41 @@ class Message:
         """Getter for all resource records."""
         return self.answers + self.authorities + self.additionals
 
+    @property
+    def edns(self):
+        """Getter for the OPT pseudo record, None if there is none."""
+        for additional in self.additionals:
+            if additional.type_ == Type.OPT:
+                return additional
+        return None
+
+    @property
+    def payload_size(self):
+        """Getter for the largest UDP message the sender can receive.
+
+        See section 6.2.3 of RFC 6891.
+        """
+        edns = self.edns
+        if edns is None:
+            return Consts.UDP_PAYLOAD_SIZE
+        return max(edns.class_, Consts.UDP_PAYLOAD_SIZE)
+
+    def add_edns(self, payload_size):
+        """Add an OPT pseudo record to the additional section.
+
+        Args:
+            payload_size (int): the largest UDP message we can receive.
+        """
+        self.additionals.append(ResourceRecord(Name(""), Type.OPT, payload_size,
+                                               0, OPTRecordData()))
+        self.header.ar_count += 1
+
+    def remove_edns(self):
+        """Remove the OPT pseudo record from the additional section."""
+        additionals = [a for a in self.additionals if a.type_ != Type.OPT]
+        self.header.ar_count -= len(self.additionals) - len(additionals)
+        self.additionals = additionals
+
     def to_bytes(self):
         """Convert Message to bytes."""
         compress = {}
@@ -301,6 +337,5 @@ class Question:
     def from_bytes(cls, packet, offset):
         """Convert Question from bytes."""
         qname, offset = Name.from_bytes(packet, offset)
-        qtype = Type(struct.unpack_from("!H", packet, offset)[0])
-        qclass = Class(struct.unpack_from("!H", packet, offset + 2)[0])
-        return cls(qname, qtype, qclass), offset + 4
+        qtype, qclass = struct.unpack_from("!HH", packet, offset)
+        return cls(qname, type_from_code(qtype), class_from_code(qclass)), offset + 4
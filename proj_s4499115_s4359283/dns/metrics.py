@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+""" Metrics
+
+Counters, gauges and latency histograms of the server and resolver. They can
+be read with Registry.snapshot, or scraped in the Prometheus text format from
+a small HTTP listener on localhost (Registry.serve).
+
+Histograms work like HdrHistogram: values are counted in microseconds, in
+buckets whose width grows with powers of two. Every power of two is split in
+linear sub-buckets, so recording is a few integer operations and percentiles
+are off by at most 1/SUB_BUCKETS.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+
+class Counter(object):
+    """ A value that only goes up """
+
+    def __init__(self):
+        """ Initialize the Counter """
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        """ Add amount to the counter """
+        with self.lock:
+            self.value += amount
+
+    def snapshot(self):
+        """ The current value """
+        return self.value
+
+
+class Gauge(object):
+    """ A value that goes up and down, or is read from a function """
+
+    def __init__(self, function=None):
+        """ Initialize the Gauge
+
+        Args:
+            function (callable): gives the value when the gauge is read
+        """
+        self.value = 0
+        self.function = function
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        """ Add amount to the gauge """
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        """ Subtract amount from the gauge """
+        with self.lock:
+            self.value -= amount
+
+    def snapshot(self):
+        """ The current value """
+        return self.function() if self.function is not None else self.value
+
+
+class Histogram(object):
+    """ Distribution of latencies, in buckets of logarithmic width """
+
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    HALF = SUB_BUCKETS // 2
+    MAX_MICROS = (1 << 36) - 1#About 19 hours, larger values are counted as this
+    PROMETHEUS_BITS = 26#Largest bucket that is exported is about a minute
+
+    def __init__(self):
+        """ Initialize the Histogram """
+        self.counts = [0] * self.index(self.MAX_MICROS) + [0]
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def index(cls, micros):
+        """ Bucket of a value in microseconds """
+        if micros < cls.SUB_BUCKETS:
+            return micros
+        shift = micros.bit_length() - cls.SUB_BUCKET_BITS
+        return cls.SUB_BUCKETS + (shift - 1) * cls.HALF + (micros >> shift) - cls.HALF
+
+    @classmethod
+    def bounds(cls, index):
+        """ Lowest and highest+1 value in microseconds of a bucket """
+        if index < cls.SUB_BUCKETS:
+            return index, index + 1
+        shift = (index - cls.SUB_BUCKETS) // cls.HALF + 1
+        sub = (index - cls.SUB_BUCKETS) % cls.HALF + cls.HALF
+        return sub << shift, (sub + 1) << shift
+
+    def observe(self, seconds):
+        """ Record a value in seconds """
+        micros = min(max(int(seconds * 1e6), 0), self.MAX_MICROS)
+        index = self.index(micros)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def percentile(self, fraction):
+        """ The value in seconds below which fraction of the recorded values lie """
+        with self.lock:
+            counts = list(self.counts)
+            count = self.count
+        if count == 0:
+            return 0.0
+        rank = max(fraction * count, 1)
+        seen = 0
+        for index, bucket in enumerate(counts):
+            seen += bucket
+            if seen >= rank:
+                low, high = self.bounds(index)
+                return (low + high - 1) / 2 / 1e6
+        return self.MAX_MICROS / 1e6
+
+    def cumulative(self):
+        """ Number of values up to each power of two of microseconds, for Prometheus
+
+        Returns:
+            buckets ([(float, int)]): upper bound in seconds and the number of values up to it
+        """
+        with self.lock:
+            counts = list(self.counts)
+        buckets = []
+        seen = 0
+        index = 0
+        for bits in range(self.PROMETHEUS_BITS + 1):
+            limit = 1 << bits
+            while index < len(counts) and self.bounds(index)[1] <= limit:#Buckets never straddle a power of two
+                seen += counts[index]
+                index += 1
+            buckets.append((limit / 1e6, seen))
+        return buckets
+
+    def snapshot(self):
+        """ Number and sum of the values, and their percentiles in seconds """
+        return {"count" : self.count, "sum" : self.sum,
+                "p50" : self.percentile(0.5), "p90" : self.percentile(0.9),
+                "p99" : self.percentile(0.99), "p999" : self.percentile(0.999)}
+
+
+class Family(object):
+    """ A metric with a child per combination of label values """
+
+    def __init__(self, name, help_, type_, labelnames, factory):
+        """ Initialize the Family
+
+        Args:
+            name (str): name of the metric
+            help_ (str): description of the metric
+            type_ (str): "counter", "gauge" or "histogram"
+            labelnames ([str]): names of the labels
+            factory (callable): makes the metric of a child
+        """
+        self.name = name
+        self.help = help_
+        self.type = type_
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:#Show up in snapshots before first use
+            self.labels()
+
+    def labels(self, *values):
+        """ The metric for these label values, created on first use """
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.factory())
+        return child
+
+    def label_text(self, values, extra=()):
+        """ Labels in the Prometheus text format """
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(name, str(value).replace('"', '\\"')) for name, value in pairs) + "}"
+
+    def __getattr__(self, attribute):
+        """ Metrics without labels can be used directly """
+        if attribute in ("inc", "dec", "observe", "percentile", "snapshot"):
+            return getattr(self.labels(), attribute)
+        raise AttributeError(attribute)
+
+
+class Registry(object):
+    """ All metrics of the process """
+
+    def __init__(self):
+        """ Initialize the Registry """
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, help_, type_, labelnames, factory):
+        """ Get the metric called name, adding it if it doesn't exist yet """
+        with self.lock:
+            if name not in self.families:
+                self.families[name] = Family(name, help_, type_, labelnames, factory)
+            return self.families[name]
+
+    def counter(self, name, help_, labelnames=()):
+        """ Get or add a counter """
+        return self.add(name, help_, "counter", labelnames, Counter)
+
+    def gauge(self, name, help_, labelnames=(), function=None):
+        """ Get or add a gauge, its value is read from function if given """
+        return self.add(name, help_, "gauge", labelnames, lambda: Gauge(function))
+
+    def histogram(self, name, help_, labelnames=()):
+        """ Get or add a latency histogram """
+        return self.add(name, help_, "histogram", labelnames, Histogram)
+
+    def snapshot(self):
+        """ The current value of all metrics
+
+        Returns:
+            snapshot ({str: {str: value}}): name of a metric to its label values
+                (joined by commas) to its value, histograms give a dict with
+                count, sum and percentiles in seconds
+        """
+        return {family.name : {",".join(str(value) for value in values) : child.snapshot()
+                               for values, child in list(family.children.items())}
+                for family in list(self.families.values())}
+
+    def to_prometheus(self):
+        """ All metrics in the Prometheus text exposition format """
+        lines = []
+        for family in list(self.families.values()):
+            lines.append("# HELP {} {}".format(family.name, family.help))
+            lines.append("# TYPE {} {}".format(family.name, family.type))
+            for values, child in list(family.children.items()):
+                if family.type != "histogram":
+                    lines.append("{}{} {}".format(family.name, family.label_text(values), child.snapshot()))
+                    continue
+                buckets = child.cumulative()
+                for bound, count in buckets:
+                    lines.append("{}_bucket{} {}".format(family.name, family.label_text(values, [("le", repr(bound))]), count))
+                lines.append("{}_bucket{} {}".format(family.name, family.label_text(values, [("le", "+Inf")]), child.count))
+                lines.append("{}_sum{} {}".format(family.name, family.label_text(values), child.sum))
+                lines.append("{}_count{} {}".format(family.name, family.label_text(values), child.count))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """ Serve the metrics over HTTP in a background thread
+
+        Args:
+            port (int): port to listen on, 0 for any free port
+            host (str): address to listen on, localhost by default
+
+        Returns:
+            httpd (ThreadingHTTPServer): the listener, call shutdown() to stop it
+        """
+        httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+        httpd.daemon_threads = True
+        httpd.registry = self
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        return httpd
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """ Answers scrapes of the metrics """
+
+    def do_GET(self):
+        """ Send the metrics in the Prometheus text format """
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.to_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """ Don't write a line to stderr for every scrape """
+        pass
+
+
+registry = Registry()
+
+#Metrics of the server and resolver
+queries = registry.counter("dns_queries_total", "Queries received by the server", ["transport"])
+responses = registry.counter("dns_responses_total", "Responses sent by the server", ["rcode"])
+in_flight = registry.gauge("dns_queries_in_flight", "Queries that are being handled")
+threads = registry.gauge("dns_threads", "Threads in the process", function=threading.active_count)
+stages = registry.histogram("dns_stage_seconds", "Time spent in each stage of handling a query", ["stage"])
+upstream_rtt = registry.histogram("dns_upstream_rtt_seconds", "Round trip time of queries to upstream servers", ["server"])
+upstream_timeouts = registry.counter("dns_upstream_timeouts_total", "Queries to upstream servers that got no answer in time", ["server"])
+cache_lookups = registry.counter("dns_cache_lookups_total", "Lookups of responses and RRsets in the cache", ["kind", "result"])
+cache_evictions = registry.counter("dns_cache_evictions_total", "Records removed from the cache because they expired")
+
+parse_time = stages.labels("parse")
+zone_time = stages.labels("zone_lookup")
+cache_time = stages.labels("cache_lookup")
+resolve_time = stages.labels("resolve")
+serialize_time = stages.labels("serialize")
+send_time = stages.labels("send")
+response_hits = cache_lookups.labels("response", "hit")
+response_misses = cache_lookups.labels("response", "miss")
+rrset_hits = cache_lookups.labels("rrset", "hit")
+rrset_misses = cache_lookups.labels("rrset", "miss")
+stale_hits = cache_lookups.labels("stale", "hit")
+stale_misses = cache_lookups.labels("stale", "miss")
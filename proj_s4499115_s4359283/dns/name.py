@@ -1,9 +1,21 @@
 #!/usr/bin/env python3
 
-"""Domain names."""
+"""Domain names.
 
+Hostnames given by users are checked and turned into Names by parse_hostname.
+It looks at every character once, so long or malicious names can't make it
+slow like a backtracking regex can, and it remembers the names it parsed.
+"""
+
+import functools
 import struct
 
+import dns.consts as Consts
+import dns.log
+
+#Characters that may be in a label of a hostname
+HOSTNAME_CHARACTERS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-")
+
 
 class Name:
     """A domain name."""
@@ -15,14 +27,12 @@ class Name:
             hostname (str/[str]): either a domain name or a list of labels
         """
         if isinstance(hostname, str):
-            self.labels = hostname.split(".")
-            if not self.labels[-1]:
-                del self.labels[-1]
+            hostname = hostname.rstrip(".")#The root is written as "."
+            self.labels = hostname.split(".") if hostname else []
         elif isinstance(hostname, list):
             self.labels = hostname
         else:
-            print(type(hostname))
-            print("It went wrong with this hostname",hostname)
+            dns.log.logger.warning("Can't make a name of %r (%s)", hostname, type(hostname).__name__)
             raise TypeError
 
     def __eq__(self, other):
@@ -32,6 +42,9 @@ class Name:
         else:
             return False
 
+    def __hash__(self):
+        return hash(tuple(label.lower() for label in self.labels))
+
     def __str__(self):
         result = ""
         for label in self.labels:
@@ -83,7 +96,35 @@ class Name:
                 if hops == 0:
                     next_offset = offset + 2
                 hops += 1
+                if hops > Consts.MAX_POINTER_HOPS:#Pointers that loop would never end the name
+                    raise ValueError("too many compression pointers")
                 offset = pointer
             else:
                 raise ValueError
         return cls(labels), next_offset
+
+
+@functools.lru_cache(maxsize=Consts.HOSTNAME_CACHE_SIZE)
+def parse_hostname(hostname):
+    """ Check a hostname and turn it into a Name
+
+    A hostname is valid if its labels consist of letters, digits and hyphens,
+    don't start or end with a hyphen, and fit in the limits of the wire format.
+    The same Name is returned for the same hostname, so it must not be changed.
+
+    Args:
+        hostname (str): the hostname, with or without the trailing dot
+
+    Returns:
+        name (Name): the hostname as a Name, None if it isn't valid
+    """
+    if hostname.endswith("."):
+        hostname = hostname[:-1]
+    if not hostname or len(hostname) + 2 > Consts.MAX_NAME_LENGTH:#A length byte for the first label and the root label
+        return None
+    labels = hostname.split(".")
+    for label in labels:
+        if (not label or len(label) > Consts.MAX_LABEL_LENGTH or label[0] == "-" or label[-1] == "-" or
+                not HOSTNAME_CHARACTERS.issuperset(label)):
+            return None
+    return Name(labels)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+""" Response rate limiting
+
+Limits the number of responses per second that are sent to a network
+(a /24 for IPv4, a /56 for IPv6) for the same domain, like the RRL of BIND.
+This makes the server useless as an amplifier in reflection attacks and
+keeps a single client from taking all the capacity, while other clients
+and other domains are not affected. The domain of a query is the zone its
+name is in, looked up with the function the server gives (its own zones and
+the zone cuts in the cache), and otherwise the last RRL_DOMAIN_LABELS labels
+of the name. So a flood of random names below one zone (random subdomain
+attacks) shares a single bucket, however many random labels the names have,
+instead of getting a new one for every query.
+
+The limiter is checked in the receive loop, before a handler thread is
+started, so a flood costs no more than parsing the queries. Per network and
+domain it keeps a token bucket. The buckets live in a fixed-size table indexed
+by the hash of the key: a new key simply takes over the slot, so the memory
+use doesn't grow with the number of clients. Every slip-th query over the
+limit is answered with an empty truncated response instead of being dropped,
+so real clients whose address is spoofed can still get an answer over TCP.
+"""
+
+import socket
+import time
+
+import dns.consts as Consts
+import dns.metrics
+
+#What to do with a query
+ALLOW = 0
+DROP = 1
+SLIP = 2
+
+limited = dns.metrics.registry.counter("dns_rrl_limited_total", "Queries over the response rate limit", ["action"])
+
+
+class ResponseRateLimiter(object):
+    """ Token buckets per client network and domain, in a fixed-size table
+
+    The limiter isn't thread safe, it is meant to be used by the receive loop only.
+    """
+
+    def __init__(self, rate=Consts.RRL_RATE, burst=Consts.RRL_BURST, slip=Consts.RRL_SLIP, size=Consts.RRL_TABLE_SIZE,
+            zones=None):
+        """ Initialize the limiter
+
+        Args:
+            rate (float): responses per second per network and domain
+            burst (int): responses that may be sent in a row before the rate applies
+            slip (int): every slip-th limited query gets a truncated response, 0 to drop them all
+            size (int): number of buckets in the table
+            zones (callable): gives the zone a lower case name is in, or None if it isn't known
+        """
+        self.rate = rate
+        self.zones = zones
+        self.burst = burst
+        self.slip = slip
+        self.size = size
+        self.keys = [None] * size
+        self.tokens = [0.0] * size
+        self.stamps = [0.0] * size
+        self.limited = [0] * size#Queries over the limit since the bucket last allowed one
+
+    @staticmethod
+    def network(ip):
+        """ The network a client address belongs to, as the prefix length of the rate limit """
+        if ":" in ip:
+            return socket.inet_pton(socket.AF_INET6, ip)[:Consts.RRL_IPV6_PREFIX // 8]
+        return int.from_bytes(socket.inet_aton(ip), "big") >> (32 - Consts.RRL_IPV4_PREFIX)
+
+    def domain(self, qname):
+        """ The domain a query is limited by: the zone of the name, or its last RRL_DOMAIN_LABELS labels if that isn't known """
+        zone = self.zones(qname) if self.zones is not None else None
+        if zone is not None:
+            return zone
+        labels = qname.rstrip(".").split(".")[-Consts.RRL_DOMAIN_LABELS:]
+        return ".".join(labels) + "." if qname.rstrip(".") else "."
+
+    def check(self, ip, qname):
+        """ Decide what to do with a query
+
+        Args:
+            ip (str): IP address of the client
+            qname (str): the name that is asked, lower case
+
+        Returns:
+            action (int): ALLOW, DROP or SLIP
+        """
+        key = (self.network(ip), self.domain(qname))
+        index = hash(key) % self.size
+        now = time.monotonic()
+        if self.keys[index] != key:#A new key, or another one took the slot over
+            self.keys[index] = key
+            self.tokens[index] = self.burst
+            self.stamps[index] = now
+            self.limited[index] = 0
+
+        tokens = min(self.burst, self.tokens[index] + (now - self.stamps[index]) * self.rate)
+        self.stamps[index] = now
+        if tokens >= 1:
+            self.tokens[index] = tokens - 1
+            self.limited[index] = 0
+            return ALLOW
+
+        self.tokens[index] = tokens
+        self.limited[index] += 1
+        if self.slip and self.limited[index] % self.slip == 0:
+            limited.labels("slipped").inc()
+            return SLIP
+        limited.labels("dropped").inc()
+        return DROP
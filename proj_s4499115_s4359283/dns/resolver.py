@@ -7,9 +7,14 @@ things in this module. This resolver will be both used by the DNS client and the
 DNS server, but with a different list of servers.
 """
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import collections
+import itertools
+import queue
 import socket
-from random import randint
-import re
+import struct
+from random import SystemRandom
+from threading import Event, Thread
 import time
 
 from dns.classes import Class
@@ -17,31 +22,201 @@ from dns.rtypes import Type
 from dns.cache import RecordCache
 import dns.cache
 from dns.message import Message, Question, Header
+from dns.resource import ResourceRecord, SOARecordData
 import dns.rcodes
 import dns.consts
-from dns.name import Name
+import dns.flight
+import dns.forward
+import dns.infra
+import dns.log
+import dns.metrics
+import dns.tcp
+import dns.trace
+import dns.udp
+from dns.name import Name, parse_hostname
+
+#Transaction IDs are picked with the OS's random source, so they can't be predicted from earlier ones
+randint = SystemRandom().randint
+
+exhausted_budgets = dns.metrics.registry.counter("dns_resolution_budget_exhausted_total",
+        "Resolutions that were given up because a budget was used up", ["budget"])
+rejected_referrals = dns.metrics.registry.counter("dns_referrals_rejected_total",
+        "Referrals that were ignored because the servers that sent them don't serve the zone they refer to")
+
+
+class Budget(object):
+    """ Limits on the work of one resolution """
+
+    def __init__(self, queries=dns.consts.MAX_RESOLUTION_QUERIES, seconds=dns.consts.MAX_RESOLUTION_TIME):
+        """ Initialize the budget
+
+        Args:
+            queries (int): number of queries that may be sent to nameservers
+            seconds (float): seconds the resolution may take
+        """
+        self.queries = queries
+        self.deadline = time.monotonic() + seconds
+
+    def take(self):
+        """ Use up a query, returns False if there was none left """
+        if self.queries <= 0:
+            return False
+        self.queries -= 1
+        return True
+
+    def exhausted(self):
+        """ The budget that is used up, "queries" or "time", None if there is some of both left """
+        if self.queries <= 0:
+            return "queries"
+        if time.monotonic() >= self.deadline:
+            return "time"
+        return None
+
+
+def labels_of(name):
+    """ The lower case labels of a domain name, none for the root """
+    name = str(name).rstrip('.').lower()
+    return name.split('.') if name else []
+
+
+def canonical(name):
+    """ A domain name in lower case with a trailing dot """
+    return ".".join(labels_of(name)) + "."
+
+
+def is_subdomain(labels, zone):
+    """ Check if a name is zone or a name below it, both given as labels_of them """
+    return len(labels) >= len(zone) and labels[len(labels) - len(zone):] == zone
+
+
+class Step(object):
+    """ A question that an iterative resolution works on """
+
+    #What the result of a step is for, besides the question itself
+    CNAME = "cname"
+    NAMESERVER = "nameserver"
+
+    def __init__(self, qname, qtype, qclass, hints, refresh, depth=0, kind=None, span=dns.trace.NULL_SPAN,
+            zone=".", minimise=False):
+        """ Initialize the step
+
+        Args:
+            qname (str/Name): the FQDN that we want to resolve, a Name is put in the question as it is
+            qtype (Type): type of the records we want
+            qclass (Class): class of the records we want
+            hints ([str]): addresses of the nameservers to ask first, the servers of zone
+            refresh (bool): ask the nameservers even if the answer is in the cache
+            depth (int): number of CNAMEs followed to get here
+            kind (str): CNAME for the target of an alias of the step below, NAMESERVER for the address of one of its nameservers
+            span: context manager of the trace span of the step, it is entered here
+            zone (str): the zone that the hints serve
+            minimise (bool): ask the hints only about the next label below their zone (RFC 9156)
+        """
+        self.question = Question(qname if isinstance(qname, Name) else Name(qname), qtype, qclass)
+        self.qname = str(qname).rstrip('.') + '.'
+        self.qtype = qtype
+        self.qclass = qclass
+        self.refresh = refresh
+        self.depth = depth
+        self.kind = kind
+        self.span = span
+        span.__enter__()
+        self.started = False
+        self.hints = collections.deque()#Addresses that are still to be asked
+        self.visited = set()#Addresses that were asked or are still to be asked
+        self.zones = {}#Address of a hint to the zone it serves
+        self.add_hints(hints, zone)
+        self.nameservers = set()#Lower case names of the nameservers we were referred to
+        self.glueless = collections.deque()#Names of nameservers without an address and their zone, to resolve when the hints run out
+        self.serves = None#For a NAMESERVER step, the zone of the nameserver whose address it looks for
+        self.aliases = []#The CNAMEs leading to the step on top of this one
+        self.labels = [label.lower() for label in self.question.qname.labels]
+        self.known = 0#Number of labels at the end of qname below which the hints may know more
+        self.minimise = minimise
+        self.minimised = 0#Number of minimised queries that were sent
+        self.zone = None#The zone that the servers that are asked serve
+        self.set_zone(zone)
+
+    def set_zone(self, zone):
+        """ Remember the zone the servers that are asked serve, minimising stops if it isn't qname or an ancestor of it """
+        labels = labels_of(zone)
+        self.zone = canonical(zone)
+        if not is_subdomain(self.labels, labels):
+            self.minimise = False
+        else:
+            self.known = len(labels)
+
+    def below_zone(self, name):
+        """ Check if name is qname or an ancestor of it, and below the zone of the servers that are asked
+
+        Only those servers can refer us to such a name (they are in bailiwick
+        for it), a referral to any other name is bogus or an attack.
+        """
+        labels, zone = labels_of(name), labels_of(self.zone)
+        return len(labels) > len(zone) and is_subdomain(labels, zone) and is_subdomain(self.labels, labels)
+
+    def in_zone(self, records):
+        """ The records whose owner is in the zone of the servers that are asked, they can't vouch for any others """
+        zone = labels_of(self.zone)
+        return [record for record in records if is_subdomain(labels_of(record.name), zone)]
+
+    def next_name(self):
+        """ The name to ask about when minimising, one label more than what is known, None to ask about qname """
+        if not self.minimise or self.minimised >= dns.consts.MAX_MINIMISE_COUNT or self.known + 1 >= len(self.labels):
+            return None
+        return ".".join(self.labels[-self.known - 1:]) + "."
+
+    def add_hints(self, addresses, zone):
+        """ Put addresses of servers of zone that weren't seen yet in front of the hints, in the given order """
+        new = [address for address in addresses if address not in self.visited]
+        self.visited.update(new)
+        self.zones.update((address, canonical(zone)) for address in new)
+        self.hints.extendleft(reversed(new))
+
 
 class Resolver(object):
     """ DNS resolver """
     
-    def __init__(self, timeout, caching, ttl, nameservers=[], use_rs=True, serverport=53):
+    def __init__(self, timeout, caching, ttl, nameservers=[], use_rs=True, serverport=53,
+                 forwarders=None, policy=dns.consts.FORWARD_POLICY, minimise=dns.consts.QNAME_MINIMISATION):
         """ Initialize the resolver
         
         Args:
             caching (bool): caching is enabled if True
             ttl (int): ttl of cache entries (if > 0)
+            forwarders ([str]): IP addresses of upstream resolvers to forward all queries to
+            policy (str): load balancing policy for the forwarders, see UpstreamPool
+            minimise (bool): use QNAME minimisation when iterating (RFC 9156)
         """
         self.timeout = timeout
+        self.minimise = minimise
         self.caching = caching
         if caching:
             self.cache = RecordCache(ttl)
-        self.nameservers = nameservers
+            self.cache.prefetcher = self.prefetch
+        self.nameservers = list(nameservers)
         if use_rs:
             self.nameservers += dns.consts.ROOT_SERVERS
 
         self.serverport = serverport
+        self.tcp_pool = dns.tcp.ConnectionPool()
+        self.udp_pool = dns.udp.SocketPool.shared()
+        self.infra = dns.infra.InfraCache(timeout)
+        self.flights = dns.flight.SingleFlight()
+
+        #Servers that are asked directly get their own metrics, the others are counted together
+        self.configured = set(self.nameservers) | set(forwarders or [])
+
+        self.upstreams = None
+        if forwarders:
+            self.upstreams = dns.forward.UpstreamPool(forwarders, policy, self.infra)
+            dns.forward.HealthChecker(self.upstreams, self.probe).start()
 
 
+    def server_label(self, server):
+        """ The label of a server in the upstream metrics: its address if it is configured, "other" for those we were referred to """
+        return server if server in self.configured else "other"
+
     def is_valid_hostname(self, hostname):
         """ Check if hostname could be a valid hostname
 
@@ -51,8 +226,7 @@ class Resolver(object):
         Returns:
             boolean indiciting if hostname could be valid
         """
-        valid_hostnames = "^(([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9])\.)*([A-Za-z0-9]|[A-Za-z0-9][A-Za-z0-9\-]*[A-Za-z0-9])$"
-        return re.match(valid_hostnames, hostname)
+        return parse_hostname(hostname) is not None
 
 
     def save_cache(self):
@@ -62,36 +236,310 @@ class Resolver(object):
                 self.cache.write_cache_file()
 
 
-    def ask_server(self, query, server):
+    def ask_server(self, query, server, budget=None):
         """ Send query to a server
 
         Args: 
             query (Message): the query that is to be sent
             server (str): IP address of the server that the query must be sent to
+            budget (Budget): the limits of the resolution the query is for, None if there are none
         
         Returns:
             responses ([Message]): the responses received converted to Messages
         """
-        response = None
-        
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.settimeout(self.timeout)
         try:
-            sock.sendto(query.to_bytes(), (server, self.serverport))
-            data = sock.recv(1024)
-            response = Message.from_bytes(data)
+            response = self.udp_pool.query(query, (server, self.serverport), self.timeout)
+        except socket.error:
+            return None
+        return self.check_response(query, server, response, budget)
+
+    def check_response(self, query, server, response, budget=None):
+        """ Ask again in another way if a UDP response can't be used as it is
+
+        Every query that is sent again is charged to the budget, when it is
+        used up the response can't be used. Only the configured nameservers
+        are asked again with recursion desired.
+
+        Args:
+            query (Message): the query that was sent
+            server (str): IP address of the server that the query was sent to
+            response (Message): the response received over UDP, or None
+            budget (Budget): the limits of the resolution the query is for, None if there are none
+
+        Returns:
+            response (Message): the response to use, None if there is none
+        """
+        if response is None:
+            return None
+        if response.header.rcode == dns.rcodes.RCode.FormErr and query.edns is not None:
+            if budget is not None and not budget.take():
+                return None
+            #The server doesn't understand EDNS, so ask again without it (section 6.2.2 of RFC 6891)
+            header = Header(query.header.ident, query.header.flags, len(query.questions), 0, 0, 0)
+            with dns.trace.tracer.span("retry_without_edns", server=server):
+                return self.ask_server(Message(header, query.questions), server, budget)
+        if (not query.header.rd and not response.header.aa and response.header.rcode == dns.rcodes.RCode.NoError and
+                not response.answers and not response.authorities and server in self.nameservers):
+            #The server has nothing for us without recursion, like our own server for names outside its zones, so ask again with it.
+            #Lame servers we were referred to answer like this too, their recursive answers can't be trusted
+            if budget is not None and not budget.take():
+                return None
+            header = Header(query.header.ident, query.header.flags, len(query.questions), 0, 0, 0)
+            header.rd = 1
+            retry = Message(header, query.questions)
+            if query.edns is not None:
+                retry.add_edns(query.edns.class_)
+            with dns.trace.tracer.span("retry_with_recursion", server=server):
+                return self.ask_server(retry, server, budget)
+        if response.header.tc:#The answer didn't fit, so ask again over TCP
+            if budget is not None and not budget.take():
+                return None
+            with dns.trace.tracer.span("retry_over_tcp", server=server):
+                return self.ask_server_tcp(query, server)
+        return response
+
+    def ask_servers(self, query, servers, on_send=None, budget=None):
+        """ Send query to a list of servers until one of them answers
+
+        The query is sent to the first server. Each time no valid response has
+        come in within the stagger delay, it is also sent to the next server,
+        so one dead server doesn't hold up the resolution for the full timeout.
+        At most MAX_PARALLEL_QUERIES servers are asked, in the order of the list.
+        Each server is waited for as long as its RTO, servers that don't answer
+        in time are recorded as failing in the infrastructure cache.
+
+        Args:
+            query (Message): the query that is to be sent
+            servers ([str]): IP addresses of the servers, most preferred first
+            on_send (callable): called with each server the query is sent to
+            budget (Budget): the limits of the resolution the query is for, the query to
+                every server and every retry of check_response are charged to it
+
+        Returns:
+            response (Message): the first valid response, None if there was none,
+            asked ([str]): the servers that the query was sent to
+        """
+        replies = queue.Queue()
+        waiting = list(servers[:dns.consts.MAX_PARALLEL_QUERIES])
+        asked = []
+        sent = {}#Address of an asked server to the server and the time the query was sent
+        answered = set()
+        next_send = deadline = time.time()
+        try:
+            while True:
+                now = time.time()
+                if waiting and now >= next_send:
+                    if budget is not None and not budget.take():#Retries used up the queries meant for the other servers
+                        waiting = []
+                        continue
+                    server = waiting.pop(0)
+                    asked.append(server)
+                    try:
+                        address = self.udp_pool.resolve_address((server, self.serverport))
+                        sent[address] = (server, now)
+                        self.udp_pool.send(query, address, replies)
+                        if on_send is not None:
+                            on_send(server)
+                    except socket.error:
+                        self.infra.record_failure(server)
+                        continue
+                    next_send = now + self.infra.stagger_delay(server)
+                    deadline = max(deadline, now + self.infra.rto(server))
+                    continue
+
+                if not waiting and now >= deadline:
+                    for address, (server, sent_at) in sent.items():
+                        if address not in answered:
+                            self.infra.record_failure(server)
+                            dns.metrics.upstream_timeouts.labels(self.server_label(server)).inc()
+                            dns.trace.tracer.event("timeout", server=server)
+                    return None, asked
+                wait_until = min(next_send, deadline) if waiting else deadline
+                try:
+                    address, response = replies.get(timeout=max(wait_until - now, 0))
+                except queue.Empty:
+                    continue
+
+                server, sent_at = sent[address]
+                answered.add(address)
+                rtt = time.time() - sent_at
+                self.infra.record_rtt(server, rtt)
+                dns.metrics.upstream_rtt.labels(self.server_label(server)).observe(rtt)
+                dns.trace.tracer.event("reply", server=server, rtt_ms=round(rtt * 1000, 3), rcode=str(dns.rcodes.RCode(response.header.rcode)))
+                response = self.check_response(query, server, response, budget)
+                if response is not None and response.header.rcode in (dns.rcodes.RCode.NoError, dns.rcodes.RCode.NXDomain):
+                    return response, asked
+                next_send = now#This server is of no use, so ask the next one right away
+        finally:
+            for address in sent:
+                self.udp_pool.cancel(query, address, replies)
+
+    def ask_server_tcp(self, query, server):
+        """ Send query to a server over TCP
+
+        Connections are kept open in a pool and reused for later queries to
+        the same server. A pooled connection may have been closed by the
+        server in the meantime, in which case a new one is opened.
+
+        Args:
+            query (Message): the query that is to be sent
+            server (str): IP address of the server that the query must be sent to
+
+        Returns:
+            response (Message): the response, None if there was none
+        """
+        address = (server, self.serverport)
+        reused = True
+        while reused:
+            try:
+                sock, reused = self.tcp_pool.acquire(address, self.timeout)
+            except socket.error:
+                return None
+
+            try:
+                dns.tcp.send_message(sock, query.to_bytes())
+                data = dns.tcp.recv_message(sock)
+                if data is None:
+                    raise socket.error("connection closed by server")
+                response = Message.from_bytes(data)
+            except socket.error:
+                sock.close()
+                continue
+            except (ValueError, struct.error):#Not a DNS message, or cut off
+                sock.close()
+                return None
+
             if response.header.ident != query.header.ident:
                 sock.close()
                 return None
-                    
-        except socket.timeout:
-            pass
+            self.tcp_pool.release(address, sock)
+            return response
+
+        return None
 
-        sock.close()
-        return response
 
+    def request_transfer(self, origin, server, serial=None):
+        """ Request a zone transfer over TCP
+
+        An AXFR is requested, or an IXFR if the serial of our copy of the
+        zone is given. The answer can be applied with Zone.apply_transfer.
+
+        Args:
+            origin (str): root domain name of the zone
+            server (str): IP address of the server that the query must be sent to
+            serial (int): serial of our copy of the zone
+
+        Returns:
+            records ([ResourceRecord]): the answer records of the transfer, None if it failed
+        """
+        identifier = randint(0, 65535)
+        questions = [Question(Name(origin), Type.AXFR if serial is None else Type.IXFR, Class.IN)]
+        authorities = []
+        if serial is not None:#Tell the server which version we have, see section 2 of RFC 1995
+            authorities.append(ResourceRecord(Name(origin), Type.SOA, Class.IN, 0,
+                SOARecordData(Name(origin), Name(origin), serial, 0, 0, 0, 0)))
+        header = Header(identifier, 0, 1, 0, len(authorities), 0)
+        query = Message(header, questions, [], authorities)
+
+        records = []
+        serials = []#Serials of the SOA records seen so far
+        try:
+            sock = socket.create_connection((server, self.serverport), self.timeout)
+        except socket.error:
+            return None
+        try:
+            dns.tcp.send_message(sock, query.to_bytes())
+            while True:
+                data = dns.tcp.recv_message(sock)
+                if data is None:
+                    return None
+                response = Message.from_bytes(data)
+                if response.header.ident != identifier or response.header.rcode != 0:
+                    return None
+
+                for record in response.answers:
+                    records.append(record)
+                    if record.type_ == Type.SOA:
+                        serials.append(record.rdata.serial)
+                    #After the first SOA the SOAs come in pairs (old, new), the transfer ends with the SOA we started with
+                    if len(serials) > 1 and len(serials) % 2 == 0 and serials[-1] == serials[0]:
+                        return records
+
+                if serials == [serial]:#We are already up to date
+                    return records
+        except (socket.error, ValueError):
+            return None
+        finally:
+            sock.close()
+
+    def probe(self, server):
+        """ Check if an upstream resolver answers queries
 
-    def gethostbyname(self, hostname, resolvingnameservers=[]):
+        Args:
+            server (str): IP address of the upstream
+
+        Returns:
+            A boolean that tells if the upstream gave a usable answer in time
+        """
+        header = Header(randint(0, 65535), 0, 1, 0, 0, 0)
+        header.rd = 1
+        query = Message(header, [Question(Name("."), Type.NS, Class.IN)])
+        start = time.time()
+        try:
+            response = self.udp_pool.query(query, (server, self.serverport), self.timeout)
+        except socket.error:
+            response = None
+        if response is None or response.header.rcode not in (dns.rcodes.RCode.NoError, dns.rcodes.RCode.NXDomain):
+            self.infra.record_failure(server)
+            return False
+        self.infra.record_rtt(server, time.time() - start)
+        return True
+
+    def forward(self, qname, qtype, qclass):
+        """ Ask the upstream resolvers to resolve a question for us
+
+        The upstreams are asked in the order of the load balancing policy,
+        moving on to the next ones when they don't answer or fail.
+
+        Args:
+            qname (str): the FQDN that we want to resolve
+            qtype (Type): type of the records we want
+            qclass (Class): class of the records we want
+
+        Returns:
+            The same as resolve
+        """
+        header = Header(randint(0, 65535), 0, 1, 0, 0, 0)
+        header.rd = 1
+        query = Message(header, [Question(Name(qname), qtype, qclass)])
+        query.add_edns(dns.consts.EDNS_PAYLOAD_SIZE)
+
+        upstreams = self.upstreams.order()
+        while upstreams:
+            sent = []
+            def send(server):
+                sent.append(server)
+                self.upstreams.sent(server)
+            try:
+                with dns.trace.tracer.span("upstream", qname=qname, qtype=str(qtype)):
+                    response, asked = self.ask_servers(query, upstreams, send)
+            finally:
+                self.upstreams.finished(sent)
+            upstreams = upstreams[len(asked):]
+            if response is None:
+                dns.log.logger.warning("Forwarders at %s did not respond.", ", ".join(asked))
+                continue
+
+            response.remove_edns()
+            records, _, _ = self.follow_answers(qname, qtype, response.answers)
+            rcode, answers, authorities, additionals = dns.rcodes.RCode(response.header.rcode), records, response.authorities, response.additionals
+            if self.caching:
+                self.cache.add_response(qname, qtype, qclass, rcode, answers, authorities, additionals)
+            return rcode, answers, authorities, additionals
+
+        return dns.rcodes.RCode.ServFail, [], [], []
+
+    def gethostbyname(self, hostname):
         """ Resolve hostname to an IP address
 
         Args:
@@ -101,127 +549,453 @@ class Resolver(object):
             hostname (str): the FQDN that we want to resolve,
             aliaslist ([str]): list of aliases of the hostname,
             ipaddrlist ([str]): list of IP addresses of the hostname 
+        """
+        name = parse_hostname(hostname)
+        if name is None:
+            dns.log.logger.warning("Invalid hostname: %s", hostname)
+            return hostname.rstrip('.'), [], []
+        hostname = str(name)
+
+        _, answers, _, _ = self.resolve(name, Type.A, Class.IN)
+        aliaslist = [str(answer.rdata.cname) for answer in answers if answer.type_ == Type.CNAME]
+        ipaddrlist = [str(answer.rdata.address) for answer in answers if answer.type_ == Type.A]
+        return hostname, aliaslist, ipaddrlist
+
+    def resolve(self, qname, qtype, qclass=Class.IN, checked=False):
+        """ Resolve a question of any type
 
+        Concurrent calls for the same question share a single resolution: the
+        first caller does the work, the others wait for its result.
+
+        Args:
+            qname (str/Name): the FQDN that we want to resolve
+            qtype (Type): type of the records we want
+            qclass (Class): class of the records we want
+            checked (bool): the caller already looked the question up in the cache
+
+        Returns:
+            rcode (RCode): rcode of the answer,
+            answers ([ResourceRecord]): the answer section, starting with the CNAMEs that were followed,
+            authorities ([ResourceRecord]): the authority section,
+            additionals ([ResourceRecord]): the additional section
         """
-        #print("==GETHOSTNAME START================= (",hostname,")")
-        aliaslist = []
-        ipaddrlist = []
+        key = (str(qname).rstrip('.').lower(), qtype, qclass)
+        rcode, answers, authorities, additionals = self.flights.do(key, self.resolve_query, qname, qtype, qclass, False, checked)
+        return rcode, list(answers), list(authorities), list(additionals)
 
-        #Check if the hostname is valid
-        #Do stuff with last dot
-        if hostname[-1] == '.':
-            hostname = hostname[0:-1]
-        valid = self.is_valid_hostname(hostname)
-        if not valid:
-            print("Invalid hostname!")
-            return hostname, [], []
-        hostname = hostname + '.'
-        
-        #Check if the information is in the cache
-        if self.caching:
-            #print("Checking cache..")
-            for addr in self.cache.lookup(hostname, Type.A, Class.IN):
-                #print("Found A in cache: ", addr.to_dict())
-                ipaddrlist.append(str(addr.rdata.address))
+    def resolve_many(self, names, qtype=Type.A, qclass=Class.IN, concurrency=dns.consts.BATCH_CONCURRENCY):
+        """ Resolve many names, keeping up to concurrency resolutions in flight
 
-            if ipaddrlist:#If we already found the ip here, don't go after possible cname stuff
-                #print("We found an address in the cache!")
-                return hostname, aliaslist, ipaddrlist
+        names is read lazily and results are yielded as soon as they are
+        ready, so a batch of any size takes little memory and the results
+        don't come in the order of names. All resolutions share the cache
+        of this resolver, and duplicate names in flight share a resolution.
 
-            for alias in self.cache.lookup(hostname, Type.CNAME, Class.IN):
-                #print("Found CNAME in cache: ", alias.to_dict())
-                aliaslist.append(str(alias.rdata.cname))
-                _, recaliaslist, recipaddrlist = self.gethostbyname(str(alias.rdata.cname))
+        Args:
+            names (iterable of str): the FQDNs that we want to resolve
+            qtype (Type): type of the records we want
+            qclass (Class): class of the records we want
+            concurrency (int): maximum number of resolutions in flight
+
+        Yields:
+            name (str): one of names,
+            result: the result of resolve for that name, SERVFAIL if resolving it failed
+        """
+        names = iter(names)
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        pending = {}#Future of a resolution to its name
+        try:
+            while True:
+                while len(pending) < concurrency:
+                    name = next(names, None)
+                    if name is None:
+                        break
+                    pending[executor.submit(self.resolve, name, qtype, qclass)] = name
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception:#A malformed name shouldn't stop the batch
+                        result = (dns.rcodes.RCode.ServFail, [], [], [])
+                    yield name, result
+        finally:
+            executor.shutdown(wait=False)
+
+    def resolve_or_stale(self, qname, qtype, qclass=Class.IN, deadline=dns.consts.STALE_ANSWER_TIMEOUT):
+        """ Resolve a question, falling back to stale data from the cache
+
+        If the cache still has an expired answer to the question and the
+        resolution doesn't give an answer within deadline, or fails, the stale
+        answer is returned. The resolution goes on in the background and
+        updates the cache when it finishes. See RFC 8767.
 
-                aliaslist += recaliaslist
-                ipaddrlist += recipaddrlist
-            
-            if ipaddrlist:
-                #print("We found an address in the cache!")
-                return hostname, aliaslist, ipaddrlist
+        Args:
+            qname (str): the FQDN that we want to resolve
+            qtype (Type): type of the records we want
+            qclass (Class): class of the records we want
+            deadline (float): seconds to wait for a fresh answer
 
+        Returns:
+            The same as resolve, and a boolean that tells if the answer is stale
+        """
+        if not self.caching:
+            return self.resolve(qname, qtype, qclass) + (False,)
+        fresh = self.lookup_cache_timed(qname, qtype, qclass)
+        if fresh is not None:
+            return fresh + (False,)
+        stale = self.cache.lookup_response(qname, qtype, qclass, stale=True)
+        (dns.metrics.stale_misses if stale is None else dns.metrics.stale_hits).inc()
+        if stale is None:#Nothing to fall back on, so just wait for the resolution
+            return self.resolve(qname, qtype, qclass, checked=True) + (False,)
+
+        done = Event()
+        result = []
+        def resolve():
+            try:
+                result.append(self.resolve(qname, qtype, qclass, checked=True))
+            finally:
+                done.set()
+        Thread(target=resolve, daemon=True).start()
+
+        done.wait(deadline)
+        if result and result[0][0] != dns.rcodes.RCode.ServFail:
+            return result[0] + (False,)
+        return stale + (True,)
+
+    def prefetch(self, dname, type_, class_):
+        """ Refresh a popular cache entry in the background before it expires
 
+        Args:
+            dname (str): domain name of the entry
+            type_ (Type): type of the entry
+            class_ (Class): class of the entry
+        """
+        Thread(target=self.refresh, args=(dname, type_, class_), daemon=True).start()
 
-        #Do the recursive algorithm
-        hints = self.nameservers
-        usedhints = []#List of addresses
-        usednameservers = []#List of names of nameservers that have been seen
-        
-        while hints:
-            #print(usedhints)
-            #Get the server to ask
-            hint = hints[0]
-            usedhints.append(hint)
-            hints = hints[1:]
-            #print("Hints: ",hints)
-
-            #Build the query to send to that server
-            identifier = randint(0, 65535)
-
-            #Make question
-            questions = [Question(Name(hostname), Type.A, Class.IN)]
-            
-            #Make header
-            header = Header(identifier, 0, 1, 0, 0, 0)
-            header.qr = 0
-            header.opcode = 0
-            header.rd = 1
-            query = Message(header, questions)
+    def refresh(self, dname, type_, class_):
+        """ Resolve a cached name again, bypassing the cache """
+        try:
+            self.resolve_query(dname, type_, class_, refresh=True)
+        finally:#If it failed, a later lookup may try again
+            with self.cache.lock:
+                self.cache.prefetching.discard(self.cache.key(dname, type_, class_))
 
-            #print("Asking the server "+ hint)
-            #Try to get a response
-            response = self.ask_server(query, hint)
+    def lookup_cache(self, qname, qtype, qclass, depth=0):
+        """ Answer a question from the cache
 
-            if response == None:#We didn't get a response for this server, so check the next one
-                print("Server at " + hint + " did not respond.")
-                continue
+        If there is no cached response to the question, the cached RRsets are
+        used, following cached CNAMEs.
 
-            #print(response)
+        Returns:
+            The same as resolve, or None if the answer isn't in the cache
+        """
+        response = self.cache.lookup_response(qname, qtype, qclass)
+        if response is not None:
+            return response
+        return self.lookup_rrsets(qname, qtype, qclass, depth)
+
+    def lookup_rrsets(self, qname, qtype, qclass, depth=0):
+        """ Answer a question from the cached RRsets, following cached CNAMEs, see lookup_cache """
+        records = self.cache.lookup(qname, qtype, qclass)
+        if records:
+            return dns.rcodes.RCode.NoError, records, [], []
+        aliases = self.cache.lookup(qname, Type.CNAME, qclass)
+        if not aliases or qtype == Type.CNAME or depth >= dns.consts.MAX_CNAME_DEPTH:
+            return None
+        response = self.lookup_cache(str(aliases[0].rdata.cname), qtype, qclass, depth + 1)
+        if response is None:
+            return None
+        rcode, answers, authorities, additionals = response
+        return rcode, aliases + answers, authorities, additionals
+
+    @staticmethod
+    def follow_answers(qname, qtype, answers):
+        """ Pick the records that answer a question from an answer section
 
-            #Cache the response A and CNAME records
-            if self.caching:
-                #print(response)
-                for answer in response.answers + response.additionals:
-                    if answer.type_ == Type.A or answer.type_ == Type.CNAME:
-                        self.cache.add_record(answer)
+        Args:
+            qname (str): the FQDN of the question
+            qtype (Type): the type of the question
+            answers ([ResourceRecord]): the answer section of a response
+
+        Returns:
+            records ([ResourceRecord]): the CNAMEs leading to the answer, followed by the answer,
+            name (str): the name the CNAMEs lead to,
+            A boolean that tells if the answer was found
+        """
+        records = []
+        name = qname.lower()
+        owners = [str(answer.name).lower() for answer in answers]
+        for _ in range(dns.consts.MAX_CNAME_DEPTH):
+            found = [answer for owner, answer in zip(owners, answers) if owner == name and
+                    (answer.type_ == qtype or qtype == Type.ANY)]
+            if found:
+                return records + found, name, True
+            aliases = [answer for owner, answer in zip(owners, answers) if owner == name and answer.type_ == Type.CNAME]
+            if not aliases:
+                break
+            records.append(aliases[0])
+            name = str(aliases[0].rdata.cname).lower()
+        return records, name, False
+
+    def resolve_query(self, qname, qtype, qclass, refresh=False, checked=False):
+        """ Resolve a question of any type, without sharing the work
+
+        Args:
+            qname (str/Name): the FQDN that we want to resolve, a Name is passed on to the question that is sent
+            qtype (Type): type of the records we want
+            qclass (Class): class of the records we want
+            refresh (bool): ask the nameservers even if the answer is in the cache
+            checked (bool): the question was already looked up in the cache, so don't do it again
+
+        Returns:
+            The same as resolve
+        """
+        name, qname = qname, str(qname).rstrip('.') + '.'
+
+        #Check if the information is in the cache
+        if self.caching and not refresh and not checked:
+            cached = self.lookup_cache_timed(qname, qtype, qclass)
+            if cached is not None:
+                return cached
+
+        if self.upstreams is not None:
+            return self.forward(qname, qtype, qclass)
+
+        #Do the iterative algorithm
+        root = self.start_step(name, qtype, qclass, refresh)
+        root.started = True#The cache was checked above
+        return self.iterate(root)
+
+    def start_step(self, qname, qtype, qclass, refresh, depth=0, kind=None, span=dns.trace.NULL_SPAN):
+        """ A Step whose hints are the nameservers of the closest zone cut in the cache, then the root servers
+
+        Args:
+            The same as those of Step
+        """
+        step = Step(qname, qtype, qclass, self.infra.order(self.nameservers), refresh, depth, kind, span, ".", self.minimise)
+        if self.caching:
+            zone, addresses = self.cache.find_delegation(qname, qclass)
+            if zone is not None:
+                step.add_hints(self.infra.order(addresses), zone)
+                step.set_zone(zone)
+        return step
 
+    def lookup_cache_timed(self, qname, qtype, qclass):
+        """ lookup_cache, recorded in the metrics and the trace
 
+        Each lookup counts once: as a hit or miss of the cached responses, and
+        on a miss as a hit or miss of the cached RRsets.
+        """
+        start = time.perf_counter()
+        cached = self.cache.lookup_response(qname, qtype, qclass)
+        (dns.metrics.response_misses if cached is None else dns.metrics.response_hits).inc()
+        if cached is None:
+            cached = self.lookup_rrsets(qname, qtype, qclass)
+            (dns.metrics.rrset_misses if cached is None else dns.metrics.rrset_hits).inc()
+        end = time.perf_counter()
+        dns.metrics.cache_time.observe(end - start)
+        dns.trace.tracer.record("cache_lookup", start, end, qname=qname, qtype=str(qtype), hit=cached is not None)
+        return cached
+
+    def iterate(self, root, budget=None):
+        """ Resolve a question by following referrals from the nameservers
+
+        The resolution is a stack of steps instead of recursive calls: a step
+        for the question, on top of it a step for the target of a CNAME the
+        nameservers don't know about, or for the address of a nameserver that
+        was given without one. Only the top step is worked on, and when it
+        finishes its result goes to the step below. Names of nameservers are
+        only resolved when there are no addresses left to ask, and never when
+        they are being resolved further down the stack already, so a
+        delegation that depends on itself fails instead of looping. The whole
+        resolution gets a budget of queries and time, when it is used up the
+        resolution fails.
 
-            #Analyze the response
-            for answer in response.answers:#First try to get an address
-                if answer.type_ == Type.A and (str(answer.name) == hostname or str(answer.name) in aliaslist):
-                    ipaddrlist.append(str(answer.rdata.address))
+        Args:
+            root (Step): the step for the question
+            budget (Budget): the limits of the resolution, the defaults if None
 
-            for answer in response.answers:#Then get the aliases
-                if answer.type_ == Type.CNAME and str(answer.rdata.cname) not in aliaslist:
-                    #We found an alias, so restart the request using it
-                    aliaslist.append(str(answer.rdata.cname))
-                    _, recaliaslist, recipaddrlist = self.gethostbyname(str(answer.rdata.cname))
+        Returns:
+            The same as resolve
+        """
+        budget = budget if budget is not None else Budget()
+        steps = [root]
+        result = None
+        while True:
+            step = steps[-1]
+            if result is None:
+                exhausted = budget.exhausted()
+                if exhausted is not None:
+                    exhausted_budgets.labels(exhausted).inc()
+                    dns.trace.tracer.event("budget_exhausted", budget=exhausted)
+                    dns.log.logger.warning("Gave up resolving %s, the %s budget is used up.", root.qname, exhausted)
+                    for step in reversed(steps):
+                        step.span.__exit__(None, None, None)
+                    return dns.rcodes.RCode.ServFail, [], [], []
+                result = self.advance(step, steps, budget)
+                continue
 
-                    aliaslist += recaliaslist
-                    ipaddrlist += recipaddrlist
+            #The step on top of the stack finished
+            steps.pop()
+            step.span.__exit__(None, None, None)
+            if not steps:
+                return result
+            parent = steps[-1]
+            if step.kind == Step.CNAME:
+                rcode, answers, authorities, additionals = result
+                result = rcode, parent.aliases + answers, authorities, additionals
+                if self.caching and rcode != dns.rcodes.RCode.ServFail:
+                    self.cache.add_response(parent.qname, parent.qtype, parent.qclass, *result)
+            else:#The addresses of a nameserver
+                parent.add_hints(self.infra.order([str(answer.rdata.address) for answer in result[1] if answer.type_ == Type.A]), step.serves)
+                result = None
+
+    def advance(self, step, steps, budget):
+        """ Do the next bit of work for a step
 
-                
-            if ipaddrlist != []:
-                #print("We found an address for " + hostname + " using the recursive search!")
-                return hostname, aliaslist, ipaddrlist
+        Args:
+            step (Step): the step on top of the stack
+            steps ([Step]): the stack, a step may be pushed on it
+            budget (Budget): the limits of the resolution
 
+        Returns:
+            result: the result of the step (the same as resolve), None if it isn't finished
+        """
+        if not step.started:
+            step.started = True
+            if self.caching and not step.refresh:
+                cached = self.lookup_cache_timed(step.qname, step.qtype, step.qclass)
+                if cached is not None:
+                    return cached
+
+        if not step.hints:
+            while step.glueless:#Resolve the name of a nameserver to get addresses to ask
+                nsdname, zone = step.glueless.popleft()
+                if not any(other.qname.lower() == nsdname for other in steps):#It isn't being resolved already
+                    nameserver = self.start_step(nsdname, Type.A, Class.IN, False,
+                                                 kind=Step.NAMESERVER, span=dns.trace.tracer.span("nameserver", nsdname=nsdname))
+                    nameserver.serves = zone
+                    steps.append(nameserver)
+                    return None
+            return dns.rcodes.RCode.ServFail, [], [], []
+
+        zone = step.zones[step.hints[0]]
+        if zone != step.zone:#The servers of the zone we were referred to failed, so fall back to those of an ancestor
+            step.set_zone(zone)
+
+        #Build the query to send to the next servers, about the next label of the name only when minimising
+        minimised = step.next_name()
+        question = step.question if minimised is None else Question(Name(minimised), Type.A, step.qclass)
+        header = Header(randint(0, 65535), 0, 1, 0, 0, 0)
+        header.qr = 0
+        header.opcode = 0
+        header.rd = 0
+        query = Message(header, [question])
+        query.add_edns(dns.consts.EDNS_PAYLOAD_SIZE)
+
+        #Try to get a response, asking the next hints of the same zone too if the first ones are slow
+        servers = list(itertools.islice(itertools.takewhile(lambda address: step.zones[address] == zone, step.hints),
+                                        min(dns.consts.MAX_PARALLEL_QUERIES, budget.queries)))
+        with dns.trace.tracer.span("upstream", qname=str(question.qname), qtype=str(question.qtype)):
+            response, asked = self.ask_servers(query, servers, budget=budget)
+        for _ in asked:
+            step.hints.popleft()
+
+        if response == None:#We didn't get a response from these servers, so check the next ones
+            dns.log.logger.warning("Servers at %s did not respond.", ", ".join(asked))
+            if minimised is not None:#Some servers don't answer questions about names without records, so ask the others about the whole name
+                step.minimise = False
+            return None
+
+        response.remove_edns()
+        referral = [authority for authority in response.authorities if authority.type_ == Type.NS]
+        if minimised is not None:
+            step.minimised += 1
+            if referral and not response.answers and not response.header.aa and response.header.rcode == dns.rcodes.RCode.NoError:
+                self.follow_referral(step, response, referral)
+                return None
+            #There is no zone cut at the name, so ask the same servers about the next label
+            step.hints.extendleft(reversed(asked))
+            if response.header.rcode == dns.rcodes.RCode.NXDomain:#Some servers say this for names without records but with names below them
+                step.minimise = False
             else:
-                for nameserver in response.authorities:
-                    if nameserver.type_ == Type.NS:
-                        #Check if we got the ip of this nameserver in the additional section
-                        for additional in response.additionals:
-                            if nameserver.rdata.nsdname == additional.name and additional.type_ != Type.AAAA:
-                                if str(additional.rdata.address) not in usedhints:#Prevent recycling of old hints
-                                    hints = [str(additional.rdata.address)] + hints
-                                    usednameservers.append(str(additional.name))
-                                break
-                        else:#This nameserver wasn't in the additional section
-                            if str(nameserver.rdata.nsdname) not in usednameservers and str(nameserver.rdata.nsdname) != hostname and not str(nameserver.rdata.nsdname) in resolvingnameservers:#It is an unseen nameserver
-                                _, _, nsipaddrlist = self.gethostbyname(str(nameserver.rdata.nsdname), resolvingnameservers=resolvingnameservers + [str(nameserver.rdata.nsdname)])
-                                hints = nsipaddrlist + hints
-                                usednameservers.append(str(nameserver.rdata.nsdname))
-                                
-
-        #print("Recursive search for " + hostname + " was a total failure")
-        return hostname, [], []
+                step.known += 1
+            return None
+
+        #Only use the records the servers are in bailiwick for, an alias out of their zone is followed like one they don't know about
+        records, name, found = self.follow_answers(step.qname, step.qtype, step.in_zone(response.answers))
+        if found or response.header.aa or response.header.rcode == dns.rcodes.RCode.NXDomain or not referral:
+            rcode = dns.rcodes.RCode(response.header.rcode)
+            authorities, additionals = step.in_zone(response.authorities), step.in_zone(response.additionals)
+            if records and not found and rcode == dns.rcodes.RCode.NoError and step.depth + len(records) <= dns.consts.MAX_CNAME_DEPTH:
+                #The answer is an alias whose target this server doesn't know about, so restart the request using it
+                step.aliases = records
+                steps.append(self.start_step(name, step.qtype, step.qclass, step.refresh,
+                                             step.depth + len(records), Step.CNAME, dns.trace.tracer.span("cname", target=name)))
+                return None
+            if self.caching and rcode != dns.rcodes.RCode.ServFail:
+                self.cache.add_response(step.qname, step.qtype, step.qclass, rcode, records, authorities, additionals)
+            return rcode, records, authorities, additionals
+
+        #We were referred to other nameservers
+        self.follow_referral(step, response, referral)
+        return None
+
+    def follow_referral(self, step, response, referral):
+        """ Add the nameservers a response refers to to the hints of a step
+
+        A referral is only followed if it is for qname or an ancestor of it,
+        below the zone of the servers that sent it (Step.below_zone), and
+        glue is only used for nameservers inside the zone of those servers,
+        which includes the zone it refers to and its siblings.
+        Anything else could point later resolutions of unrelated names at
+        the sender. The NS records and their glue are cached, so later
+        resolutions can start at this zone cut (see RecordCache.find_delegation).
+        Nameservers without glue whose addresses are in the cache are used
+        as if they had glue, the others are resolved when the hints run out.
+        The cache only holds addresses from answers and glue of servers that
+        are in bailiwick for them, see advance.
+
+        Args:
+            step (Step): the step the response is for
+            response (Message): the referral
+            referral ([ResourceRecord]): the NS records in the authority section of the response
+
+        Returns:
+            A boolean that tells if the referral was followed
+        """
+        zone = canonical(referral[0].name)
+        if not step.below_zone(zone):
+            rejected_referrals.inc()
+            dns.trace.tracer.event("rejected_referral", zone=zone)
+            dns.log.logger.warning("Ignored a referral to %s for %s from the servers of %s.", zone, step.qname, step.zone)
+            return False
+        referral = [nameserver for nameserver in referral if canonical(nameserver.name) == zone]
+
+        glue = {}#Lower case name of a nameserver to its A records in the additional section
+        for additional in response.additionals:
+            if additional.type_ == Type.A:
+                glue.setdefault(str(additional.name).lower(), []).append(additional)
+        nsaddresses = []#Addresses of the nameservers we were referred to
+        used = []#The glue of the nameservers
+        for nameserver in referral:
+            nsdname = str(nameserver.rdata.nsdname).lower()
+            if nsdname in step.nameservers:
+                continue
+            step.nameservers.add(nsdname)
+            addresses = glue.get(nsdname, []) if is_subdomain(labels_of(nsdname), labels_of(step.zone)) else []
+            used += addresses
+            if not addresses and self.caching:
+                addresses = self.cache.lookup(nsdname, Type.A, Class.IN)
+            if addresses:
+                nsaddresses += [str(address.rdata.address) for address in addresses]
+            else:#This nameserver wasn't in the additional section, resolve it if the others fail
+                step.glueless.append((nsdname, zone))
+        if self.caching:
+            self.cache.add_delegation(referral, used)
+        step.add_hints(self.infra.order(nsaddresses), zone)
+        return True
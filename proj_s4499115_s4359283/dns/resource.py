@@ -12,9 +12,9 @@ import socket
 import struct
 import time
 
-from dns.classes import Class
+from dns.classes import Class, class_from_code
 from dns.name import Name
-from dns.rtypes import Type
+from dns.rtypes import Type, type_from_code
 
 
 class ResourceRecord(object):
@@ -47,9 +47,10 @@ class ResourceRecord(object):
     def from_bytes(cls, packet, offset):
         """Convert ResourceRecord from bytes."""
         name, offset = Name.from_bytes(packet, offset)
-        type_ = Type(struct.unpack_from("!H", packet, offset)[0])
-        class_ = Class(struct.unpack_from("!H", packet, offset + 2)[0])
-        ttl, rdlength = struct.unpack_from("!iH", packet, offset + 4)
+        type_, class_, ttl, rdlength = struct.unpack_from("!HHiH", packet, offset)
+        type_ = type_from_code(type_)
+        if type_ != Type.OPT:#The class of an OPT record is the UDP payload size
+            class_ = class_from_code(class_)
         offset += 10
         rdata = RecordData.create_from_bytes(type_, packet, offset, rdlength)
         offset += rdlength
@@ -66,9 +67,9 @@ class ResourceRecord(object):
     @classmethod
     def from_dict(cls, dct):
         """Convert ResourceRecord from dict."""
-        type_ = Type[dct["type"]]
+        type_ = Type.from_name(dct["type"])
         rdata = RecordData.create_from_dict(type_, dct["rdata"])
-        return cls(Name(dct["name"]), type_, Class[dct["class"]], dct["ttl"],
+        return cls(Name(dct["name"]), type_, Class.from_name(dct["class"]), dct["ttl"],
                    rdata)
 
 
@@ -85,16 +86,7 @@ class RecordData:
             rdlength (int): length of rdata
             parser (int): domain name parser
         """
-        classdict = {
-            Type.A: ARecordData,
-            Type.CNAME: CNAMERecordData,
-            Type.NS: NSRecordData,
-            Type.SOA: SOARecordData
-        }
-        if type_ in classdict:
-            return classdict[type_](data)
-        else:
-            return GenericRecordData(data)
+        return RECORD_DATA.get(type_, GenericRecordData)(data)
 
     @staticmethod
     def create_from_bytes(type_, packet, offset, rdlength):
@@ -106,30 +98,12 @@ class RecordData:
             offset (int): offset in packet.
             rdlength (int): length of rdata.
         """
-        classdict = {
-            Type.A: ARecordData,
-            Type.CNAME: CNAMERecordData,
-            Type.NS: NSRecordData,
-            Type.SOA: SOARecordData
-        }
-        if type_ in classdict:
-            return classdict[type_].from_bytes(packet, offset, rdlength)
-        else:
-            return GenericRecordData.from_bytes(packet, offset, rdlength)
+        return RECORD_DATA.get(type_, GenericRecordData).from_bytes(packet, offset, rdlength)
 
     @staticmethod
     def create_from_dict(type_, dct):
         """Create a RecordData object from dict."""
-        classdict = {
-            Type.A: ARecordData,
-            Type.CNAME: CNAMERecordData,
-            Type.NS: NSRecordData,
-            Type.SOA: SOARecordData
-        }
-        if type_ in classdict:
-            return classdict[type_].from_dict(dct)
-        else:
-            return GenericRecordData.from_dict(dct)
+        return RECORD_DATA.get(type_, GenericRecordData).from_dict(dct)
 
 
 class ARecordData(RecordData):
@@ -296,12 +270,13 @@ class SOARecordData(RecordData):
             compress (dict): dict from domain names to pointers.
         """
         data = self.mname.to_bytes(offset, compress)
-        data += self.rname.to_bytes(len(data), compress)
+        data += self.rname.to_bytes(offset + len(data), compress)
         data += struct.pack("!I", self.serial)
         data += struct.pack("!i", self.refresh)
         data += struct.pack("!i", self.retry)
         data += struct.pack("!i", self.expire)
         data += struct.pack("!I", self.minimum)
+        return data
 
     @classmethod
     def from_bytes(cls, packet, offset, rdlength):
@@ -319,7 +294,7 @@ class SOARecordData(RecordData):
         retry = struct.unpack_from("!i", packet, offset + 8)[0]
         expire = struct.unpack_from("!i", packet, offset + 12)[0]
         minimum = struct.unpack_from("!I", packet, offset + 16)[0]
-        return cls(mname, rname, serial, refresh, retry, expire, minimum), offset + 20
+        return cls(mname, rname, serial, refresh, retry, expire, minimum)
 
     def to_dict(self):
         """Convert to dict."""
@@ -332,7 +307,246 @@ class SOARecordData(RecordData):
     def from_dict(cls, dct):
         """Create a RecordData object from dict."""
         return cls(Name(dct["mname"]), Name(dct["rname"]), dct["serial"],
-                   dt["refresh"], dct["retry"], dct["expire"], dct["minimum"])
+                   dct["refresh"], dct["retry"], dct["expire"], dct["minimum"])
+
+
+class PTRRecordData(RecordData):
+    """Record data for PTR type.
+
+    See RFC 1035 3.3.12.
+    """
+
+    def __init__(self, ptrdname):
+        """Create RecordData for PTR type.
+
+        Args:
+            ptrdname (Name): ptrdname.
+        """
+        self.ptrdname = ptrdname
+
+    def to_bytes(self, offset, compress):
+        """Convert to bytes.
+
+        Args:
+            offset (int): offset in packet.
+            compress (dict): dict from domain names to pointers.
+        """
+        return self.ptrdname.to_bytes(offset, compress)
+
+    @classmethod
+    def from_bytes(cls, packet, offset, rdlength):
+        """Create a RecordData object from bytes.
+
+        Args:
+            packet (bytes): packet.
+            offset (int): offset in message.
+            rdlength (int): length of rdata.
+        """
+        ptrdname, offset = Name.from_bytes(packet, offset)
+        return cls(ptrdname)
+
+    def to_dict(self):
+        """Convert to dict."""
+        return {"ptrdname" : str(self.ptrdname)}
+
+    @classmethod
+    def from_dict(cls, dct):
+        """Create a RecordData object from dict."""
+        return cls(Name(dct["ptrdname"]))
+
+
+class MXRecordData(RecordData):
+    """Record data for MX type.
+
+    See RFC 1035 3.3.9.
+    """
+
+    def __init__(self, preference, exchange):
+        """Create RecordData for MX type.
+
+        Args:
+            preference (int): preference.
+            exchange (Name): exchange.
+        """
+        self.preference = preference
+        self.exchange = exchange
+
+    def to_bytes(self, offset, compress):
+        """Convert to bytes.
+
+        Args:
+            offset (int): offset in packet.
+            compress (dict): dict from domain names to pointers.
+        """
+        return struct.pack("!H", self.preference) + self.exchange.to_bytes(offset + 2, compress)
+
+    @classmethod
+    def from_bytes(cls, packet, offset, rdlength):
+        """Create a RecordData object from bytes.
+
+        Args:
+            packet (bytes): packet.
+            offset (int): offset in message.
+            rdlength (int): length of rdata.
+        """
+        preference = struct.unpack_from("!H", packet, offset)[0]
+        exchange, offset = Name.from_bytes(packet, offset + 2)
+        return cls(preference, exchange)
+
+    def to_dict(self):
+        """Convert to dict."""
+        return {"preference" : self.preference, "exchange" : str(self.exchange)}
+
+    @classmethod
+    def from_dict(cls, dct):
+        """Create a RecordData object from dict."""
+        return cls(dct["preference"], Name(dct["exchange"]))
+
+
+class TXTRecordData(RecordData):
+    """Record data for TXT type.
+
+    See RFC 1035 3.3.14.
+    """
+
+    def __init__(self, strings):
+        """Create RecordData for TXT type.
+
+        Args:
+            strings ([bytes]): character strings.
+        """
+        self.strings = strings
+
+    def to_bytes(self, offset, compress):
+        """Convert to bytes.
+
+        Args:
+            offset (int): offset in packet.
+            compress (dict): dict from domain names to pointers.
+        """
+        return b"".join(struct.pack("!B", len(string)) + string for string in self.strings)
+
+    @classmethod
+    def from_bytes(cls, packet, offset, rdlength):
+        """Create a RecordData object from bytes.
+
+        Args:
+            packet (bytes): packet.
+            offset (int): offset in message.
+            rdlength (int): length of rdata.
+        """
+        strings = []
+        end = offset + rdlength
+        while offset < end:
+            length = packet[offset]
+            strings.append(packet[offset+1:offset+1+length])
+            offset += 1 + length
+        return cls(strings)
+
+    def to_dict(self):
+        """Convert to dict."""
+        return {"strings" : [string.decode("latin-1") for string in self.strings]}
+
+    @classmethod
+    def from_dict(cls, dct):
+        """Create a RecordData object from dict."""
+        return cls([string.encode("latin-1") for string in dct["strings"]])
+
+
+class AAAARecordData(RecordData):
+    """Record data for AAAA type.
+
+    See RFC 3596 2.2.
+    """
+
+    def __init__(self, address):
+        """Create RecordData for AAAA type.
+
+        Args:
+            address (str): address.
+        """
+        self.address = address
+
+    def to_bytes(self, offset, compress):
+        """Convert to bytes.
+
+        Args:
+            offset (int): offset in packet.
+            compress (dict): dict from domain names to pointers.
+        """
+        return socket.inet_pton(socket.AF_INET6, self.address)
+
+    @classmethod
+    def from_bytes(cls, packet, offset, rdlength):
+        """Create a RecordData object from bytes.
+
+        Args:
+            packet (bytes): packet.
+            offset (int): offset in message.
+            rdlength (int): length of rdata.
+        """
+        address = socket.inet_ntop(socket.AF_INET6, packet[offset:offset+16])
+        return cls(address)
+
+    def to_dict(self):
+        """Convert to dict."""
+        return {"address" : self.address}
+
+    @classmethod
+    def from_dict(cls, dct):
+        """Create a RecordData object from dict."""
+        return cls(dct["address"])
+
+
+class OPTRecordData(RecordData):
+    """Record data for OPT pseudo records.
+
+    See RFC 6891 6.1.2.
+    """
+
+    def __init__(self, options=None):
+        """Create RecordData for OPT type.
+
+        Args:
+            options ([(int, bytes)]): option codes and their data.
+        """
+        self.options = options if options is not None else []
+
+    def to_bytes(self, offset, compress):
+        """Convert to bytes.
+
+        Args:
+            offset (int): offset in packet.
+            compress (dict): dict from domain names to pointers.
+        """
+        return b"".join(struct.pack("!HH", code, len(data)) + data
+                        for code, data in self.options)
+
+    @classmethod
+    def from_bytes(cls, packet, offset, rdlength):
+        """Create a RecordData object from bytes.
+
+        Args:
+            packet (bytes): packet.
+            offset (int): offset in message.
+            rdlength (int): length of rdata.
+        """
+        options = []
+        end = offset + rdlength
+        while offset + 4 <= end:
+            code, length = struct.unpack_from("!HH", packet, offset)
+            options.append((code, packet[offset+4:offset+4+length]))
+            offset += 4 + length
+        return cls(options)
+
+    def to_dict(self):
+        """Convert to dict."""
+        return {"options" : [[code, data.hex()] for code, data in self.options]}
+
+    @classmethod
+    def from_dict(cls, dct):
+        """Create a RecordData object from dict."""
+        return cls([(code, bytes.fromhex(data)) for code, data in dct["options"]])
 
 
 class GenericRecordData(RecordData):
@@ -369,9 +583,23 @@ class GenericRecordData(RecordData):
 
     def to_dict(self):
         """Convert to dict."""
-        return {"data" : self.data}
+        return {"data" : self.data.hex()}
 
     @classmethod
     def from_dict(cls, dct):
         """Create a RecordData object from dict."""
-        return cls(dct["data"])
+        return cls(bytes.fromhex(dct["data"]))
+
+
+#The RecordData class of every type that has one, other types use GenericRecordData
+RECORD_DATA = {
+    Type.A: ARecordData,
+    Type.CNAME: CNAMERecordData,
+    Type.NS: NSRecordData,
+    Type.SOA: SOARecordData,
+    Type.PTR: PTRRecordData,
+    Type.MX: MXRecordData,
+    Type.TXT: TXTRecordData,
+    Type.AAAA: AAAARecordData,
+    Type.OPT: OPTRecordData
+}
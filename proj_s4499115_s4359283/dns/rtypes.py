@@ -4,7 +4,9 @@
 
 This module contains an Enum for TYPE and QTYPE values. This Enum also contains
 a method for converting Enum values to strings. See sections 3.2.2 and 3.2.3 of
-RFC 1035 for more information.
+RFC 1035 for more information. Codes without a name become pseudo-members
+(TYPE<code>, RFC 3597) instead of raising, and TYPES maps every code to its
+Type for decoding.
 """
 
 
@@ -25,6 +27,8 @@ class Type(IntEnum):
         <Type.SOA: 6>
         >>> Type.MX == 15
         True
+        >>> Type(46)
+        <Type.TYPE46: 46>
     """
 
     A = 1
@@ -35,7 +39,48 @@ class Type(IntEnum):
     MX = 15
     TXT = 16
     AAAA = 28
+    OPT = 41
+    IXFR = 251
+    AXFR = 252
     ANY = 255
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def _missing_(cls, value):
+        """ A pseudo-member for a code without a name, like TYPE65280 (RFC 3597)
+
+        It keeps the code, so records of unknown types can be passed on as they are.
+        """
+        if not isinstance(value, int) or not 0 <= value <= 0xffff:
+            return None
+        member = int.__new__(cls, value)
+        member._name_ = "TYPE" + str(value)
+        member._value_ = value
+        member = cls._value2member_map_.setdefault(value, member)
+        TYPES[value] = member
+        return member
+
+    @classmethod
+    def from_name(cls, name):
+        """ The Type with a name, TYPE<code> for codes without a name """
+        if name in cls.__members__:
+            return cls.__members__[name]
+        if name.startswith("TYPE") and name[4:].isdigit():
+            return cls(int(name[4:]))
+        raise KeyError(name)
+
+
+#The Type of every 16-bit code, so decoding a code is an index instead of an Enum call
+TYPES = [None] * 0x10000
+for _member in Type:
+    TYPES[_member] = _member
+
+
+def type_from_code(code):
+    """ The Type of a code from a message, a pseudo-member if it has no name """
+    member = TYPES[code]
+    if member is None:
+        member = Type(code)
+    return member
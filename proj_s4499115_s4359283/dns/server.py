@@ -6,15 +6,24 @@ This module provides a recursive DNS server. You will have to implement this
 server using the algorithm described in section 4.3.2 of RFC 1034.
 """
 
+import os
 import socket
+import time
 from threading import Thread, Lock
 import platform
+import dns.capture
+import dns.log
 import dns.message
+import dns.metrics
+import dns.ratelimit
 import dns.resolver
+import dns.tcp
+import dns.trace
 import dns.zone
 
 from dns.resource import ResourceRecord, RecordData
 from dns.classes import Class
+from dns.rcodes import RCode
 from dns.rtypes import Type
 import dns.consts as Consts
 from dns.name import Name
@@ -27,6 +36,8 @@ lock = Lock()
 class RequestHandler(Thread):
     """ A handler for requests to the DNS server """
 
+    tcp = False
+
     def __init__(self, serversocket, clientIP, ttl, message, resolver, catalog):
         """ Initialize the handler thread """
         super(RequestHandler, self).__init__()
@@ -37,76 +48,64 @@ class RequestHandler(Thread):
         self.message = message
         self.resolver = resolver
         self.catalog = catalog
+        self.received = time.perf_counter()
 
     def check_zone(self, hname):
-        """ Checks the catalog for entries regarding given hname
+        """ Answer the question from the catalog, if hname is in one of its zones
+
+        Names in our zones are always answered here, also when they don't
+        exist, and never passed on to the resolver.
 
         Args:
             hname (str): the FQDN of the host we want to look up
 
         Returns:
-            answer ([ResourceRecord]): the records that directly give an IP address,
-            authority ([ResourceRecord]): the records that tell about the nameservers that "know more",
-            A boolean that tells if we found something
+            The same as Zone.lookup, or None if hname isn't in any zone
         """
-        #print("Checking zone for \"" + hname + "\"")
-        
-        h_parts = str(hname).rstrip('.').split('.')
-
-        zone_match = None
-        best_rdn_parts = []
-
-        #Check if hname is a subdomain for the root domain name
-        for rdn in self.catalog.zones:
-            zone = self.catalog.zones[rdn]
-            rdn_parts = rdn.rstrip('.').split('.')
-            #print("HParts: " + str(h_parts))
-            #print("RDNparts: " + str(rdn_parts))
-            if all(l == r for (l, r) in zip(reversed(h_parts), reversed(rdn_parts))) and len(h_parts) >= len(rdn_parts):
-                zone_match = zone
-                best_rdn_parts = rdn_parts
-                 
+        origin, zone_match = self.catalog.find_zone(hname)
         if zone_match == None:
-            #print("Geen zone gevonden")
-            return [], [], False
-
-        #Find the answers
-        authority = []
-        answer = []
-        #print("Found match:",zone_match.records)
-        for fqdn, record in zone_match.records.items():
-            #print(fqdn,"=?=",hname)
-            if fqdn == hname and record.type_ != Type.NS:#Precies het adres dat we willen
-                #print("NAMES MATCH",record.to_dict())
-                if self.message.questions[0].qtype == record.type_:
-                    #print("recorddata: " + str(record.rdata.data))
-                    answer.append(record)
-                    
-                elif self.message.questions[0].qtype != Type.CNAME and record.type_ == Type.CNAME:#alias van iets wat we zoeken
-                    answer.append(record)
-                    #Find the info for this new cname if you have it
-                    extra_answer, extra_authority, extra_found = self.check_zone(record.rdata.cname)
-                    answer = answer + extra_answer
-                    authority = authority + extra_authority
-                    
-        for i in range(len(h_parts)):
-            subaddress = ".".join(h_parts[i:])
-            #print(subaddress)
-            
+            return None
+        return zone_match.lookup(hname, self.message.questions[0].qtype, origin)
 
-            for fqdn, record in zone_match.records.items():   
-                #print(fqdn,"=?=",hname)                  
-                if fqdn.rstrip('.') == subaddress and record.type_ == Type.NS:
-                    #print("NAMES MATCH",record.to_dict())
-                    authority.append(record)
-
-                    extra_answer, extra_authority, extra_found = self.check_zone(record.rdata.nsdname)
-                    answer = answer + extra_answer
-                    authority = authority + extra_authority
-
-        return list(set(answer)), list(set(authority)), (bool(answer) or bool(authority))
+    def handle_transfer(self):
+        """ Answers an AXFR or IXFR query with the zone or the changes to it
 
+        See RFC 5936 for AXFR and RFC 1995 for IXFR. Full transfers are only
+        done over TCP. An IXFR over UDP is answered with the current SOA
+        record, which tells the client to retry over TCP.
+        """
+        ident = self.message.header.ident
+        question = self.message.questions[0]
+        origin, zone = self.catalog.find_zone(question.qname)
+
+        records = None
+        if zone is None or zone.soa is None or zone.soa.name != question.qname:
+            rcode = RCode.NotAuth
+        elif question.qtype == Type.IXFR and not self.tcp:
+            rcode, records = RCode.NoError, [zone.soa]
+        elif question.qtype == Type.AXFR and not self.tcp:
+            rcode = RCode.Refused
+        else:
+            rcode = RCode.NoError
+            serials = [record.rdata.serial for record in self.message.authorities if record.type_ == Type.SOA]
+            if question.qtype == Type.IXFR and serials:
+                records = zone.ixfr_records(serials[0])
+            if records is None:#Not an IXFR or the journal doesn't go back far enough
+                records = zone.axfr_records()
+
+        if records is None:
+            header = Header(ident, 0, 1, 0, 0, 0)
+            header.qr = 1
+            header.rcode = rcode
+            self.sendResponse(Message(header, self.message.questions, []))
+            return
 
+        for i in range(0, len(records), Consts.TRANSFER_CHUNK_SIZE):
+            chunk = records[i:i + Consts.TRANSFER_CHUNK_SIZE]
+            header = Header(ident, 0, 1, len(chunk), 0, 0)
+            header.qr = 1
+            header.aa = 1
+            self.sendResponse(Message(header, self.message.questions, chunk))
 
     def handle_request(self):
         """ Attempts to answer the received query """
@@ -116,8 +115,9 @@ class RequestHandler(Thread):
         #for zone in self.catalog.zones:
         #    print("Records:",self.catalog.zones[zone].records)
 
+        ident = self.message.header.ident
         if self.message.header.opcode != 0:#Send a not implemented error, we don't need to support those kinds of queries
-            print("[-] - Received a nonstandard query. This is unsupported.")
+            dns.log.logger.warning("Received a nonstandard query. This is unsupported.")
             header = Header(ident, 0, 1, 0, 0, 0)
             header.qr = 1
             header.rd = self.message.header.rd
@@ -128,7 +128,7 @@ class RequestHandler(Thread):
 
         #print("[*] - Handling request.")
         if len(self.message.questions) != 1:#Send a format error response
-            print("[-] - Invalid request.")
+            dns.log.logger.warning("Invalid request.")
             header = Header(ident, 0, 1, 0, 0, 0)
             header.qr = 1
             header.rd = self.message.header.rd
@@ -136,39 +136,62 @@ class RequestHandler(Thread):
             header.rcode = 1 
             self.sendResponse(Message(header,self.message.questions, []))
             return
+
+        edns = self.message.edns
+        if edns is not None and (edns.ttl >> 16) & 0xff != 0:#We only know EDNS version 0, see section 6.1.3 of RFC 6891
+            header = Header(ident, 0, 1, 0, 0, 0)
+            header.qr = 1
+            header.rd = self.message.header.rd
+            header.ra = 1
+            response = Message(header, self.message.questions, [])
+            self.add_edns(response)
+            response.edns.ttl = (RCode.BADVERS >> 4) << 24
+            self.sendResponse(response)
+            return
+
+        if self.message.questions[0].qtype in (Type.AXFR, Type.IXFR):
+            self.handle_transfer()
+            return
+
         #print("MSG:",self.message)
         #print("RECEIVED QUESTION",self.message.questions[0])
         hname = str(self.message.questions[0].qname)
         #print("Solving",hname,type(hname))
-        ident = self.message.header.ident
         #print("Checking zone")
-        answer, authority, found = self.check_zone(hname)
-        #print("Wat we in de zone hebben gevonden")
-        #print("ANS:",answer,"AUTH:",authority,"FOUND:",found)
-        #found = False
-        if found:
-            print("Found in zone")
-            header = Header(ident, 0, 1, len(answer), len(authority), 0)
+        start = time.perf_counter()
+        zone_answer = self.check_zone(hname)
+        end = time.perf_counter()
+        dns.metrics.zone_time.observe(end - start)
+        dns.trace.tracer.record("zone_lookup", start, end, found=zone_answer is not None)
+        if zone_answer is not None:
+            dns.log.logger.debug("Found %s in zone", hname)
+            rcode, answer, authority, additional, authoritative = zone_answer
+            header = Header(ident, 0, 1, len(answer), len(authority), len(additional))
             header.qr = 1
-            header.aa = 1
+            header.aa = int(authoritative)
             header.rd = self.message.header.rd
             header.ra = 1
+            header.rcode = rcode
             
-            self.sendResponse(Message(header, self.message.questions, answer, authority))
+            self.sendResponse(Message(header, self.message.questions, answer, authority, additional))
 
         elif self.message.header.rd == 1:
-            h, al, ad = self.resolver.gethostbyname(hname)
+            question = self.message.questions[0]
+            start = time.perf_counter()
+            with dns.trace.tracer.span("resolve") as span:
+                rcode, answers, authorities, additionals, stale = self.resolver.resolve_or_stale(hname, question.qtype, question.qclass)
+                if span is not None:
+                    span.attrs.update(rcode=str(rcode), stale=stale)
+            dns.metrics.resolve_time.observe(time.perf_counter() - start)
 
             #Make and send th appropriate response
-            header = Header(ident, 0, 1, len(al) + len(ad), 0, 0)
+            header = Header(ident, 0, 1, len(answers), len(authorities), len(additionals))
             header.qr = 1
             header.rd = self.message.header.rd
             header.ra = 1
-            
-            aliases = [ResourceRecord(Name(h), Type.CNAME, Class.IN, self.ttl, RecordData.create(Type.CNAME, Name(alias))) for alias in al]
-            addresses = [ResourceRecord(Name(h), Type.A, Class.IN, self.ttl, RecordData.create(Type.A, address)) for address in ad]
+            header.rcode = rcode
 
-            self.sendResponse(Message(header,self.message.questions, aliases + addresses))
+            self.sendResponse(Message(header, self.message.questions, answers, authorities, additionals))
         else:#Send an empty response
             header = Header(ident, 0, 1, 0, 0, 0)
             header.qr = 1
@@ -179,62 +202,369 @@ class RequestHandler(Thread):
         
             
 
+    def add_edns(self, response):
+        """ Add an OPT record to the response if the query had one """
+        if self.message.edns is not None and response.edns is None:
+            response.add_edns(Consts.EDNS_PAYLOAD_SIZE)
+
     def sendResponse(self, response):
+        """ Send a response to the client, truncated if it doesn't fit in a datagram """
+        start = time.perf_counter()
+        self.add_edns(response)
+        data = response.to_bytes()
+        if len(data) > min(self.message.payload_size, Consts.EDNS_PAYLOAD_SIZE):#Too big for UDP, so only send the question with the TC flag set
+            header = Header(response.header.ident, response.header.flags, len(response.questions), 0, 0, 0)
+            header.tc = 1
+            truncated = Message(header, response.questions)
+            self.add_edns(truncated)
+            data = truncated.to_bytes()
+        sending = time.perf_counter()
         with lock:
-            print("[+] - Sending response.")
-            self.socket.sendto(response.to_bytes(), self.clientIP)
-            print("[+] - Done sending.")
+            self.socket.sendto(data, self.clientIP)
+        self.sent(response, start, sending, time.perf_counter(), data)
+
+    def sent(self, response, start, sending, end, data):
+        """ Count a response that was sent and add it to the capture, query log and trace
+
+        Args:
+            response (Message): the response that was sent
+            start (float): perf_counter when serializing the response started
+            sending (float): perf_counter when sending it started
+            end (float): perf_counter when it was sent
+            data (bytes): the response as it was sent
+        """
+        transport = "tcp" if self.tcp else "udp"
+        dns.capture.capture.add(dns.capture.RESPONSE, transport, time.time(), self.clientIP, data)
+        dns.metrics.serialize_time.observe(sending - start)
+        dns.metrics.send_time.observe(end - sending)
+        dns.trace.tracer.record("serialize", start, sending, bytes=len(data))
+        dns.trace.tracer.record("send", sending, end)
+        rcode = RCode(response.header.rcode)
+        dns.metrics.responses.labels(str(rcode)).inc()
+        dns.log.queries.log(self.clientIP, self.message.questions[0] if self.message.questions else None, rcode,
+                time.perf_counter() - self.received, transport)
 
     def run(self):
         """ Run the handler thread """
+        dns.metrics.in_flight.inc()
+        question = self.message.questions[0] if self.message.questions else None
+        trace = dns.trace.tracer.begin("query", client=self.clientIP[0] if self.clientIP else None, transport="tcp" if self.tcp else "udp",
+                qname=str(question.qname) if question else None, qtype=str(question.qtype) if question else None)
         try:
             self.handle_request()
         except socket.error as e:
-            print("[-] - Error handling request: " + str(e))
+            dns.log.logger.warning("Error handling request: %s", e)
+        finally:
+            dns.metrics.in_flight.dec()
+            if trace is not None:
+                dns.trace.tracer.finish(trace)
+
+
+class TCPRequestHandler(RequestHandler):
+    """ A handler for requests received over a TCP connection """
+
+    tcp = True
+
+    def __init__(self, connection, clientIP, ttl, message, resolver, catalog, send_lock):
+        """ Initialize the handler thread
+
+        Args:
+            send_lock (Lock): lock shared by all handlers writing to the connection
+        """
+        super(TCPRequestHandler, self).__init__(connection, clientIP, ttl, message, resolver, catalog)
+        self.send_lock = send_lock
+
+    def sendResponse(self, response):
+        """ Send a response over the connection """
+        start = time.perf_counter()
+        self.add_edns(response)
+        data = response.to_bytes()
+        sending = time.perf_counter()
+        with self.send_lock:
+            dns.tcp.send_message(self.socket, data)
+        self.sent(response, start, sending, time.perf_counter(), data)
+
+
+class TCPConnectionHandler(Thread):
+    """ A handler for a TCP connection to the DNS server """
+
+    def __init__(self, connection, clientIP, server):
+        """ Initialize the handler thread
+
+        Args:
+            connection (socket): the accepted connection
+            clientIP ((str, int)): address of the client
+            server (Server): the server that accepted the connection
+        """
+        super(TCPConnectionHandler, self).__init__()
+        self.daemon = True
+        self.connection = connection
+        self.clientIP = clientIP
+        self.server = server
+        self.send_lock = Lock()
+
+    def run(self):
+        """ Answer queries until the client closes the connection or stays idle too long
+
+        Queries are handled concurrently, so responses to pipelined queries
+        may be sent in a different order than the queries came in.
+        """
+        self.connection.settimeout(Consts.TCP_IDLE_TIMEOUT)
+        handlers = []
+        try:
+            while not self.server.done:
+                data = dns.tcp.recv_message(self.connection)
+                if data is None:
+                    break
+
+                dns.metrics.queries.labels("tcp").inc()
+                dns.capture.capture.add(dns.capture.QUERY, "tcp", time.time(), self.clientIP, data)
+                start = time.perf_counter()
+                try:
+                    message = Message.from_bytes(data)
+                except:
+                    dns.log.logger.warning("Received invalid data.")
+                    break
+                dns.metrics.parse_time.observe(time.perf_counter() - start)
+
+                rh = TCPRequestHandler(self.connection, self.clientIP, self.server.ttl, message,
+                        self.server.resolver, self.server.catalog, self.send_lock)
+                rh.start()
+                handlers = [handler for handler in handlers if handler.is_alive()] + [rh]
+        except socket.error:
+            pass
+        finally:
+            for handler in handlers:
+                handler.join()
+            self.connection.close()
+
+
+class ZoneWatcher(Thread):
+    """ Polls the zone file and reloads the server when it changes """
+
+    def __init__(self, server, interval=Consts.ZONE_WATCH_INTERVAL):
+        """ Initialize the watcher thread
+
+        Args:
+            server (Server): the server whose catalog is reloaded
+            interval (float): seconds between two checks of the zone file
+        """
+        super(ZoneWatcher, self).__init__()
+        self.daemon = True
+        self.server = server
+        self.interval = interval
+        self.mtime = self.get_mtime()
+
+    def get_mtime(self):
+        try:
+            return os.stat(self.server.zone_file).st_mtime
+        except OSError:
+            return None
+
+    def run(self):
+        """ Run the watcher thread """
+        while not self.server.done:
+            time.sleep(self.interval)
+            mtime = self.get_mtime()
+            if mtime is not None and mtime != self.mtime:
+                self.mtime = mtime
+                self.server.reload()
 
 
 class Server(object):
     """ A recursive DNS server """
 
-    def __init__(self, port, caching, ttl):
+    def __init__(self, port, caching, ttl, zone_file=Consts.ZONE_FILE, forwarders=None, policy=Consts.FORWARD_POLICY,
+            metrics_port=None, rate_limiter=None, minimise=Consts.QNAME_MINIMISATION):
         """ Initialize the server
         
         Args:
             port (int): port that server is listening on
             caching (bool): server uses resolver with caching if true
             ttl (int): ttl for records (if > 0) of cache
+            zone_file (str): master file the catalog is built from
+            forwarders ([str]): IP addresses of upstream resolvers, forwarding mode is used if given
+            policy (str): load balancing policy for the forwarders
+            metrics_port (int): port on localhost the metrics are served on, None to not serve them
+            rate_limiter (ResponseRateLimiter): limits the responses over UDP, None to not limit them
+            minimise (bool): use QNAME minimisation when resolving (RFC 9156)
         """
         self.caching = caching
+        self.rate_limiter = rate_limiter
+        if rate_limiter is not None and rate_limiter.zones is None:
+            rate_limiter.zones = self.enclosing_zone
         self.ttl = ttl
         self.port = port
         self.done = False
-        self.resolver = dns.resolver.Resolver(Consts.DEFAULT_TIMEOUT, self.caching, self.ttl)
+        self.resolver = dns.resolver.Resolver(Consts.DEFAULT_TIMEOUT, self.caching, self.ttl,
+                forwarders=forwarders, policy=policy, minimise=minimise)
 
-        self.zone = dns.zone.Zone()
-        self.zone.read_master_file()
+        #Reloads replace the catalog as a whole, so handlers need no lock to read it
+        self.zone_file = zone_file
+        self.reload_lock = Lock()
+        self.reload_duration = 0.0
+        try:
+            self.catalog = self.load_catalog()
+        except IOError as e:
+            dns.log.logger.error("An error has occured while reading the zone from file: %s - %s", self.zone_file, e)
+            self.catalog = dns.zone.Catalog()
 
-        self.catalog = dns.zone.Catalog()
-        self.catalog.add_zone("ru.nl", self.zone)
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.socket.bind(('', self.port))
+
+            self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.tcp_socket.bind(('', self.port))
+            self.tcp_socket.listen(socket.SOMAXCONN)
         except PermissionError:
-            print("Run as root")
+            dns.log.logger.critical("Run as root")
             exit()
 
+        self.sampler = None
+        self.metrics_server = None
+        if metrics_port is not None:
+            self.metrics_server = dns.metrics.registry.serve(metrics_port)
+            dns.log.logger.info("Serving metrics on http://127.0.0.1:%d/metrics", self.metrics_server.server_address[1])
+
+    def load_catalog(self, version=0):
+        """ Build a new catalog from the zone file
+
+        Args:
+            version (int): version number given to the new catalog
+
+        Returns:
+            catalog (Catalog): the freshly parsed catalog
+        """
+        zone = dns.zone.Zone()
+        with open(self.zone_file) as infile:
+            zone.load_and_parse(infile.read())
+
+        catalog = dns.zone.Catalog(version)
+        catalog.add_zone("ru.nl", zone)
+        return catalog
+
+    def reload(self):
+        """ Rebuild the catalog from the zone file and swap it in
+
+        Handlers that are already running keep the catalog they were started
+        with. If the zone file can't be parsed the old catalog stays in use.
+
+        Returns:
+            A boolean that tells if the new catalog was swapped in
+        """
+        with self.reload_lock:
+            start = time.time()
+            try:
+                catalog = self.load_catalog(self.catalog.version + 1)
+            except (IOError, ValueError, KeyError, IndexError) as e:
+                dns.log.logger.error("Zone reload failed, keeping catalog version %d: %s", self.catalog.version, e)
+                return False
+
+            self.catalog = catalog
+            self.reload_duration = time.time() - start
+            dns.log.logger.info("Loaded catalog version %d in %.3fs.", catalog.version, self.reload_duration)
+            return True
+
+    def reload_in_background(self):
+        """ Start a reload without blocking the caller """
+        Thread(target=self.reload, daemon=True).start()
+
+    def watch_zone_file(self, interval=Consts.ZONE_WATCH_INTERVAL):
+        """ Reload the catalog whenever the zone file changes on disk """
+        ZoneWatcher(self, interval).start()
+
+    def profile(self, duration=Consts.PROFILE_DURATION, path=None):
+        """ Start a sampling profile of the server in the background
+
+        Args:
+            duration (float): seconds the profile runs
+            path (str): file the profile is written to, see Sampler
+
+        Returns:
+            A boolean that tells if the profile was started, False if one is already running
+        """
+        if self.sampler is not None and self.sampler.is_alive():
+            dns.log.logger.warning("A profile is already running.")
+            return False
+        self.sampler = dns.trace.Sampler(duration, path)
+        self.sampler.start()
+        dns.log.logger.info("Profiling for %ds, writing to %s", duration, self.sampler.path)
+        return True
+
+    def serve_tcp(self):
+        """ Accept TCP connections, each is handled on its own thread """
+        while not self.done:
+            try:
+                connection, addr = self.tcp_socket.accept()
+            except OSError:#The socket was closed by shutdown
+                break
+            TCPConnectionHandler(connection, addr, self).start()
+
+    def enclosing_zone(self, qname):
+        """ The zone a name is in, as far as the server knows without asking anyone
+
+        Args:
+            qname (str): the name, lower case
+
+        Returns:
+            zone (str): the zone of the catalog the name is in, else the closest zone cut in the cache, None if neither is known
+        """
+        origin, _ = self.catalog.find_zone(qname)
+        if origin is not None:
+            return origin.rstrip(".").lower() + "."
+        if self.caching:
+            return self.resolver.cache.find_zone_cut(qname, Class.IN)
+        return None
+
+    def rate_limited(self, message, addr):
+        """ Check a query against the response rate limit
+
+        A query over the limit that slips is answered right away with an
+        empty response with the TC flag set, the others are dropped.
+
+        Args:
+            message (Message): the query
+            addr ((str, int)): address of the client
+
+        Returns:
+            A boolean that tells if the query must not be handled
+        """
+        qname = str(message.questions[0].qname).lower() if message.questions else ""
+        action = self.rate_limiter.check(addr[0], qname)
+        if action == dns.ratelimit.ALLOW:
+            return False
+        if action == dns.ratelimit.SLIP:
+            header = Header(message.header.ident, 0, len(message.questions), 0, 0, 0)
+            header.qr = 1
+            header.tc = 1
+            header.rd = message.header.rd
+            data = Message(header, message.questions).to_bytes()
+            with lock:
+                self.socket.sendto(data, addr)
+        return True
+
     def serve(self):
         """ Start serving request """
         
-        print("[+] - DNS Server up and running.")
+        Thread(target=self.serve_tcp, daemon=True).start()
+        dns.log.logger.info("DNS Server up and running.")
         
         while not self.done:
-            data, addr = self.socket.recvfrom(1024)
+            data, addr = self.socket.recvfrom(Consts.EDNS_PAYLOAD_SIZE)
 
+            dns.metrics.queries.labels("udp").inc()
+            dns.capture.capture.add(dns.capture.QUERY, "udp", time.time(), addr, data)
+            start = time.perf_counter()
             try:
                 message = Message.from_bytes(data)
             except:
-                print("[-] - Received invalid data.")
+                dns.log.logger.warning("Received invalid data.")
+                continue
+            dns.metrics.parse_time.observe(time.perf_counter() - start)
+
+            if self.rate_limiter is not None and self.rate_limited(message, addr):
                 continue
 
             rh = RequestHandler(self.socket, addr, self.ttl, message, self.resolver, self.catalog)
@@ -242,8 +572,11 @@ class Server(object):
 
     def shutdown(self):
         """ Shutdown the server """
-        print("[*] - Shutting down.")
+        dns.log.logger.info("Shutting down.")
         self.done = True
         self.socket.close()
+        self.tcp_socket.close()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
         self.resolver.save_cache()
-        print("[+] - Shut down complete. May your framerates be high and your temperatures low.")
+        dns.log.logger.info("Shut down complete. May your framerates be high and your temperatures low.")
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+""" Fake authoritative nameservers
+
+A small hierarchy of authoritative servers on loopback addresses that stands
+in for the root, a TLD and a leaf zone, so the resolver and server can be
+exercised without the internet. The leaf zone makes up its answers from the
+query name:
+
+    h<N>.<leaf>           an A record derived from N
+    c<D>-<N>.<leaf>       a chain of D CNAMEs that ends at an A record
+    anything else         NXDOMAIN
+"""
+
+import re
+import socket
+import struct
+import threading
+
+import dns.consts as Consts
+from dns.classes import Class
+from dns.message import Message, Header
+from dns.name import Name
+from dns.rcodes import RCode
+from dns.resource import ResourceRecord, ARecordData, CNAMERecordData, NSRecordData, SOARecordData
+from dns.rtypes import Type
+
+
+class StubServer(threading.Thread):
+    """ An authoritative server for a single zone, with delegations to child zones """
+
+    def __init__(self, address, origin, delegations=None, synthesize=False, ttl=Consts.STUB_TTL):
+        """ Initialize the stub server
+
+        Args:
+            address ((str, int)): address the server listens on
+            origin (str): the zone the server is authoritative for
+            delegations ({str: (str, str)}): child zone to the name and address of its nameserver
+            synthesize (bool): make up answers for names in the zone as described above
+            ttl (int): ttl of all records
+        """
+        super(StubServer, self).__init__()
+        self.daemon = True
+        self.address = address
+        self.origin = origin.rstrip('.').lower() + '.'
+        self.delegations = {zone.rstrip('.').lower() + '.': ns for zone, ns in (delegations or {}).items()}
+        self.synthesize = synthesize
+        self.ttl = ttl
+        self.queries = 0
+        self.soa = ResourceRecord(Name(self.origin), Type.SOA, Class.IN, ttl,
+                SOARecordData(Name("ns." + self.origin), Name("hostmaster." + self.origin), 1, 3600, 600, 86400, ttl))
+        self.socket = None
+
+    def in_zone(self, name, zone):
+        """ Check if name is zone or below it """
+        return zone == '.' or name == zone or name.endswith('.' + zone)
+
+    def synthesized(self, name):
+        """ The records for a name in the leaf zone, None if the name doesn't exist """
+        label = name[:-len(self.origin) - 1] if name != self.origin else ''
+        match = re.match(r"^h(\d+)$", label)
+        if match:
+            number = int(match.group(1))
+            address = "10.{}.{}.{}".format((number >> 16) & 255, (number >> 8) & 255, number & 255)
+            return [ResourceRecord(Name(name), Type.A, Class.IN, self.ttl, ARecordData(address))]
+        match = re.match(r"^c(\d+)-(\d+)$", label)
+        if match:
+            depth, number = int(match.group(1)), match.group(2)
+            target = "c{}-{}.{}".format(depth - 1, number, self.origin) if depth > 1 else "h{}.{}".format(number, self.origin)
+            return [ResourceRecord(Name(name), Type.CNAME, Class.IN, self.ttl, CNAMERecordData(Name(target)))]
+        return None
+
+    def answer(self, query):
+        """ Make the response to a query
+
+        Args:
+            query (Message): the query
+
+        Returns:
+            response (Message): the response
+        """
+        question = query.questions[0]
+        name = str(question.qname).lower()
+        answers, authorities, additionals = [], [], []
+        rcode, aa = RCode.NoError, 1
+
+        for zone, (nsname, nsaddress) in self.delegations.items():
+            if self.in_zone(name, zone) and zone != self.origin:#Refer to the child zone
+                aa = 0
+                authorities.append(ResourceRecord(Name(zone), Type.NS, Class.IN, self.ttl, NSRecordData(Name(nsname))))
+                additionals.append(ResourceRecord(Name(nsname), Type.A, Class.IN, self.ttl, ARecordData(nsaddress)))
+                break
+        else:
+            records = self.synthesized(name) if self.synthesize else None
+            if name == self.origin:
+                records = [self.soa] + [ResourceRecord(Name(self.origin), Type.NS, Class.IN, self.ttl, NSRecordData(Name("ns." + self.origin)))]
+            if records is None:
+                rcode = RCode.NXDomain
+                authorities.append(self.soa)
+            else:
+                answers = [record for record in records if record.type_ == question.qtype or record.type_ == Type.CNAME]
+                if not answers:
+                    authorities.append(self.soa)
+
+        header = Header(query.header.ident, 0, 1, len(answers), len(authorities), len(additionals))
+        header.qr = 1
+        header.aa = aa
+        header.rd = query.header.rd
+        header.rcode = rcode
+        return Message(header, query.questions, answers, authorities, additionals)
+
+    def bind(self):
+        """ Open the socket, so queries can be sent before the thread runs """
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(self.address)
+
+    def run(self):
+        """ Run the stub server """
+        if self.socket is None:
+            self.bind()
+        while True:
+            try:
+                data, address = self.socket.recvfrom(Consts.EDNS_PAYLOAD_SIZE)
+                query = Message.from_bytes(data)
+            except (ValueError, struct.error):
+                continue
+            except OSError:#The socket was closed
+                return
+            if query.header.qr or len(query.questions) != 1:
+                continue
+            self.queries += 1
+            self.socket.sendto(self.answer(query).to_bytes(), address)
+
+    def close(self):
+        """ Stop the stub server """
+        if self.socket is not None:
+            self.socket.close()
+
+
+def start_hierarchy(port, root="127.0.0.2", tld="127.0.0.3", leaf="127.0.0.4", tld_name="bench.", leaf_name="zone.bench."):
+    """ Start a root, TLD and leaf server that all listen on port
+
+    Args:
+        port (int): port the servers listen on, the resolver must use it as serverport
+        root (str): loopback address of the root server
+        tld (str): loopback address of the TLD server
+        leaf (str): loopback address of the leaf server
+
+    Returns:
+        servers ([StubServer]): the root, TLD and leaf server
+    """
+    servers = [
+        StubServer((root, port), ".", {tld_name: ("ns." + tld_name, tld)}),
+        StubServer((tld, port), tld_name, {leaf_name: ("ns." + leaf_name, leaf)}),
+        StubServer((leaf, port), leaf_name, synthesize=True),
+    ]
+    for server in servers:
+        server.bind()
+        server.start()
+    return servers
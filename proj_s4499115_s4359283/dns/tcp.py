@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+""" DNS over TCP
+
+Messages sent over TCP are prefixed with a two byte length field. See section
+4.2.2 of RFC 1035.
+"""
+
+import socket
+import struct
+import threading
+
+import dns.consts as Consts
+
+
+def send_message(sock, data):
+    """ Send a message over a TCP connection
+
+    Args:
+        sock (socket): connected TCP socket
+        data (bytes): the message in wire format
+    """
+    sock.sendall(struct.pack("!H", len(data)) + data)
+
+
+def recv_exactly(sock, length):
+    """ Read exactly length bytes from a TCP connection
+
+    Returns:
+        data (bytes): the bytes read, or None if the connection was closed first
+    """
+    data = b""
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def recv_message(sock):
+    """ Read one message from a TCP connection
+
+    Returns:
+        data (bytes): the message in wire format, or None if the connection was closed
+    """
+    prefix = recv_exactly(sock, 2)
+    if prefix is None:
+        return None
+    return recv_exactly(sock, struct.unpack("!H", prefix)[0])
+
+
+class ConnectionPool(object):
+    """ A pool of idle TCP connections, kept per server """
+
+    def __init__(self, size=Consts.TCP_POOL_SIZE):
+        """ Initialize the pool
+
+        Args:
+            size (int): maximum number of idle connections kept per server
+        """
+        self.size = size
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, address, timeout):
+        """ Get a connection to a server, reusing an idle one if possible
+
+        Args:
+            address ((str, int)): address of the server
+            timeout (float): socket timeout of the connection
+
+        Returns:
+            sock (socket): the connection,
+            A boolean that tells if the connection was reused
+        """
+        with self.lock:
+            connections = self.idle.get(address)
+            if connections:
+                sock = connections.pop()
+                sock.settimeout(timeout)
+                return sock, True
+        return socket.create_connection(address, timeout), False
+
+    def release(self, address, sock):
+        """ Give a connection back to the pool after a successful exchange """
+        with self.lock:
+            connections = self.idle.setdefault(address, [])
+            if len(connections) < self.size:
+                connections.append(sock)
+                return
+        sock.close()
+
+    def close(self):
+        """ Close all idle connections """
+        with self.lock:
+            for connections in self.idle.values():
+                for sock in connections:
+                    sock.close()
+            self.idle = {}
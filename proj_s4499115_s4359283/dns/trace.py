@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+""" Tracing and profiling
+
+When tracing is enabled (Tracer.threshold isn't None), every query gets a
+tree of spans: the zone lookup, cache probes, each round of upstream queries
+with the server and round trip time of every reply, the resolutions of CNAME
+targets and nameserver names, and the serialization and sending of the
+response. Queries that take longer than the threshold are written to the
+slow query log as JSON. Spans are kept per thread, so work a query hands off
+to another thread (like a stale answer's background refresh) isn't part of
+its tree. Without tracing, a span costs a thread local lookup.
+
+A Sampler takes a statistical profile of the whole process for a limited
+time, by looking at the stacks of all threads at a fixed interval. The
+result is written in the folded format of flame graph tools.
+"""
+
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+import dns.consts as Consts
+import dns.log
+
+
+class Span(object):
+    """ A timed step in the handling of a query """
+
+    def __init__(self, name, attrs, start=None, end=None):
+        """ Initialize the span
+
+        Args:
+            name (str): what is done in the step
+            attrs (dict): details of the step, like the server that is asked
+            start (float): perf_counter when the step started, now if not given
+            end (float): perf_counter when the step ended, None while it runs
+        """
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter() if start is None else start
+        self.end = end
+        self.children = []
+
+    def duration(self):
+        """ Seconds the step took, so far if it still runs """
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin=None):
+        """ The span and its children as a dict, times are milliseconds since origin """
+        origin = self.start if origin is None else origin
+        dct = {"name" : self.name, "at" : round((self.start - origin) * 1000, 3), "ms" : round(self.duration() * 1000, 3)}
+        dct.update(self.attrs)
+        if self.children:
+            dct["children"] = [child.to_dict(origin) for child in self.children]
+        return dct
+
+
+class ActiveSpan(object):
+    """ Context manager that runs a span on the span stack of its thread """
+
+    def __init__(self, stack, span):
+        """ Initialize the context manager
+
+        Args:
+            stack ([Span]): the spans that are running on this thread, the root first
+            span (Span): the span that is run
+        """
+        self.stack = stack
+        self.span = span
+
+    def __enter__(self):
+        self.stack[-1].children.append(self.span)
+        self.stack.append(self.span)
+        return self.span
+
+    def __exit__(self, *exc):
+        self.span.end = time.perf_counter()
+        self.stack.pop()
+        return False
+
+
+class NullSpan(object):
+    """ Context manager used when the thread isn't tracing """
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer(object):
+    """ Builds the span trees of queries and logs the slow ones """
+
+    def __init__(self, threshold=None):
+        """ Initialize the tracer
+
+        Args:
+            threshold (float): seconds after which a query is slow, None disables tracing
+        """
+        self.threshold = threshold
+        self.local = threading.local()
+
+    def begin(self, name, **attrs):
+        """ Start the trace of a query on this thread
+
+        Returns:
+            root (Span): the root span, None if tracing is disabled
+        """
+        if self.threshold is None:
+            return None
+        root = Span(name, attrs)
+        self.local.stack = [root]
+        return root
+
+    def finish(self, root):
+        """ End the trace that begin started, and log it if it was slow """
+        self.local.stack = None
+        root.end = time.perf_counter()
+        if root.duration() >= self.threshold:
+            dns.log.slow_logger.warning("Slow query: %s", json.dumps(root.to_dict(), separators=(",", ":")))
+
+    def span(self, name, **attrs):
+        """ A context manager that records a step as a child of the current one """
+        stack = getattr(self.local, "stack", None)
+        if not stack:
+            return NULL_SPAN
+        return ActiveSpan(stack, Span(name, attrs))
+
+    def record(self, name, start, end, **attrs):
+        """ Add a step that was already timed as a child of the current one """
+        stack = getattr(self.local, "stack", None)
+        if stack:
+            stack[-1].children.append(Span(name, attrs, start, end))
+
+    def event(self, name, **attrs):
+        """ Add something that happened, without a duration, to the current step """
+        now = time.perf_counter()
+        self.record(name, now, now, **attrs)
+
+
+class Sampler(threading.Thread):
+    """ Profiles the process by sampling the stacks of all threads """
+
+    def __init__(self, duration=Consts.PROFILE_DURATION, path=None, interval=Consts.PROFILE_INTERVAL):
+        """ Initialize the sampler thread
+
+        Args:
+            duration (float): seconds the profile runs
+            path (str): file the profile is written to, profile-<time>.folded by default
+            interval (float): seconds between two samples
+        """
+        super(Sampler, self).__init__()
+        self.daemon = True
+        self.duration = duration
+        self.path = path if path is not None else "profile-{}.folded".format(int(time.time()))
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+
+    @staticmethod
+    def fold(frame):
+        """ A stack as function names from the outermost to the innermost, separated by ; """
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def sample(self):
+        """ Count the current stack of every other thread """
+        for ident, frame in sys._current_frames().items():
+            if ident != self.ident:
+                self.stacks[self.fold(frame)] += 1
+        self.samples += 1
+
+    def run(self):
+        """ Sample until the duration is over and write the profile """
+        deadline = time.time() + self.duration
+        while time.time() < deadline:
+            self.sample()
+            time.sleep(self.interval)
+        self.write()
+        dns.log.logger.info("Wrote a profile of %d samples to %s", self.samples, self.path)
+
+    def write(self):
+        """ Write the profile, a line per stack with the number of times it was seen """
+        with open(self.path, "w") as outfile:
+            for stack, count in self.stacks.most_common():
+                outfile.write("{} {}\n".format(stack, count))
+
+
+#The tracer of the server, disabled until a threshold is set
+tracer = Tracer()
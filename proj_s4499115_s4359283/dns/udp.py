@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+""" Upstream DNS over UDP
+
+Instead of opening a socket for every query, queries to nameservers are sent
+from a small pool of sockets bound to random source ports. One thread per
+socket reads the responses and hands them to the waiting query, matched on
+the socket it was sent from, server address, port, identifier and question.
+After a number of queries a socket is replaced by one on a new random port,
+so an attacker can't learn the ports in use and spoof responses to them.
+"""
+
+import collections
+import queue
+import random
+import socket
+import struct
+import threading
+
+import dns.consts as Consts
+from dns.message import Message
+
+
+#Ports and sockets are picked with the OS's random source, which can't be predicted from earlier picks
+rng = random.SystemRandom()
+
+
+class SocketPool(object):
+    """ A pool of UDP sockets shared by all upstream queries """
+
+    shared_pool = None
+    shared_lock = threading.Lock()
+
+    def __init__(self, size=Consts.UDP_POOL_SIZE, queries_per_socket=Consts.UDP_SOCKET_QUERIES):
+        """ Initialize the pool and start its receiver threads
+
+        Args:
+            size (int): number of sockets in the pool
+            queries_per_socket (int): number of queries sent from a socket before it is replaced
+        """
+        self.waiters = {}#Key of a query to the (replies, socket) pairs waiting for its response
+        self.expected = {}#Socket to a count of the server addresses it awaits responses from
+        self.uses = {}#Socket to the number of queries sent from it
+        self.addresses = {}
+        self.queries_per_socket = queries_per_socket
+        self.lock = threading.Lock()
+        self.sockets = []
+        with self.lock:#The receivers mustn't find their sockets missing from the pool
+            self.sockets = [self.start_socket() for _ in range(size)]
+
+    @classmethod
+    def shared(cls):
+        """ Get the pool that is shared by all resolvers in this process """
+        with cls.shared_lock:
+            if cls.shared_pool is None:
+                cls.shared_pool = cls()
+            return cls.shared_pool
+
+    @staticmethod
+    def open_socket():
+        """ Open a UDP socket bound to a random unprivileged port """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(Consts.UDP_POLL_INTERVAL)
+        for _ in range(Consts.UDP_BIND_ATTEMPTS):
+            try:
+                sock.bind(('', rng.randint(1024, 65535)))
+                return sock
+            except OSError:#Port is in use, try another one
+                continue
+        sock.bind(('', 0))
+        return sock
+
+    def start_socket(self):
+        """ Open a socket and start the thread that receives its responses """
+        sock = self.open_socket()
+        self.expected[sock] = collections.Counter()
+        self.uses[sock] = 0
+        threading.Thread(target=self.receive, args=(sock,), daemon=True).start()
+        return sock
+
+    @staticmethod
+    def key(address, message):
+        """ Key that matches a response to the query it answers """
+        question = message.questions[0]
+        return (address[0], address[1], message.header.ident,
+                str(question.qname).lower(), question.qtype, question.qclass)
+
+    def resolve_address(self, address):
+        """ Turn the host of an address into the IP address responses come from """
+        host, port = address
+        with self.lock:
+            if host in self.addresses:
+                return (self.addresses[host], port)
+        ip = socket.gethostbyname(host)
+        with self.lock:
+            self.addresses[host] = ip
+        return (ip, port)
+
+    def send(self, query, address, replies):
+        """ Send a query, its response will be put in replies
+
+        Args:
+            query (Message): the query that is to be sent
+            address ((str, int)): address of the server
+            replies (Queue): queue that receives (address, response) tuples
+        """
+        address = self.resolve_address(address)
+        key = self.key(address, query)
+        with self.lock:
+            index = rng.randrange(len(self.sockets))
+            sock = self.sockets[index]
+            self.waiters.setdefault(key, []).append((replies, sock))
+            self.expected[sock][address] += 1
+            self.uses[sock] += 1
+            if self.uses[sock] >= self.queries_per_socket:#Its receiver closes it once the queries sent from it are done
+                self.sockets[index] = self.start_socket()
+        sock.sendto(query.to_bytes(), address)
+
+    def cancel(self, query, address, replies):
+        """ Stop waiting for the response to a query """
+        address = self.resolve_address(address)
+        key = self.key(address, query)
+        with self.lock:
+            waiting = self.waiters.get(key, [])
+            for waiter in [waiter for waiter in waiting if waiter[0] is replies]:
+                waiting.remove(waiter)
+                expected = self.expected[waiter[1]]
+                expected[address] -= 1
+                if expected[address] <= 0:
+                    del expected[address]
+            if not waiting:
+                self.waiters.pop(key, None)
+
+    def query(self, query, address, timeout):
+        """ Send a query and wait for its response
+
+        Args:
+            query (Message): the query that is to be sent
+            address ((str, int)): address of the server
+            timeout (float): seconds to wait for the response
+
+        Returns:
+            response (Message): the response, None if there was none in time
+        """
+        replies = queue.Queue()
+        self.send(query, address, replies)
+        try:
+            return replies.get(timeout=timeout)[1]
+        except queue.Empty:
+            return None
+        finally:
+            self.cancel(query, address, replies)
+
+    def retired(self, sock):
+        """ Check whether a socket was replaced and has no queries left to answer """
+        return sock not in self.sockets and not self.expected[sock]
+
+    def receive(self, sock):
+        """ Read responses from a socket and route them to their queries
+
+        Datagrams are only parsed when they come from a server that a query
+        was sent to from this socket. The socket is closed once it was
+        replaced and the queries sent from it are done.
+        """
+        while True:
+            with self.lock:
+                if self.retired(sock):
+                    del self.expected[sock]
+                    del self.uses[sock]
+                    sock.close()
+                    return
+            try:
+                data, address = sock.recvfrom(Consts.EDNS_PAYLOAD_SIZE)
+            except socket.timeout:
+                continue
+            except OSError:
+                if sock.fileno() == -1:#The socket was closed
+                    return
+                continue
+            with self.lock:
+                if address not in self.expected[sock]:#Nothing was asked of this sender from this socket
+                    continue
+            try:
+                response = Message.from_bytes(data)
+            except (ValueError, struct.error):#Not a DNS message, or cut off
+                continue
+            if not response.header.qr or not response.questions:
+                continue
+
+            with self.lock:
+                waiting = [replies for replies, sent_from in self.waiters.get(self.key(address, response), [])
+                           if sent_from is sock]
+            for replies in waiting:
+                replies.put((address, response))
@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 import re
+import threading
+import time
 import dns.zone
 import dns.consts as Consts
+import dns.log
 from dns.classes import Class
 from dns.rtypes import Type
-from dns.resource import RecordData, ResourceRecord
+from dns.resource import RecordData, ResourceRecord, SOARecordData, MXRecordData, TXTRecordData
 from dns.name import Name
+from dns.rcodes import RCode
 
 """ Zones of domain name space 
 
@@ -19,9 +23,15 @@ These classes are merely a suggestion, feel free to use something else.
 class Catalog(object):
     """ A catalog of zones """
 
-    def __init__(self):
-        """ Initialize the catalog """
+    def __init__(self, version=0):
+        """ Initialize the catalog
+
+        Args:
+            version (int): version number, increased on every reload
+        """
         self.zones = {}
+        self.version = version
+        self.loaded_at = time.time()
 
     def add_zone(self, name, zone):
         """ Add a new zone to the catalog
@@ -32,6 +42,44 @@ class Catalog(object):
         """
         self.zones[name] = zone
 
+    def find_zone(self, dname):
+        """ Find the zone that is closest to a domain name
+
+        Args:
+            dname (str): domain name
+
+        Returns:
+            origin (str): root domain name of the zone, or None,
+            zone (Zone): the zone containing dname, or None
+        """
+        labels = [label.lower() for label in Name(str(dname)).labels]
+        best_origin, best_zone, best_length = None, None, -1
+        for origin, zone in self.zones.items():
+            origin_labels = [label.lower() for label in Name(origin).labels]
+            length = len(origin_labels)
+            if length <= len(labels) and length > best_length and \
+                    labels[len(labels) - length:] == origin_labels:
+                best_origin, best_zone, best_length = origin, zone, length
+        return best_origin, best_zone
+
+
+class JournalEntry(object):
+    """ A change between two versions of a zone """
+
+    def __init__(self, old_serial, serial, deleted, added):
+        """ Initialize the JournalEntry
+
+        Args:
+            old_serial (int): serial of the zone before the change
+            serial (int): serial of the zone after the change
+            deleted ([ResourceRecord]): records removed by the change
+            added ([ResourceRecord]): records added by the change
+        """
+        self.old_serial = old_serial
+        self.serial = serial
+        self.deleted = deleted
+        self.added = added
+
 
 class Zone(object):
     """ A zone in the domain name space """
@@ -39,6 +87,15 @@ class Zone(object):
     def __init__(self):
         """ Initialize the Zone """
         self.records = {}
+        self.names = {}#The name tree: every owner name and the names above it, to the number of owner names at or below it
+        self.soa = None
+        self.journal = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(name):
+        """ Normalize a domain name for use as a key in records """
+        return str(Name(str(name))).lower()
 
     def add_node(self, name, record_set):
         """ Add a record set to the zone
@@ -47,7 +104,272 @@ class Zone(object):
             name (str): domain name
             record_set ([ResourceRecord]): resource records
         """
-        self.records[name] = record_set
+        #Record sets are replaced instead of modified, so readers never see a half updated set
+        key = self.key(name)
+        if key not in self.records:
+            for ancestor in self.ancestors(key):
+                self.names[ancestor] = self.names.get(ancestor, 0) + 1
+        self.records[key] = record_set
+        for record in record_set:
+            if record.type_ == Type.SOA:
+                self.soa = record
+
+    def add_record(self, record):
+        """ Add a single resource record to the zone """
+        self.add_node(record.name, self.get_records(record.name) + [record])
+
+    def remove_record(self, record):
+        """ Remove a resource record from the zone, ignoring its ttl """
+        rdata = record.rdata.to_dict()
+        record_set = [other for other in self.get_records(record.name) if
+                not (other.type_ == record.type_ and other.class_ == record.class_ and other.rdata.to_dict() == rdata)]
+        if record_set:
+            self.add_node(record.name, record_set)
+        elif self.records.pop(self.key(record.name), None) is not None:
+            for ancestor in self.ancestors(self.key(record.name)):
+                self.names[ancestor] -= 1
+                if not self.names[ancestor]:
+                    del self.names[ancestor]
+
+    def get_records(self, name):
+        """ Get the record set of a domain name
+
+        Args:
+            name (str): domain name
+
+        Returns:
+            record_set ([ResourceRecord]): the resource records owned by name
+        """
+        return self.records.get(self.key(name), [])
+
+    @staticmethod
+    def ancestors(key):
+        """ A normalized name and all names above it, the name itself first """
+        labels = key.rstrip('.').split('.')
+        return [".".join(labels[i:]) + "." for i in range(len(labels))]
+
+    @staticmethod
+    def in_zone(key, origin):
+        """ Check if a normalized name is origin or below it """
+        return key == origin or key.endswith("." + origin)
+
+    def find_cut(self, key, origin):
+        """ Find the highest delegation to another zone above or at a name
+
+        Returns:
+            cut (str): the name that has the NS records of the delegation, None if there is none
+        """
+        for ancestor in reversed(self.ancestors(key)):
+            if ancestor != origin and self.in_zone(ancestor, origin) and \
+                    any(record.type_ == Type.NS for record in self.records.get(ancestor, [])):
+                return ancestor
+        return None
+
+    def find_records(self, key):
+        """ Find the records of a name, synthesizing them from a wildcard if there are none
+
+        See section 4.3.3 of RFC 1034 and RFC 4592.
+
+        Returns:
+            records ([ResourceRecord]): the records owned by the name,
+            A boolean that tells if the name exists
+        """
+        if key in self.records:
+            return self.records[key], True
+        if key in self.names:#An empty non-terminal
+            return [], True
+        for encloser in self.ancestors(key)[1:]:
+            if encloser in self.names:#The closest encloser
+                wildcard = self.records.get("*." + encloser)
+                if wildcard is None:
+                    return [], False
+                return [ResourceRecord(Name(key), record.type_, record.class_, record.ttl, record.rdata) for record in wildcard], True
+        return [], False
+
+    def negative_soa(self):
+        """ The SOA record of the zone with the ttl of negative answers (section 3 of RFC 2308) """
+        if self.soa is None:
+            return []
+        soa = self.soa_with_serial(self.soa.rdata.serial)
+        soa.ttl = min(soa.ttl, soa.rdata.minimum)
+        return [soa]
+
+    def lookup(self, qname, qtype, origin):
+        """ Answer a question authoritatively, see section 4.3.2 of RFC 1034
+
+        Questions for delegated names get a referral, names that exist but
+        don't have records of the asked type get NODATA and names that don't
+        exist get NXDOMAIN, both with the SOA record in the authority section.
+        Wildcards are used for names that don't exist and CNAMEs to other
+        names in the zone are followed.
+
+        Args:
+            qname (str): the asked name, in the zone
+            qtype (Type): the asked type
+            origin (str): the name of the zone
+
+        Returns:
+            rcode (RCode): rcode of the answer,
+            answers ([ResourceRecord]): the answer section,
+            authorities ([ResourceRecord]): the authority section,
+            additionals ([ResourceRecord]): the additional section,
+            A boolean that tells if the answer is authoritative
+        """
+        key = self.key(qname)
+        origin = self.key(origin)
+        answers = []
+        for _ in range(Consts.MAX_CNAME_DEPTH + 1):
+            cut = self.find_cut(key, origin)
+            if cut is not None:
+                if answers:#A CNAME points into a delegated zone, the client has to go there itself
+                    return RCode.NoError, answers, [], [], True
+                nameservers = [record for record in self.records[cut] if record.type_ == Type.NS]
+                glue = [record for nameserver in nameservers for record in self.get_records(nameserver.rdata.nsdname)
+                        if record.type_ in (Type.A, Type.AAAA)]
+                return RCode.NoError, [], nameservers, glue, False
+
+            records, exists = self.find_records(key)
+            if not exists:
+                return RCode.NXDomain, answers, self.negative_soa(), [], True
+            found = [record for record in records if record.type_ == qtype or qtype == Type.ANY]
+            if found:
+                return RCode.NoError, answers + found, [], [], True
+            aliases = [record for record in records if record.type_ == Type.CNAME]
+            if not aliases or qtype == Type.CNAME:
+                return RCode.NoError, answers, self.negative_soa(), [], True
+            answers.append(aliases[0])
+            key = self.key(aliases[0].rdata.cname)
+            if not self.in_zone(key, origin):#The client has to resolve the target itself
+                return RCode.NoError, answers, [], [], True
+        return RCode.NoError, answers, [], [], True
+
+    @property
+    def serial(self):
+        """ Serial of the current version of the zone, None if the zone has no SOA record """
+        return self.soa.rdata.serial if self.soa is not None else None
+
+    def soa_with_serial(self, serial):
+        """ Make a copy of the SOA record of the zone with another serial """
+        data = self.soa.rdata
+        return ResourceRecord(self.soa.name, Type.SOA, self.soa.class_, self.soa.ttl,
+                SOARecordData(data.mname, data.rname, serial, data.refresh, data.retry, data.expire, data.minimum))
+
+    def update(self, deleted, added, serial=None):
+        """ Change the zone in place and record the change in the journal
+
+        SOA records in deleted and added are ignored, the serial of the zone
+        is updated instead.
+
+        Args:
+            deleted ([ResourceRecord]): records to remove from the zone
+            added ([ResourceRecord]): records to add to the zone
+            serial (int): serial of the new version, the current serial plus one by default
+
+        Returns:
+            serial (int): serial of the new version
+        """
+        with self.lock:
+            if self.soa is None:
+                raise ValueError("zone has no SOA record")
+            old_serial = self.serial
+            if serial is None:
+                serial = (old_serial + 1) % (1 << 32)
+            deleted = [record for record in deleted if record.type_ != Type.SOA]
+            added = [record for record in added if record.type_ != Type.SOA]
+
+            for record in deleted:
+                self.remove_record(record)
+            for record in added:
+                self.add_record(record)
+            soa = self.soa_with_serial(serial)
+            self.add_node(soa.name, [soa] + [record for record in self.get_records(soa.name) if record.type_ != Type.SOA])
+
+            self.journal.append(JournalEntry(old_serial, serial, deleted, added))
+            del self.journal[:-Consts.JOURNAL_SIZE]
+        return serial
+
+    def axfr_records(self):
+        """ Get the records of a full zone transfer
+
+        See section 2.2 of RFC 5936.
+
+        Returns:
+            records ([ResourceRecord]): all records, between two copies of the SOA record
+        """
+        with self.lock:
+            body = [record for record_set in list(self.records.values()) for record in record_set if record.type_ != Type.SOA]
+            return [self.soa] + body + [self.soa]
+
+    def ixfr_records(self, serial):
+        """ Get the records of an incremental zone transfer
+
+        See section 4 of RFC 1995.
+
+        Args:
+            serial (int): serial of the version the client has
+
+        Returns:
+            records ([ResourceRecord]): the differences since serial, or None if the journal doesn't go back that far
+        """
+        with self.lock:
+            if serial == self.serial:
+                return [self.soa]
+            for i, entry in enumerate(self.journal):
+                if entry.old_serial == serial:
+                    break
+            else:
+                return None
+
+            records = [self.soa]
+            for entry in self.journal[i:]:
+                records.append(self.soa_with_serial(entry.old_serial))
+                records += entry.deleted
+                records.append(self.soa_with_serial(entry.serial))
+                records += entry.added
+            records.append(self.soa)
+            return records
+
+    def apply_transfer(self, records):
+        """ Apply the answer of an AXFR or IXFR query to the zone
+
+        Incremental transfers are applied in place and end up in the journal.
+        A full transfer replaces the contents of the zone.
+
+        Args:
+            records ([ResourceRecord]): the answer records of the transfer
+
+        Returns:
+            serial (int): serial of the zone after the transfer
+        """
+        if not records or records[0].type_ != Type.SOA:
+            raise ValueError("transfer does not start with a SOA record")
+        if len(records) == 1:#We were already up to date
+            return self.serial
+
+        if records[1].type_ != Type.SOA or len(records) == 2:#Full transfer
+            fresh = Zone()
+            for record in records[1:-1]:
+                fresh.add_record(record)
+            fresh.add_record(records[0])
+            with self.lock:
+                self.records, self.names, self.soa, self.journal = fresh.records, fresh.names, fresh.soa, []
+            return self.serial
+
+        i = 1
+        while i < len(records) - 1:
+            i += 1
+            deleted = []
+            while records[i].type_ != Type.SOA:
+                deleted.append(records[i])
+                i += 1
+            serial = records[i].rdata.serial
+            i += 1
+            added = []
+            while i < len(records) - 1 and records[i].type_ != Type.SOA:
+                added.append(records[i])
+                i += 1
+            self.update(deleted, added, serial)
+        return self.serial
 
     def read_master_file(self, filename=Consts.ZONE_FILE):
         """ Read the zone from a master file
@@ -62,8 +384,7 @@ class Zone(object):
                 data = infile.read()
                 self.load_and_parse(data)
         except IOError as e:
-            print("An error has occured while reading the zone from file: " \
-                + str(filename) + " - " + str(e))
+            dns.log.logger.error("An error has occured while reading the zone from file: %s - %s", filename, e)
 
     #Kan mooier met een dict, maar het werkt.
     #Als je zin hebt om het te verbeteren, ga je gang.
@@ -79,10 +400,7 @@ class Zone(object):
         if (timestring[-1] in ['d', 'D']):
             return 604800 * int(timestring[:-1])
         try:
-            if timestring == int(timestring):
-                return int(timestring)
-            else:
-                return 0
+            return int(timestring)
         except:
             return 0
 
@@ -105,23 +423,41 @@ class Zone(object):
         recordSet = []
 
         for line in content.split('\n'):
+            if not line.strip():
+                continue
             if line[:4] == "$TTL":
                 prev_ttl = self.time_to_seconds(line[4:].strip())
             elif line[:7] == "$ORIGIN":
                 origin = line[7:].strip()
-            elif "SOA" not in line:
+            elif "SOA" in line:
+                parts = line.replace('(', ' ').replace(')', ' ').split()
+                rr_name = parts[0]
+
+                offset = int(parts[1] not in Class.__members__)#The ttl field is optional
+                rr_ttl = self.time_to_seconds(parts[1]) if offset else prev_ttl
+
+                rr_class = Class[parts[1+offset]]
+                mname, rname = Name(parts[3+offset]), Name(parts[4+offset])
+                serial = int(parts[5+offset])
+                refresh, retry, expire, minimum = [int(part) if part.isdigit() else self.time_to_seconds(part) for part in parts[6+offset:10+offset]]
+                rr_data = SOARecordData(mname, rname, serial, refresh, retry, expire, minimum)
+                self.add_record(ResourceRecord(Name(rr_name), Type.SOA, rr_class, rr_ttl, rr_data))
+            else:
                 parts = line.split(' ')
                 rr_name = parts[0]
                 
-                rr_ttl = self.time_to_seconds(parts[1])
-                offset = int(rr_ttl == 0)
-                if offset:
-                    rr_ttl = prev_ttl
+                offset = int(parts[1] not in Class.__members__)#The ttl field is optional
+                rr_ttl = self.time_to_seconds(parts[1]) if offset else prev_ttl
 
                 rr_class = Class[parts[1+offset]]
                 rr_type = parts[2+offset]
-                if Type[rr_type] == Type.CNAME or Type[rr_type] == Type.NS:
+                if Type[rr_type] == Type.CNAME or Type[rr_type] == Type.NS or Type[rr_type] == Type.PTR:
                     rr_data = RecordData.create(Type[rr_type], Name(parts[3+offset].rstrip('.')))
+                elif Type[rr_type] == Type.MX:
+                    rr_data = MXRecordData(int(parts[3+offset]), Name(parts[4+offset].rstrip('.')))
+                elif Type[rr_type] == Type.TXT:
+                    strings = re.findall('"([^"]*)"', line) or parts[3+offset:]
+                    rr_data = TXTRecordData([string.encode() for string in strings])
                 else:
                     rr_data = RecordData.create(Type[rr_type], parts[3+offset].rstrip('.'))
-                self.add_node(rr_name, ResourceRecord(Name(rr_name), Type[rr_type], rr_class, rr_ttl, rr_data))
+                self.add_record(ResourceRecord(Name(rr_name), Type[rr_type], rr_class, rr_ttl, rr_data))
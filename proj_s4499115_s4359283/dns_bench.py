@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+
+""" DNS benchmark
+
+This script measures the throughput and latency of the DNS server. The server
+is started in its own process, with a resolver that iterates from a fake root
+server on loopback, which refers it to a fake TLD and leaf server (see
+dns/stub.py). A mix of queries is then sent to the server at a fixed rate.
+"""
+
+from argparse import ArgumentParser
+from collections import Counter
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+from dns.classes import Class
+from dns.message import Message, Header, Question
+from dns.name import Name
+from dns.rcodes import RCode
+from dns.rtypes import Type
+from dns.server import Server
+import dns.log
+import dns.stub
+
+LEAF = "zone.bench."
+
+
+def run_server(port, stub_port, root, caching, workdir, forwarders=None):
+    """ Run the server under test, its resolver uses the fake root server unless it forwards """
+    os.chdir(workdir)#The cache file is written here
+    sys.stdout = open(os.devnull, "w")
+    dns.log.logger.addHandler(logging.NullHandler())
+    server = Server(port, caching, 0, zone_file=os.devnull, forwarders=forwarders)
+    if not forwarders:
+        server.resolver.nameservers = [root]
+        server.resolver.serverport = stub_port
+    server.serve()
+
+
+class QueryMix(object):
+    """ Makes up the names that are asked, in the proportions of the benchmark """
+
+    def __init__(self, hit_ratio, nxdomain, cname, cname_depth, hot_names, seed):
+        """ Initialize the mix
+
+        Args:
+            hit_ratio (float): share of queries for names that were asked before
+            nxdomain (float): share of queries for names that don't exist
+            cname (float): share of names that are a chain of CNAMEs
+            cname_depth (int): maximum length of a chain of CNAMEs
+            hot_names (int): number of names that are asked before the benchmark starts
+            seed (int): seed of the random generator, so runs can be repeated
+        """
+        self.random = random.Random(seed)
+        self.hit_ratio = hit_ratio
+        self.nxdomain = nxdomain
+        self.cname = cname
+        self.cname_depth = cname_depth
+        self.fresh = itertools.count()
+        self.hot = [self.new_name() for _ in range(hot_names)]
+
+    def new_name(self):
+        """ A name that wasn't asked before """
+        number = next(self.fresh)
+        if self.cname_depth > 0 and self.random.random() < self.cname:
+            return "c{}-{}.{}".format(self.random.randint(1, self.cname_depth), number, LEAF)
+        return "h{}.{}".format(number, LEAF)
+
+    def next_name(self):
+        """ The name of the next query """
+        choice = self.random.random()
+        if choice < self.nxdomain:
+            return "nx{}.{}".format(next(self.fresh), LEAF)
+        if choice < self.nxdomain + self.hit_ratio and self.hot:
+            return self.random.choice(self.hot)
+        return self.new_name()
+
+
+class LoadGenerator(object):
+    """ Sends queries to the server and measures how long the responses take """
+
+    def __init__(self, address, sockets=4, timeout=2.0, on_response=None):
+        """ Initialize the generator and start its receiver threads
+
+        Args:
+            address ((str, int)): address of the server
+            sockets (int): number of sockets the queries are spread over
+            timeout (float): seconds after which a query counts as unanswered
+            on_response (callable): called with the tag, response and latency of every answered query
+        """
+        self.address = address
+        self.timeout = timeout
+        self.on_response = on_response
+        self.sockets = []
+        self.outstanding = []#Per socket, identifier of a query to the time it was sent and its tag
+        self.idents = []
+        self.lock = threading.Lock()
+        self.reset()
+        for _ in range(sockets):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(('127.0.0.1', 0))
+            self.sockets.append(sock)
+            self.outstanding.append({})
+            self.idents.append(itertools.count())
+            threading.Thread(target=self.receive, args=(len(self.sockets) - 1,), daemon=True).start()
+        self.next_socket = itertools.cycle(range(sockets))
+
+    def reset(self):
+        """ Forget the measurements so far """
+        with self.lock:
+            self.sent = 0
+            self.latencies = []
+            self.rcodes = Counter()
+            self.timeouts = 0
+
+    def send(self, name, qtype=Type.A):
+        """ Send a query for name """
+        header = Header(0, 0, 1, 0, 0, 0)
+        header.rd = 1
+        self.send_data(Message(header, [Question(Name(name), qtype, Class.IN)]).to_bytes())
+
+    def send_data(self, data, tag=None):
+        """ Send a query in the wire format, its identifier is replaced
+
+        Args:
+            data (bytes): the query
+            tag: passed to on_response along with the response
+        """
+        index = next(self.next_socket)
+        ident = next(self.idents[index]) % 65536
+        data = struct.pack("!H", ident) + data[2:]
+        with self.lock:
+            if self.outstanding[index].pop(ident, None) is not None:#Still no answer after 65536 queries
+                self.timeouts += 1
+            self.outstanding[index][ident] = (time.time(), tag)
+            self.sent += 1
+        self.sockets[index].sendto(data, self.address)
+
+    def receive(self, index):
+        """ Read responses from a socket and record their latency """
+        sock = self.sockets[index]
+        while True:
+            try:
+                data = sock.recv(65535)
+            except OSError:
+                return
+            now = time.time()
+            ident, flags = struct.unpack_from("!HH", data)
+            with self.lock:
+                sent_at, tag = self.outstanding[index].pop(ident, (None, None))
+                if sent_at is None:
+                    continue
+                if now - sent_at > self.timeout:
+                    self.timeouts += 1
+                    continue
+                self.latencies.append(now - sent_at)
+                self.rcodes[flags & 15] += 1
+            if self.on_response is not None:
+                self.on_response(tag, data, now - sent_at)
+
+    def in_flight(self):
+        """ Number of queries that weren't answered yet """
+        with self.lock:
+            return sum(len(outstanding) for outstanding in self.outstanding)
+
+    def drain(self):
+        """ Wait for the queries in flight, the ones that take too long count as unanswered """
+        deadline = time.time() + self.timeout
+        while self.in_flight() and time.time() < deadline:
+            time.sleep(0.01)
+        with self.lock:
+            for outstanding in self.outstanding:
+                self.timeouts += len(outstanding)
+                outstanding.clear()
+
+
+def send_at_rate(generator, names, rate, duration=None):
+    """ Send queries for names at rate per second, for at most duration seconds """
+    interval = 1.0 / rate
+    start = next_send = time.time()
+    for name in names:
+        now = time.time()
+        if duration is not None and now - start >= duration:
+            break
+        if now < next_send:
+            time.sleep(next_send - now)
+        generator.send(name)
+        next_send += interval
+    return time.time() - start
+
+
+def percentile(values, fraction):
+    """ The value below which fraction of the sorted values lie """
+    if not values:
+        return 0.0
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def wait_for_server(generator, attempts=50):
+    """ Wait until the server answers queries """
+    for _ in range(attempts):
+        generator.send(LEAF, Type.SOA)
+        time.sleep(0.1)
+        if generator.latencies:
+            return True
+    return False
+
+
+def run_benchmark(args):
+    """ Run the benchmark and return its report """
+    workdir = tempfile.mkdtemp(prefix="dns_bench")
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    process = multiprocessing.Process(target=run_server,
+            args=(args.port, args.stub_port, args.root, not args.no_cache, workdir))
+    process.start()
+    stubs = dns.stub.start_hierarchy(args.stub_port, root=args.root)
+
+    generator = LoadGenerator(("127.0.0.1", args.port), timeout=args.timeout)
+    try:
+        if not wait_for_server(generator):
+            raise RuntimeError("The server didn't answer")
+
+        mix = QueryMix(args.hit_ratio, args.nxdomain, args.cname, args.cname_depth, args.hot_names, args.seed)
+        send_at_rate(generator, mix.hot, args.rate)#Warm the cache
+        generator.drain()
+        generator.reset()
+        upstream_before = [stub.queries for stub in stubs]
+
+        elapsed = send_at_rate(generator, iter(mix.next_name, None), args.rate, args.duration)
+        generator.drain()
+        upstream = [stub.queries - before for stub, before in zip(stubs, upstream_before)]
+    finally:
+        process.terminate()
+        process.join()
+        for stub in stubs:
+            stub.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (children.ru_utime - children_before.ru_utime) + (children.ru_stime - children_before.ru_stime)
+    latencies = sorted(generator.latencies)
+    return {
+        "target_rate" : args.rate,
+        "duration" : elapsed,
+        "sent" : generator.sent,
+        "answered" : len(latencies),
+        "timeouts" : generator.timeouts,
+        "qps" : len(latencies) / elapsed,
+        "rcodes" : {str(RCode(rcode)) : count for rcode, count in sorted(generator.rcodes.items())},
+        "latency_ms" : {name : 1000 * percentile(latencies, fraction) for name, fraction in
+                [("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p99.9", 0.999), ("max", 1.0)]},
+        "upstream_queries" : dict(zip(["root", "tld", "leaf"], upstream)),
+        "server_cpu_seconds" : cpu,
+        "server_cpu_percent" : 100 * cpu / elapsed,
+        "server_max_rss_mb" : children.ru_maxrss / 1024,#Kilobytes on Linux
+    }
+
+
+def print_report(report):
+    """ Print the report in a readable way """
+    print("Sent {sent} queries in {duration:.1f}s (target {target_rate}/s)".format(**report))
+    print("Answered {answered} ({qps:.1f} qps), {timeouts} unanswered".format(**report))
+    print("Rcodes: " + ", ".join("{}: {}".format(rcode, count) for rcode, count in report["rcodes"].items()))
+    print("Latency (ms): " + ", ".join("{} {:.2f}".format(name, value) for name, value in report["latency_ms"].items()))
+    print("Upstream queries: " + ", ".join("{} {}".format(name, count) for name, count in report["upstream_queries"].items()))
+    print("Server CPU: {server_cpu_seconds:.2f}s ({server_cpu_percent:.1f}% of a core), max RSS {server_max_rss_mb:.1f} MB".format(**report))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="DNS Benchmark")
+    parser.add_argument("-p", "--port", type=int, default=15353,
+            help="Port the server under test listens on")
+    parser.add_argument("--stub-port", type=int, default=15300,
+            help="Port the fake root, TLD and leaf servers listen on")
+    parser.add_argument("--root", default="127.0.0.2",
+            help="Loopback address of the fake root server")
+    parser.add_argument("-r", "--rate", type=float, default=200,
+            help="Queries per second sent to the server")
+    parser.add_argument("-d", "--duration", type=float, default=10,
+            help="Seconds the benchmark runs")
+    parser.add_argument("--hit-ratio", type=float, default=0.8,
+            help="Share of queries for names that are in the cache")
+    parser.add_argument("--nxdomain", type=float, default=0.05,
+            help="Share of queries for names that don't exist")
+    parser.add_argument("--cname", type=float, default=0.1,
+            help="Share of names that are a chain of CNAMEs")
+    parser.add_argument("--cname-depth", type=int, default=2,
+            help="Maximum length of a chain of CNAMEs")
+    parser.add_argument("--hot-names", type=int, default=200,
+            help="Number of names that are put in the cache before the benchmark")
+    parser.add_argument("--timeout", type=float, default=2.0,
+            help="Seconds after which a query counts as unanswered")
+    parser.add_argument("--no-cache", action="store_true",
+            help="Disable the cache of the server")
+    parser.add_argument("--seed", type=int, default=0,
+            help="Seed of the query mix")
+    parser.add_argument("--json", action="store_true",
+            help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -6,10 +6,53 @@ A simple example of a client using the DNS resolver.
 """
 
 from argparse import ArgumentParser
+import csv
+import json
+import sys
 
 from dns.resolver import Resolver
+from dns.rtypes import Type
 import dns.consts as Consts
 
+
+def read_names(infile):
+    """ Read the names of a batch file lazily, skipping empty lines and comments """
+    for line in infile:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def rdata_text(record):
+    """ Write the data of a record as text """
+    return " ".join(str(value) for value in record.rdata.to_dict().values())
+
+
+def resolve_batch(resolver, infile, outfile, qtype, output_format, concurrency):
+    """ Resolve the names in infile and write a line per name to outfile as it comes in
+
+    Args:
+        resolver (Resolver): the resolver that is used for all names
+        infile (file): one name per line
+        outfile (file): where the results are written
+        qtype (Type): type of the records we want
+        output_format (str): "csv" or "json" (JSON lines)
+        concurrency (int): maximum number of resolutions in flight
+    """
+    writer = csv.writer(outfile) if output_format == "csv" else None
+    if writer is not None:
+        writer.writerow(["name", "rcode", "aliases", "answers"])
+
+    for name, (rcode, answers, _, _) in resolver.resolve_many(read_names(infile), qtype, concurrency=concurrency):
+        aliases = [str(answer.rdata.cname) for answer in answers if answer.type_ == Type.CNAME and qtype != Type.CNAME]
+        data = [rdata_text(answer) for answer in answers if answer.type_ == qtype or qtype == Type.ANY]
+        if writer is not None:
+            writer.writerow([name, str(rcode), " ".join(aliases), " ".join(data)])
+        else:
+            outfile.write(json.dumps({"name" : name, "rcode" : str(rcode), "aliases" : aliases, "answers" : data}) + "\n")
+        outfile.flush()
+
+
 if __name__ == "__main__":
     # Parse arguments
     
@@ -21,14 +64,44 @@ if __name__ == "__main__":
             help="Enable caching")
     parser.add_argument("-t", "--ttl", metavar="time", type=int, default=0, 
             help="TTL value of cached entries")
+    parser.add_argument("-f", "--forward", metavar="address", action="append",
+            help="forward queries to this upstream resolver (can be given more than once)")
+    parser.add_argument("-b", "--batch", metavar="file",
+            help="resolve the names in this file (one per line, - for stdin) instead of hostname")
+    parser.add_argument("--type", default="A", choices=[str(type_) for type_ in Type],
+            help="record type to ask for in batch mode")
+    parser.add_argument("--format", default="csv", choices=["csv", "json"],
+            help="output format of batch mode: CSV or JSON lines")
+    parser.add_argument("-o", "--output", metavar="file",
+            help="file the results of batch mode are written to, default stdout")
+    parser.add_argument("-j", "--concurrency", type=int, default=Consts.BATCH_CONCURRENCY,
+            help="number of resolutions in flight in batch mode")
+    parser.add_argument("--no-minimise", action="store_true",
+            help="ask nameservers about the whole name instead of one label more than their zone (QNAME minimisation)")
     args = parser.parse_args()
     
-    if not args.hostname:
+    if not args.hostname and not args.batch:
         parser.print_help()
         exit()
+
+    if args.batch:
+        # Resolve all names with one resolver, so they share the cache
+        resolver = Resolver(args.timeout, args.caching, args.ttl, forwarders=args.forward, minimise=not args.no_minimise)
+        infile = sys.stdin if args.batch == "-" else open(args.batch)
+        outfile = sys.stdout if args.output is None else open(args.output, "w", newline="")
+        try:
+            resolve_batch(resolver, infile, outfile, Type[args.type], args.format, args.concurrency)
+        finally:
+            if infile is not sys.stdin:
+                infile.close()
+            if outfile is not sys.stdout:
+                outfile.close()
+            if args.caching:
+                resolver.cache.write_cache_file()
+        exit()
     
     # Resolve hostname
-    resolver = Resolver(args.timeout, args.caching, args.ttl)
+    resolver = Resolver(args.timeout, args.caching, args.ttl, forwarders=args.forward, minimise=not args.no_minimise)
     hostname, aliaslist, ipaddrlist = resolver.gethostbyname(args.hostname)
     if args.caching:
         resolver.cache.write_cache_file()
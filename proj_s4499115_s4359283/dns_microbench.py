@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+""" DNS micro-benchmarks
+
+This script times the hot paths of the server one by one, without any network:
+the wire format codec, the cache and the zone. Results can be saved as a JSON
+baseline and compared with the baseline of an earlier run, so regressions are
+caught before they show up in the end-to-end benchmark (dns_bench.py).
+"""
+
+from argparse import ArgumentParser
+import json
+import platform
+import sys
+import time
+
+from dns.cache import RecordCache
+from dns.classes import Class
+from dns.message import Message, Header, Question
+from dns.name import Name
+from dns.resource import ResourceRecord, ARecordData, CNAMERecordData, NSRecordData
+from dns.rtypes import Type
+from dns.server import RequestHandler
+import dns.zone
+
+
+class MemoryCache(RecordCache):
+    """ A cache that doesn't touch the cache file on disk """
+
+    def read_cache_file(self, cache_file=None):
+        self.records = {}
+
+
+def measure(function, min_time=0.2, repeat=3):
+    """ Time a function
+
+    The function is called in batches that grow until a batch takes at least
+    min_time, the fastest of repeat such batches counts.
+
+    Args:
+        function (callable): the code that is timed, called without arguments
+        min_time (float): seconds a batch takes at least
+        repeat (int): number of batches that are timed
+
+    Returns:
+        ns_per_op (float): nanoseconds per call
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed * 10 > min_time else 10
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1e9
+
+
+def make_response(answers=8):
+    """ A typical response: a CNAME, some A records, a referral and glue """
+    header = Header(1234, 0, 1, answers + 1, 2, 2)
+    header.qr = 1
+    header.rd = 1
+    header.ra = 1
+    questions = [Question(Name("www.example.com."), Type.A, Class.IN)]
+    records = [ResourceRecord(Name("www.example.com."), Type.CNAME, Class.IN, 300, CNAMERecordData(Name("web.example.com.")))]
+    records += [ResourceRecord(Name("web.example.com."), Type.A, Class.IN, 300, ARecordData("192.0.2.{}".format(i)))
+            for i in range(answers)]
+    authorities = [ResourceRecord(Name("example.com."), Type.NS, Class.IN, 3600, NSRecordData(Name("ns{}.example.com.".format(i))))
+            for i in range(2)]
+    additionals = [ResourceRecord(Name("ns{}.example.com.".format(i)), Type.A, Class.IN, 3600, ARecordData("198.51.100.{}".format(i)))
+            for i in range(2)]
+    return Message(header, questions, records, authorities, additionals)
+
+
+def make_zone_text(size):
+    """ A master file with size A records """
+    lines = ["$TTL 3600", "bench. 3600 IN SOA ns.bench. hostmaster.bench. (1 3H 15 1w 3h)"]
+    lines += ["h{}.bench. 300 IN A 10.{}.{}.{}".format(i, (i >> 16) & 255, (i >> 8) & 255, i & 255) for i in range(size)]
+    return "\n".join(lines) + "\n"
+
+
+def bench_codec(results):
+    """ Message and Name to and from the wire format """
+    response = make_response()
+    packet = response.to_bytes()
+    results["message.to_bytes"] = measure(response.to_bytes)
+    results["message.from_bytes"] = measure(lambda: Message.from_bytes(packet))
+
+    name = Name("www.subdomain.example.com.")
+    results["name.to_bytes"] = measure(lambda: name.to_bytes(0))
+    compress = {}
+    Name("mail.example.com.").to_bytes(12, compress)
+    results["name.to_bytes.compressed"] = measure(lambda: name.to_bytes(40, dict(compress)))
+
+    plain = b"\x00" * 12 + name.to_bytes(12)
+    results["name.from_bytes"] = measure(lambda: Name.from_bytes(plain, 12))
+    compress = {}
+    pointed = b"\x00" * 12 + Name("example.com.").to_bytes(12, compress)
+    offset = len(pointed)
+    pointed += name.to_bytes(offset, compress)
+    results["name.from_bytes.compressed"] = measure(lambda: Name.from_bytes(pointed, offset))
+
+
+def bench_cache(results, sizes):
+    """ RecordCache.lookup and add_record with caches of several sizes """
+    for size in sizes:
+        cache = MemoryCache(0)
+        for i in range(size):#Fill the index directly, add_record would take a long time for big sizes
+            name = "h{}.bench.".format(i)
+            cache.records[cache.key(name, Type.A, Class.IN)] = [
+                    ResourceRecord(Name(name), Type.A, Class.IN, 3600, ARecordData("10.0.0.1"))]
+        hit = "h{}.bench.".format(size // 2)
+        results["cache.lookup.hit.{}".format(size)] = measure(lambda: cache.lookup(hit, Type.A, Class.IN))
+        results["cache.lookup.miss.{}".format(size)] = measure(lambda: cache.lookup("nope.bench.", Type.A, Class.IN))
+
+        counter = iter(range(10 ** 9))
+        def add():
+            number = next(counter)
+            cache.add_record(ResourceRecord(Name("new{}.bench.".format(number)), Type.A, Class.IN, 3600, ARecordData("10.0.0.2")))
+        results["cache.add_record.{}".format(size)] = measure(add)
+
+
+def bench_zone(results, sizes):
+    """ Parsing master files and answering from big zones """
+    for size in sizes:
+        text = make_zone_text(size)
+        zone = dns.zone.Zone()
+        start = time.perf_counter()
+        zone.load_and_parse(text)
+        results["zone.load_and_parse.{}".format(size)] = (time.perf_counter() - start) / size * 1e9
+
+        catalog = dns.zone.Catalog()
+        catalog.add_zone("bench", zone)
+        message = Message(Header(1, 0, 1, 0, 0, 0), [Question(Name("h1.bench."), Type.A, Class.IN)])
+        handler = RequestHandler(None, None, 0, message, None, catalog)
+        hit = "h{}.bench.".format(size // 2)
+        results["check_zone.hit.{}".format(size)] = measure(lambda: handler.check_zone(hit))
+        results["check_zone.miss.{}".format(size)] = measure(lambda: handler.check_zone("nope.bench."))
+
+
+def compare(results, baseline, threshold):
+    """ Find the benchmarks that got slower than the baseline
+
+    Args:
+        results ({str: float}): nanoseconds per operation of this run
+        baseline ({str: float}): nanoseconds per operation of an earlier run
+        threshold (float): slowdown that counts as a regression, 0.1 is 10%
+
+    Returns:
+        regressions ([(str, float, float)]): name, baseline and result of every regression
+    """
+    return [(name, baseline[name], result) for name, result in sorted(results.items())
+            if name in baseline and result > baseline[name] * (1 + threshold)]
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="DNS Micro-benchmarks")
+    parser.add_argument("--cache-sizes", default="1000,10000,100000,1000000",
+            help="Comma separated numbers of entries in the cache")
+    parser.add_argument("--zone-sizes", default="1000,10000,100000",
+            help="Comma separated numbers of records in the zone")
+    parser.add_argument("-k", "--filter", default="",
+            help="Only run the groups whose name contains this (codec, cache, zone)")
+    parser.add_argument("-s", "--save", metavar="file",
+            help="Save the results as a JSON baseline")
+    parser.add_argument("-c", "--compare", metavar="file",
+            help="Compare the results with a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+            help="Slowdown that counts as a regression (0.1 is 10%%)")
+    args = parser.parse_args()
+
+    results = {}
+    groups = [("codec", lambda: bench_codec(results)),
+              ("cache", lambda: bench_cache(results, [int(size) for size in args.cache_sizes.split(",")])),
+              ("zone", lambda: bench_zone(results, [int(size) for size in args.zone_sizes.split(",")]))]
+    for group, run in groups:
+        if args.filter in group:
+            run()
+
+    for name, result in sorted(results.items()):
+        print("{:<36} {:>14.1f} ns/op".format(name, result))
+
+    if args.save:
+        with open(args.save, "w") as outfile:
+            json.dump({"python" : platform.python_version(), "machine" : platform.machine(),
+                       "results" : results}, outfile, indent=2)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after in regressions:
+            print("[-] - Regression in {}: {:.1f} -> {:.1f} ns/op (+{:.0f}%)".format(name, before, after, 100 * (after / before - 1)))
+        if regressions:
+            sys.exit(1)
+        print("[+] - No regressions above {:.0f}%.".format(100 * args.threshold))
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+""" DNS replay
+
+This script sends the queries of a capture (dns_server.py --capture) to a
+server again, with the timing of the capture or faster. By default a server
+is started in its own process, with a resolver that iterates from the fake
+hierarchy of dns_bench.py, or that forwards to the given upstreams. The
+responses are compared with the captured ones and the latencies with the
+captured latencies, so a change in the cache or the resolver can be judged
+on real traffic.
+"""
+
+from argparse import ArgumentParser
+from collections import Counter
+import json
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import time
+
+from dns.message import Message
+from dns.rcodes import RCode
+from dns_bench import LoadGenerator, percentile, run_server, wait_for_server
+import dns.capture
+import dns.stub
+
+
+def load_capture(infile):
+    """ Read the queries of a capture, each with the response the server sent to it
+
+    Responses are matched to queries on client address, transport and
+    identifier, in the order they were captured.
+
+    Args:
+        infile (file): capture opened in binary mode
+
+    Returns:
+        queries ([dict]): per query its time, data, the captured response
+            (None if there was none) and the latency of that response
+    """
+    queries = []
+    waiting = {}#Client address, transport and identifier to the queries without a response
+    for kind, transport, timestamp, address, data in dns.capture.read_capture(infile):
+        if len(data) < 12:
+            continue
+        key = (address, transport, data[:2])
+        if kind == dns.capture.QUERY:
+            query = {"time" : timestamp, "data" : data, "response" : None, "latency" : None}
+            queries.append(query)
+            waiting.setdefault(key, []).append(query)
+        elif waiting.get(key):
+            query = waiting[key].pop(0)
+            query["response"] = data
+            query["latency"] = timestamp - query["time"]
+    return queries
+
+
+def answer_set(message):
+    """ The answers of a response, without their ttls and order """
+    return sorted(json.dumps(dict(record.to_dict(), ttl=0), sort_keys=True) for record in message.answers)
+
+
+def compare_responses(original, replayed):
+    """ Find out how a replayed response differs from the captured one
+
+    Args:
+        original (bytes): the captured response
+        replayed (bytes): the response to the replayed query
+
+    Returns:
+        difference (str): None if they are the same, else "rcode", "answers" or "invalid"
+    """
+    try:
+        before = Message.from_bytes(original)
+        after = Message.from_bytes(replayed)
+    except Exception:
+        return "invalid"
+    if before.header.rcode != after.header.rcode:
+        return "rcode"
+    if answer_set(before) != answer_set(after):
+        return "answers"
+    return None
+
+
+def question_text(data):
+    """ The question of a query as text, for the report """
+    try:
+        question = Message.from_bytes(data).questions[0]
+        return "{} {}".format(question.qname, question.qtype)
+    except Exception:
+        return "?"
+
+
+class Replay(object):
+    """ Sends the queries of a capture and compares the responses """
+
+    def __init__(self, queries, address, timeout, max_examples=10):
+        """ Initialize the replay
+
+        Args:
+            queries ([dict]): the queries, as returned by load_capture
+            address ((str, int)): address of the server under test
+            timeout (float): seconds after which a query counts as unanswered
+            max_examples (int): number of differing queries that are kept for the report
+        """
+        self.queries = queries
+        self.max_examples = max_examples
+        self.differences = Counter()
+        self.examples = []
+        self.lock = threading.Lock()
+        self.generator = LoadGenerator(address, timeout=timeout, on_response=self.compare)
+
+    def compare(self, query, response, latency):
+        """ Compare the response to a replayed query with the captured one """
+        if query is None:#A query of wait_for_server
+            return
+        if query["response"] is None:
+            difference = "not captured"
+        else:
+            difference = compare_responses(query["response"], response)
+        with self.lock:
+            self.differences[difference or "same"] += 1
+            if difference is not None and len(self.examples) < self.max_examples:
+                self.examples.append("{}: {}".format(question_text(query["data"]), difference))
+
+    def run(self, speed):
+        """ Send the queries, speed times as fast as they were captured, 0 for no waiting
+
+        Returns:
+            elapsed (float): seconds it took to send them
+        """
+        start = time.time()
+        if not self.queries:
+            return 0.0
+        origin = self.queries[0]["time"]
+        for query in self.queries:
+            if speed > 0:
+                delay = start + (query["time"] - origin) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            self.generator.send_data(query["data"], query)
+        elapsed = time.time() - start
+        self.generator.drain()
+        return elapsed
+
+
+def run_replay(args):
+    """ Run the replay and return its report """
+    with open(args.capture, "rb") as infile:
+        queries = load_capture(infile)
+
+    workdir = process = None
+    stubs = []
+    address = ("127.0.0.1", args.port)
+    if args.target:
+        host, port = args.target.rsplit(":", 1)
+        address = (host, int(port))
+    else:
+        workdir = tempfile.mkdtemp(prefix="dns_replay")
+        process = multiprocessing.Process(target=run_server,
+                args=(args.port, args.stub_port, args.root, not args.no_cache, workdir, args.forward))
+        process.start()
+        if not args.forward:
+            stubs = dns.stub.start_hierarchy(args.stub_port, root=args.root)
+
+    replay = Replay(queries, address, args.timeout)
+    try:
+        if not wait_for_server(replay.generator):
+            raise RuntimeError("The server didn't answer")
+        replay.generator.drain()
+        replay.generator.reset()
+        elapsed = replay.run(args.speed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+        for stub in stubs:
+            stub.close()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    generator = replay.generator
+    latencies = sorted(generator.latencies)
+    captured = sorted(query["latency"] for query in queries if query["latency"] is not None)
+    fractions = [("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)]
+    return {
+        "queries" : len(queries),
+        "duration" : elapsed,
+        "captured_duration" : queries[-1]["time"] - queries[0]["time"] if queries else 0.0,
+        "answered" : len(latencies),
+        "timeouts" : generator.timeouts,
+        "rcodes" : {str(RCode(rcode)) : count for rcode, count in sorted(generator.rcodes.items())},
+        "comparison" : dict(replay.differences),
+        "examples" : replay.examples,
+        "latency_ms" : {name : 1000 * percentile(latencies, fraction) for name, fraction in fractions},
+        "captured_latency_ms" : {name : 1000 * percentile(captured, fraction) for name, fraction in fractions},
+        "upstream_queries" : dict(zip(["root", "tld", "leaf"], [stub.queries for stub in stubs])),
+    }
+
+
+def print_report(report):
+    """ Print the report in a readable way """
+    print("Replayed {queries} queries in {duration:.1f}s (captured in {captured_duration:.1f}s)".format(**report))
+    print("Answered {answered}, {timeouts} unanswered".format(**report))
+    print("Rcodes: " + ", ".join("{}: {}".format(rcode, count) for rcode, count in report["rcodes"].items()))
+    print("Compared with the capture: " + ", ".join("{} {}".format(name, count) for name, count in sorted(report["comparison"].items())))
+    for example in report["examples"]:
+        print("    " + example)
+    print("Latency (ms):          " + ", ".join("{} {:.2f}".format(name, value) for name, value in report["latency_ms"].items()))
+    print("Captured latency (ms): " + ", ".join("{} {:.2f}".format(name, value) for name, value in report["captured_latency_ms"].items()))
+    if report["upstream_queries"]:
+        print("Upstream queries: " + ", ".join("{} {}".format(name, count) for name, count in report["upstream_queries"].items()))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="DNS Replay")
+    parser.add_argument("capture",
+            help="Capture file written by dns_server.py --capture")
+    parser.add_argument("-s", "--speed", type=float, default=1.0,
+            help="How many times faster than captured the queries are sent, 0 to not wait at all")
+    parser.add_argument("-p", "--port", type=int, default=15353,
+            help="Port the server under test listens on")
+    parser.add_argument("--stub-port", type=int, default=15300,
+            help="Port the fake root, TLD and leaf servers listen on")
+    parser.add_argument("--root", default="127.0.0.2",
+            help="Loopback address of the fake root server")
+    parser.add_argument("-f", "--forward", metavar="address", action="append",
+            help="Let the server under test forward to this upstream instead of the fake servers")
+    parser.add_argument("-t", "--target", metavar="host:port",
+            help="Replay against a server that is already running instead of starting one")
+    parser.add_argument("--timeout", type=float, default=2.0,
+            help="Seconds after which a query counts as unanswered")
+    parser.add_argument("--no-cache", action="store_true",
+            help="Disable the cache of the server")
+    parser.add_argument("--json", action="store_true",
+            help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_replay(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
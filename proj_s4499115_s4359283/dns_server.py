@@ -6,6 +6,14 @@ This script contains the code for starting a DNS server.
 """
 
 from dns.server import Server
+from dns.forward import UpstreamPool
+from dns.log import LogPipeline
+from dns.ratelimit import ResponseRateLimiter
+import dns.capture
+import dns.consts as Consts
+import dns.trace
+import logging
+import signal
 import time
 from argparse import ArgumentParser
 
@@ -20,10 +28,56 @@ def run_server():
             help="TTL value of cached entries (if > 0)")
     parser.add_argument("-p", "--port", type=int, default=53,
             help="Port which server listens on")
+    parser.add_argument("-w", "--watch", action="store_true",
+            help="Reload the zone file when it changes")
+    parser.add_argument("-f", "--forward", metavar="address", action="append",
+            help="Forward queries to this upstream resolver (can be given more than once)")
+    parser.add_argument("--policy", choices=UpstreamPool.policies, default=Consts.FORWARD_POLICY,
+            help="Load balancing policy for the upstream resolvers")
+    parser.add_argument("-m", "--metrics-port", metavar="port", type=int,
+            help="Serve metrics in the Prometheus text format on this port of localhost")
+    parser.add_argument("-l", "--log-level", choices=["debug", "info", "warning", "error"], default="info",
+            help="Lowest level of the messages that are logged")
+    parser.add_argument("-q", "--query-log", metavar="file",
+            help="Append a sample of the answered queries to this file as JSON lines")
+    parser.add_argument("--query-sample", metavar="rate", type=float, default=Consts.QUERY_LOG_SAMPLE_RATE,
+            help="Share of the queries that is written to the query log")
+    parser.add_argument("--slow-ms", metavar="ms", type=float,
+            help="Trace every query and log the ones that take longer than this")
+    parser.add_argument("--slow-log", metavar="file",
+            help="Append the traces of slow queries to this file instead of the log")
+    parser.add_argument("--capture", metavar="file",
+            help="Write the queries and responses to this capture file, see dns_replay.py")
+    parser.add_argument("-r", "--rate-limit", metavar="rate", type=float,
+            help="Limit the responses per second per client network and name")
+    parser.add_argument("--slip", type=int, default=Consts.RRL_SLIP,
+            help="Answer every this many queries over the rate limit with a truncated response (0 drops all)")
+    parser.add_argument("--no-minimise", action="store_true",
+            help="Ask nameservers about the whole name instead of one label more than their zone (QNAME minimisation)")
     args = parser.parse_args()
 
+    # Write the logs on a background thread
+    pipeline = LogPipeline(getattr(logging, args.log_level.upper()), query_log=args.query_log,
+            sample_rate=args.query_sample, slow_log=args.slow_log)
+    if args.slow_ms is not None:
+        dns.trace.tracer.threshold = args.slow_ms / 1000
+    pipeline.start()
+    if args.capture:
+        dns.capture.capture.start(args.capture)
+
     # Start server
-    server = Server(args.port, args.caching, args.ttl)
+    rate_limiter = None
+    if args.rate_limit:
+        rate_limiter = ResponseRateLimiter(args.rate_limit, max(Consts.RRL_BURST, 2 * args.rate_limit), args.slip)
+    server = Server(args.port, args.caching, args.ttl, forwarders=args.forward, policy=args.policy,
+            metrics_port=args.metrics_port, rate_limiter=rate_limiter, minimise=not args.no_minimise)
+
+    # Reload the zone on SIGHUP (and on changes to the file if asked to)
+    signal.signal(signal.SIGHUP, lambda signum, frame: server.reload_in_background())
+    # Profile the server for a while on SIGUSR1
+    signal.signal(signal.SIGUSR1, lambda signum, frame: server.profile())
+    if args.watch:
+        server.watch_zone_file()
     
     try:
         server.serve()
@@ -32,6 +86,9 @@ def run_server():
         print("\n[*] - Trying to shut down.")
         server.shutdown()
         time.sleep(1)
+    finally:
+        dns.capture.capture.stop()
+        pipeline.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from dns.cache import RecordCache
+from dns.resource import ResourceRecord, ARecordData, CNAMERecordData, NSRecordData, SOARecordData
+from dns.rcodes import RCode
+from dns.name import Name
+from dns.rtypes import Type
+from dns.classes import Class
+import dns.consts as Consts
+
+
+def a_record(name, address, ttl):
+    return ResourceRecord(Name(name), Type.A, Class.IN, ttl, ARecordData(address))
+
+
+@patch.object(RecordCache, "read_cache_file")
+class RecordCacheTestCase(unittest.TestCase):
+    def test_lookup(self, _):
+        cache = RecordCache(0)
+        cache.add_record(a_record("www.example.com", "192.0.2.1", 60))
+        cache.add_record(a_record("www.example.com", "192.0.2.2", 60))
+        found = cache.lookup("WWW.example.com.", Type.A, Class.IN)
+        self.assertEqual(sorted(r.rdata.address for r in found), ["192.0.2.1", "192.0.2.2"])
+        self.assertEqual(cache.lookup("www.example.com.", Type.CNAME, Class.IN), [])
+
+    def test_add_existing_record_refreshes_ttl(self, _):
+        cache = RecordCache(0)
+        cache.add_record(a_record("www.example.com", "192.0.2.1", 5))
+        cache.add_record(a_record("www.example.com", "192.0.2.1", 60))
+        found = cache.lookup("www.example.com.", Type.A, Class.IN)
+        self.assertEqual([r.ttl for r in found], [60])
+
+    def test_prefetch_popular_entry(self, _):
+        cache = RecordCache(0)
+        cache.prefetcher = MagicMock()
+        cache.add_record(a_record("www.example.com", "192.0.2.1", 5))
+        for _ in range(Consts.PREFETCH_MIN_HITS):
+            cache.lookup("www.example.com.", Type.A, Class.IN)
+        self.assertFalse(cache.prefetcher.called)
+
+        cache.add_record(a_record("hot.example.com", "192.0.2.2", 100))
+        key = cache.key("hot.example.com.", Type.A, Class.IN)
+        cache.records[key][0].ttl = 5
+        for _ in range(Consts.PREFETCH_MIN_HITS + 2):
+            cache.lookup("hot.example.com.", Type.A, Class.IN)
+        cache.prefetcher.assert_called_once_with("hot.example.com.", Type.A, Class.IN)
+
+    def test_lookup_stale(self, _):
+        cache = RecordCache(0)
+        cache.add_record(a_record("www.example.com", "192.0.2.1", 60))
+        self.assertEqual(cache.lookup_stale("www.example.com.", Type.A, Class.IN), [])
+
+        key = cache.key("www.example.com.", Type.A, Class.IN)
+        cache.records[key][0].ttl = -10
+        self.assertEqual(cache.lookup("www.example.com.", Type.A, Class.IN), [])
+        found = cache.lookup_stale("www.example.com.", Type.A, Class.IN)
+        self.assertEqual([(r.rdata.address, r.ttl) for r in found], [("192.0.2.1", Consts.STALE_TTL)])
+
+        cache.records[key][0].ttl = -Consts.STALE_WINDOW - 10
+        self.assertEqual(cache.lookup_stale("www.example.com.", Type.A, Class.IN), [])
+
+    def test_response(self, _):
+        cache = RecordCache(0)
+        alias = ResourceRecord(Name("www.example.com"), Type.CNAME, Class.IN, 60, CNAMERecordData(Name("example.com")))
+        address = a_record("example.com", "192.0.2.1", 30)
+        cache.add_response("www.example.com.", Type.A, Class.IN, RCode.NoError, [alias, address], [], [])
+        rcode, answers, authorities, additionals = cache.lookup_response("WWW.example.com", Type.A, Class.IN)
+        self.assertEqual(rcode, RCode.NoError)
+        self.assertEqual([r.type_ for r in answers], [Type.CNAME, Type.A])
+
+        del cache.records[cache.key("example.com.", Type.A, Class.IN)]
+        self.assertIsNone(cache.lookup_response("www.example.com.", Type.A, Class.IN))
+
+    def test_negative_response(self, _):
+        cache = RecordCache(0)
+        soa = ResourceRecord(Name("example.com"), Type.SOA, Class.IN, 3600,
+                SOARecordData(Name("ns.example.com"), Name("host.example.com"), 1, 0, 0, 0, 300))
+        cache.add_response("nope.example.com.", Type.A, Class.IN, RCode.NXDomain, [], [soa], [])
+        rcode, answers, authorities, _ = cache.lookup_response("nope.example.com.", Type.A, Class.IN)
+        self.assertEqual((rcode, answers, [r.type_ for r in authorities]), (RCode.NXDomain, [], [Type.SOA]))
+        self.assertLessEqual(cache.responses[cache.key("nope.example.com.", Type.A, Class.IN)][1], time.time() + 300)
+
+        cache.add_response("other.example.com.", Type.A, Class.IN, RCode.NXDomain, [], [], [])
+        self.assertIsNone(cache.lookup_response("other.example.com.", Type.A, Class.IN))
+
+    def test_response_sections_not_shared(self, _):
+        cache = RecordCache(0)
+        nameserver = ResourceRecord(Name("example.com"), Type.NS, Class.IN, 60, NSRecordData(Name("ns.provider.net")))
+        cache.add_response("www.example.com.", Type.A, Class.IN, RCode.NoError, [a_record("www.example.com", "192.0.2.1", 60)],
+                [nameserver], [a_record("ns.provider.net", "192.0.2.66", 60)])
+        _, _, authorities, additionals = cache.lookup_response("www.example.com.", Type.A, Class.IN)
+        self.assertEqual([r.type_ for r in authorities + additionals], [Type.NS, Type.A])
+        self.assertEqual(cache.lookup("ns.provider.net.", Type.A, Class.IN), [])
+        self.assertEqual(cache.lookup("example.com.", Type.NS, Class.IN), [])
+
+    def test_delegation(self, _):
+        cache = RecordCache(0)
+        nameserver = ResourceRecord(Name("example.com"), Type.NS, Class.IN, 60, NSRecordData(Name("ns.example.com")))
+        cache.add_delegation([nameserver], [a_record("ns.example.com", "192.0.2.53", 60)])
+        self.assertEqual(cache.find_delegation("www.example.com.", Class.IN), ("example.com.", ["192.0.2.53"]))
+        self.assertEqual(cache.find_delegation("www.example.org.", Class.IN), (None, []))
+
+    def test_zone_cut(self, _):
+        cache = RecordCache(0)
+        nameserver = ResourceRecord(Name("example.com"), Type.NS, Class.IN, 60, NSRecordData(Name("ns.example.net")))
+        cache.add_delegation([nameserver], [])
+        self.assertEqual(cache.find_zone_cut("r1.r2.example.com.", Class.IN), "example.com.")
+        self.assertEqual(cache.find_delegation("r1.r2.example.com.", Class.IN), (None, []))#No address for its nameserver
+        self.assertIsNone(cache.find_zone_cut("example.org.", Class.IN))
+
+    def test_delegation_not_from_response(self, _):
+        cache = RecordCache(0)
+        nameserver = ResourceRecord(Name("com"), Type.NS, Class.IN, 60, NSRecordData(Name("ns.example.com")))
+        cache.add_response("www.example.com.", Type.A, Class.IN, RCode.NoError, [a_record("www.example.com", "192.0.2.1", 60)],
+                [nameserver], [a_record("ns.example.com", "192.0.2.66", 60)])
+        self.assertEqual(cache.find_delegation("www.bank.com.", Class.IN), (None, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
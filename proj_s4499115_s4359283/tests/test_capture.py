@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import tempfile
+import unittest
+
+from dns.capture import Capture, MAGIC, QUERY, RESPONSE, pack_address, read_capture, unpack_address
+
+
+class AddressTestCase(unittest.TestCase):
+    def test_ipv4(self):
+        packed = pack_address("192.0.2.1")
+        self.assertEqual(len(packed), 16)
+        self.assertEqual(unpack_address(packed), "192.0.2.1")
+
+    def test_ipv6(self):
+        self.assertEqual(unpack_address(pack_address("2001:db8::1")), "2001:db8::1")
+
+
+class CaptureTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "capture.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        capture = Capture()
+        capture.start(self.path)
+        capture.add(QUERY, "udp", 1000.5, ("192.0.2.1", 5353), b"query")
+        capture.add(RESPONSE, "tcp", 1000.75, ("2001:db8::1", 53), b"response")
+        capture.stop()
+        with open(self.path, "rb") as infile:
+            frames = list(read_capture(infile))
+        self.assertEqual(frames, [
+            (QUERY, "udp", 1000.5, ("192.0.2.1", 5353), b"query"),
+            (RESPONSE, "tcp", 1000.75, ("2001:db8::1", 53), b"response"),
+        ])
+
+    def test_not_started(self):
+        capture = Capture()
+        capture.add(QUERY, "udp", 1000.5, ("192.0.2.1", 5353), b"query")
+        capture.stop()
+
+    def test_truncated(self):
+        capture = Capture()
+        capture.start(self.path)
+        capture.add(QUERY, "udp", 1000.5, ("192.0.2.1", 5353), b"query")
+        capture.add(QUERY, "udp", 1001.5, ("192.0.2.1", 5353), b"cut off")
+        capture.stop()
+        with open(self.path, "rb") as infile:
+            data = infile.read()
+        frames = list(read_capture(io.BytesIO(data[:-3])))
+        self.assertEqual(len(frames), 1)
+
+    def test_not_a_capture(self):
+        with self.assertRaises(ValueError):
+            list(read_capture(io.BytesIO(b"something else")))
+        self.assertEqual(list(read_capture(io.BytesIO(MAGIC))), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
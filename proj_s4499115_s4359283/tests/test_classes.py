@@ -2,7 +2,7 @@
 
 import unittest
 
-from dns.classes import Class
+from dns.classes import Class, class_from_code
 
 
 class ClassTestCase(unittest.TestCase):
@@ -15,6 +15,12 @@ class ClassTestCase(unittest.TestCase):
     def test_class_int(self):
         self.assertEqual(Class.IN, 1)
 
+    def test_unknown_class(self):
+        none = class_from_code(254)
+        self.assertEqual((none, str(none)), (254, "CLASS254"))
+        self.assertIs(Class.from_name("CLASS254"), none)
+        self.assertIs(Class.from_name("IN"), Class.IN)
+
 
 if __name__  == '__main__':
     unittest.main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+import unittest
+
+from dns.flight import SingleFlight
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def test_concurrent_calls_are_shared(self):
+        flights = SingleFlight()
+        calls = []
+
+        def work(name):
+            calls.append(name)
+            time.sleep(0.2)
+            return name.upper()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do("key", work, "example")))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, ["example"])
+        self.assertEqual(results, ["EXAMPLE"] * 5)
+        self.assertEqual(flights.flights, {})
+
+    def test_error_is_raised(self):
+        flights = SingleFlight()
+
+        def fail():
+            raise ValueError("no")
+
+        self.assertRaises(ValueError, flights.do, "key", fail)
+        self.assertEqual(flights.do("key", lambda: 1), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
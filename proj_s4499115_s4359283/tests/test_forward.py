@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from dns.forward import UpstreamPool
+from dns.infra import InfraCache
+import dns.consts as Consts
+
+
+class UpstreamPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upstreams = ["192.0.2.1", "192.0.2.2", "192.0.2.3"]
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            UpstreamPool(self.upstreams, "random", InfraCache(5))
+
+    def test_round_robin(self):
+        pool = UpstreamPool(self.upstreams, "round-robin", InfraCache(5))
+        firsts = [pool.order()[0] for _ in range(6)]
+        self.assertEqual(firsts, self.upstreams * 2)
+
+    def test_least_outstanding(self):
+        pool = UpstreamPool(self.upstreams, "least-outstanding", InfraCache(5))
+        pool.sent("192.0.2.1")
+        pool.sent("192.0.2.2")
+        self.assertEqual(pool.order()[0], "192.0.2.3")
+        pool.finished(["192.0.2.1"])
+        self.assertEqual(pool.order()[-1], "192.0.2.2")
+
+    def test_lowest_latency(self):
+        infra = InfraCache(5)
+        infra.record_rtt("192.0.2.1", 0.3)
+        infra.record_rtt("192.0.2.2", 0.01)
+        infra.record_rtt("192.0.2.3", 0.1)
+        pool = UpstreamPool(self.upstreams, "lowest-latency", infra)
+        orders = [pool.order() for _ in range(20)]
+        self.assertGreater(orders.count(["192.0.2.2", "192.0.2.3", "192.0.2.1"]), 10)
+
+    def test_failover(self):
+        infra = InfraCache(5)
+        pool = UpstreamPool(self.upstreams, "round-robin", infra)
+        pool.mark("192.0.2.1", False)
+        for _ in range(Consts.BACKOFF_THRESHOLD):
+            infra.record_failure("192.0.2.2")
+        for _ in range(3):
+            self.assertEqual(pool.order(), ["192.0.2.3", "192.0.2.1", "192.0.2.2"])
+        pool.mark("192.0.2.1", True)
+        self.assertEqual(sorted(pool.order()[:2]), ["192.0.2.1", "192.0.2.3"])
+
+
+if __name__ == '__main__':
+    unittest.main()
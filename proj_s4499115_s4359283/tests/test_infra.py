@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import time
+import unittest
+from unittest.mock import patch
+
+import dns.consts as Consts
+from dns.infra import InfraCache
+
+
+class InfraCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.infra = InfraCache(5)
+
+    def test_rto_unknown_server(self):
+        self.assertEqual(self.infra.rto("192.0.2.1"), Consts.INITIAL_RTO)
+
+    def test_record_rtt(self):
+        self.infra.record_rtt("192.0.2.1", 0.1)
+        self.assertAlmostEqual(self.infra.rto("192.0.2.1"), 0.3)
+        self.infra.record_rtt("192.0.2.1", 0.1)
+        info = self.infra.get("192.0.2.1")
+        self.assertAlmostEqual(info.srtt, 0.1)
+        self.assertAlmostEqual(info.rttvar, 0.0375)
+
+    def test_rto_doubles_on_failure(self):
+        self.infra.record_rtt("192.0.2.1", 0.1)
+        self.infra.record_failure("192.0.2.1")
+        self.assertAlmostEqual(self.infra.rto("192.0.2.1"), 0.6)
+
+    def test_backoff(self):
+        for _ in range(Consts.BACKOFF_THRESHOLD):
+            self.infra.record_failure("192.0.2.1")
+        self.assertGreater(self.infra.get("192.0.2.1").backoff_until, time.time())
+        self.infra.record_rtt("192.0.2.1", 0.1)
+        self.assertEqual(self.infra.get("192.0.2.1").backoff_until, 0.0)
+
+    @patch("dns.infra.random.random", return_value=1.0)
+    def test_order(self, _):
+        self.infra.record_rtt("192.0.2.2", 0.01)
+        for _ in range(Consts.BACKOFF_THRESHOLD):
+            self.infra.record_failure("192.0.2.3")
+        servers = self.infra.order(["192.0.2.3", "192.0.2.1", "192.0.2.2"])
+        self.assertEqual(servers, ["192.0.2.2", "192.0.2.1", "192.0.2.3"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import logging
+import os
+import queue
+import tempfile
+import unittest
+
+from dns.classes import Class
+from dns.log import LogPipeline, NonBlockingQueueHandler, QueryLog, RateLimitFilter
+from dns.message import Question
+from dns.name import Name
+from dns.rcodes import RCode
+from dns.rtypes import Type
+import dns.log
+
+
+class RateLimitFilterTestCase(unittest.TestCase):
+    def record(self, msg):
+        return logging.LogRecord("dns", logging.WARNING, __file__, 0, msg, (), None)
+
+    def test_burst(self):
+        limiter = RateLimitFilter(rate=0.001, burst=3)
+        passed = [limiter.filter(self.record("Received invalid data.")) for _ in range(10)]
+        self.assertEqual(passed, [True] * 3 + [False] * 7)
+        self.assertTrue(limiter.filter(self.record("Another message.")))
+
+    def test_suppressed(self):
+        limiter = RateLimitFilter(rate=1000, burst=1)
+        limiter.filter(self.record("x"))
+        limiter.filter(self.record("x"))
+        limiter.buckets["x"] = (1, limiter.buckets["x"][1], limiter.buckets["x"][2])#Refill the bucket
+        record = self.record("x")
+        self.assertTrue(limiter.filter(record))
+        self.assertEqual(record.suppressed, 1)
+
+
+class NonBlockingQueueHandlerTestCase(unittest.TestCase):
+    def test_full(self):
+        handler = NonBlockingQueueHandler(queue.Queue(1))
+        logger = logging.getLogger("dns.test.full")
+        logger.propagate = False
+        logger.addHandler(handler)
+        logger.warning("one")
+        logger.warning("two")#Dropped instead of blocking
+        self.assertEqual(handler.queue.qsize(), 1)
+        logger.removeHandler(handler)
+
+
+class QueryLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.question = Question(Name("example.com."), Type.A, Class.IN)
+
+    def test_pipeline(self):
+        stream = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "queries.log")
+            pipeline = LogPipeline(stream=stream, query_log=path, sample_rate=1.0)
+            pipeline.start()
+            dns.log.logger.info("Hello %s", "world")
+            dns.log.queries.log(("192.0.2.1", 5353), self.question, RCode.NoError, 0.0015, "udp")
+            pipeline.stop()
+            with open(path) as infile:
+                entries = [json.loads(line) for line in infile]
+            pipeline.listeners[1].handlers[0].close()
+        self.assertIn("[+] - Hello world\n", stream.getvalue())
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]["qname"], "example.com.")
+        self.assertEqual(entries[0]["client"], "192.0.2.1")
+        self.assertEqual(entries[0]["ms"], 1.5)
+        self.assertEqual(dns.log.queries.sample_rate, 0.0)
+
+    def test_sampling(self):
+        log = QueryLog(0.0)
+        log.random.random = lambda: self.fail("An unsampled query shouldn't draw a number")
+        log.log(("192.0.2.1", 5353), self.question, RCode.NoError, 0.001, "udp")
+
+
+if __name__ == "__main__":
+    unittest.main()
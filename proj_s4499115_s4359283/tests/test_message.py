@@ -54,6 +54,20 @@ class MessageTestCase(DNSTestCase):
         calls = [call(packet, 13), call(packet, 14), call(packet, 15)]
         ResourceMock.from_bytes.assert_has_calls(calls)
 
+    def test_message_edns(self):
+        message = Message(Header(9001, 0, 1, 0, 0, 0),
+                          [Question(Name("example.com"), Type.A, Class.IN)])
+        self.assertIsNone(message.edns)
+        self.assertEqual(message.payload_size, 512)
+        message.add_edns(1232)
+        message2 = Message.from_bytes(message.to_bytes())
+        self.assertEqual(message2.header.ar_count, 1)
+        self.assertEqual(message2.edns.class_, 1232)
+        self.assertEqual(message2.payload_size, 1232)
+        message2.remove_edns()
+        self.assertEqual(message2.header.ar_count, 0)
+        self.assertIsNone(message2.edns)
+
 
 class HeaderTestCase(DNSTestCase):
     def setUp(self):
@@ -177,3 +191,8 @@ class QuestionTestCase(DNSTestCase):
         self.assertEqual(question1, question2)
         self.assertEqual(offset, 17)
         MockName.from_bytes.assert_called_with(packet, 0)
+
+    def test_question_unknown_type(self):
+        packet = b"\x07example\x03com\x00\x00\x30\x00\x01"
+        question, offset = Question.from_bytes(packet, 0)
+        self.assertEqual((question.qtype, str(question.qtype), question.qclass), (48, "TYPE48", Class.IN))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import unittest
+from urllib.request import urlopen
+
+from dns.metrics import Histogram, Registry
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_buckets(self):
+        for micros in [0, 1, 31, 32, 33, 63, 64, 1000, 123456, Histogram.MAX_MICROS]:
+            low, high = Histogram.bounds(Histogram.index(micros))
+            self.assertTrue(low <= micros < high)
+
+    def test_percentile(self):
+        histogram = Histogram()
+        for millis in range(1, 1001):
+            histogram.observe(millis / 1000)
+        self.assertAlmostEqual(histogram.percentile(0.5), 0.5, delta=0.5 / Histogram.HALF)
+        self.assertAlmostEqual(histogram.percentile(0.99), 0.99, delta=0.99 / Histogram.HALF)
+        self.assertEqual(histogram.snapshot()["count"], 1000)
+
+    def test_empty(self):
+        self.assertEqual(Histogram().percentile(0.5), 0.0)
+
+    def test_cumulative(self):
+        histogram = Histogram()
+        histogram.observe(0.000001)
+        histogram.observe(0.001)
+        histogram.observe(1000)
+        buckets = histogram.cumulative()
+        self.assertEqual(buckets[0], (0.000001, 0))
+        self.assertEqual(buckets[1], (0.000002, 1))
+        self.assertEqual(dict(buckets)[1024 / 1e6], 2)
+        self.assertEqual(buckets[-1][1], 2)#Too big for the exported buckets, only counted in +Inf
+
+
+class RegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.queries = self.registry.counter("queries_total", "Queries", ["transport"])
+        self.in_flight = self.registry.gauge("in_flight", "In flight")
+        self.latency = self.registry.histogram("latency_seconds", "Latency")
+
+    def test_snapshot(self):
+        self.queries.labels("udp").inc()
+        self.queries.labels("udp").inc()
+        self.queries.labels("tcp").inc()
+        self.in_flight.inc()
+        self.latency.observe(0.01)
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot["queries_total"], {"udp": 2, "tcp": 1})
+        self.assertEqual(snapshot["in_flight"], {"": 1})
+        self.assertEqual(snapshot["latency_seconds"][""]["count"], 1)
+
+    def test_same_family(self):
+        self.assertIs(self.registry.counter("queries_total", "Queries", ["transport"]), self.queries)
+
+    def test_prometheus(self):
+        self.queries.labels("udp").inc()
+        self.latency.observe(0.01)
+        text = self.registry.to_prometheus()
+        self.assertIn("# TYPE queries_total counter\n", text)
+        self.assertIn('queries_total{transport="udp"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn("latency_seconds_count 1\n", text)
+
+    def test_serve(self):
+        self.queries.labels("udp").inc()
+        httpd = self.registry.serve(0)
+        try:
+            url = "http://127.0.0.1:{}/metrics".format(httpd.server_address[1])
+            with urlopen(url, timeout=5) as response:
+                text = response.read().decode()
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+        self.assertIn('queries_total{transport="udp"} 1\n', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
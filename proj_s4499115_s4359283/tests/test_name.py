@@ -2,7 +2,7 @@
 
 import unittest
 
-from dns.name import Name
+from dns.name import Name, parse_hostname
 
 
 class NameTestCase(unittest.TestCase):
@@ -111,10 +111,39 @@ class NameTestCase(unittest.TestCase):
         with self.assertRaises(ValueError):
             Name.from_bytes(packet, 0)
 
+    def test_name_from_bytes_loop(self):
+        packet = b"\x01a\xc0\x00"
+        with self.assertRaises(ValueError):
+            Name.from_bytes(packet, 0)
+
     def test_name_from_bytes4(self):
         packet = b"\x00"
         name, offset = Name.from_bytes(packet, 0)
         self.assertEqual(name.labels, [])
 
+    def test_name_hash(self):
+        self.assertEqual(hash(Name("www.example.com")), hash(Name("WWW.Example.com.")))
+        self.assertEqual(len({Name("www.example.com"), Name("WWW.example.com")}), 1)
+
+
+class ParseHostnameTestCase(unittest.TestCase):
+    def test_valid(self):
+        name = parse_hostname("WWW.Example-1.com.")
+        self.assertEqual(name.labels, ["WWW", "Example-1", "com"])
+        self.assertIs(parse_hostname("WWW.Example-1.com."), name)
+        self.assertEqual(str(parse_hostname("a")), "a.")
+
+    def test_invalid(self):
+        for hostname in ["", ".", "a..b", "-a.com", "a-.com", "a_b.com", "\u00e9.com", "a b.com"]:
+            self.assertIsNone(parse_hostname(hostname), hostname)
+
+    def test_limits(self):
+        self.assertIsNotNone(parse_hostname("a" * 63 + ".com"))
+        self.assertIsNone(parse_hostname("a" * 64 + ".com"))
+        self.assertIsNotNone(parse_hostname("a." * 126 + "b"))#255 bytes in the wire format
+        self.assertIsNone(parse_hostname("a." * 127 + "b"))
+        self.assertIsNone(parse_hostname("a-" * 100000 + "a"))
+
+
 if __name__  == '__main__':
     unittest.main()
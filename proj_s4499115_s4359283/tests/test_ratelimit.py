@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from dns.ratelimit import ResponseRateLimiter, ALLOW, DROP, SLIP
+
+
+class ResponseRateLimiterTestCase(unittest.TestCase):
+    def test_burst(self):
+        limiter = ResponseRateLimiter(rate=0.001, burst=3, slip=2)
+        actions = [limiter.check("192.0.2.1", "example.com.") for _ in range(7)]
+        self.assertEqual(actions, [ALLOW, ALLOW, ALLOW, DROP, SLIP, DROP, SLIP])
+
+    def test_no_slip(self):
+        limiter = ResponseRateLimiter(rate=0.001, burst=1, slip=0)
+        actions = [limiter.check("192.0.2.1", "example.com.") for _ in range(4)]
+        self.assertEqual(actions, [ALLOW, DROP, DROP, DROP])
+
+    def test_keys(self):
+        limiter = ResponseRateLimiter(rate=0.001, burst=1)
+        self.assertEqual(limiter.check("192.0.2.1", "example.com."), ALLOW)
+        self.assertNotEqual(limiter.check("192.0.2.200", "example.com."), ALLOW)#Same /24
+        self.assertEqual(limiter.check("198.51.100.1", "example.com."), ALLOW)
+        self.assertEqual(limiter.check("192.0.2.1", "example.org."), ALLOW)
+
+    def test_random_subdomains(self):
+        limiter = ResponseRateLimiter(rate=0.001, burst=3, slip=0)
+        actions = [limiter.check("192.0.2.1", "r{}.example.com.".format(i)) for i in range(5)]
+        self.assertEqual(actions, [ALLOW, ALLOW, ALLOW, DROP, DROP])
+        self.assertEqual(limiter.check("192.0.2.1", "www.example.org."), ALLOW)
+
+    def test_deep_random_subdomains(self):
+        zones = {"example.com.": "example.com."}
+        limiter = ResponseRateLimiter(rate=0.001, burst=3, slip=0, zones=lambda qname: zones.get(qname.split(".", 2)[-1]))
+        actions = [limiter.check("192.0.2.1", "r{}.r{}.example.com.".format(i, i)) for i in range(5)]
+        self.assertEqual(actions, [ALLOW, ALLOW, ALLOW, DROP, DROP])
+
+    def test_domain(self):
+        limiter = ResponseRateLimiter(zones=lambda qname: "example.com." if qname.endswith(".example.com.") else None)
+        self.assertEqual(limiter.domain("r1.r2.r3.example.com."), "example.com.")
+        self.assertEqual(limiter.domain("r1.r2.example.org."), "example.org.")
+        self.assertEqual(ResponseRateLimiter().domain("r1.r2.example.org."), "example.org.")
+        self.assertEqual(ResponseRateLimiter().domain("com."), "com.")
+        self.assertEqual(ResponseRateLimiter().domain(""), ".")
+
+    def test_ipv6(self):
+        limiter = ResponseRateLimiter(rate=0.001, burst=1)
+        self.assertEqual(limiter.check("2001:db8:0:1::1", "example.com."), ALLOW)
+        self.assertNotEqual(limiter.check("2001:db8:0:1::2", "example.com."), ALLOW)#Same /56
+        self.assertEqual(limiter.check("2001:db8:1::1", "example.com."), ALLOW)
+
+    def test_refill(self):
+        limiter = ResponseRateLimiter(rate=10, burst=1)
+        self.assertEqual(limiter.check("192.0.2.1", "example.com."), ALLOW)
+        self.assertNotEqual(limiter.check("192.0.2.1", "example.com."), ALLOW)
+        limiter.stamps = [stamp - 0.2 for stamp in limiter.stamps]#As if 0.2 seconds passed
+        self.assertEqual(limiter.check("192.0.2.1", "example.com."), ALLOW)
+
+    def test_fixed_size(self):
+        limiter = ResponseRateLimiter(rate=0.001, burst=1, size=1)
+        self.assertEqual(limiter.check("192.0.2.1", "example.com."), ALLOW)
+        self.assertEqual(limiter.check("192.0.2.1", "example.org."), ALLOW)#Takes the only slot over
+        self.assertEqual(limiter.check("192.0.2.1", "example.com."), ALLOW)
+        self.assertEqual(len(limiter.keys), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
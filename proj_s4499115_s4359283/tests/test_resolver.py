@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from dns.cache import RecordCache
+from dns.resolver import Budget, Resolver
+from dns.message import Header, Message, Question
+from dns.name import Name, parse_hostname
+from dns.rcodes import RCode
+from dns.resource import ARecordData, CNAMERecordData, NSRecordData, ResourceRecord
+from dns.rtypes import Type
+from dns.classes import Class
+import dns.consts
+import dns.metrics
+import dns.tcp
+import dns.trace
+
+
+class ResolveManyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.resolver = Resolver(1, False, 0, use_rs=False)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def fake_resolve(self, name, qtype, qclass):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        if name == "bad":
+            raise ValueError("bad name")
+        return RCode.NoError, [name], [], []
+
+    def test_resolve_many(self):
+        names = ("host{}.example.com".format(i) for i in range(50))
+        with patch.object(self.resolver, "resolve", side_effect=self.fake_resolve):
+            results = dict(self.resolver.resolve_many(names, concurrency=4))
+        self.assertEqual(len(results), 50)
+        self.assertEqual(results["host7.example.com"], (RCode.NoError, ["host7.example.com"], [], []))
+        self.assertLessEqual(self.max_in_flight, 4)
+
+    def test_resolve_many_failure(self):
+        with patch.object(self.resolver, "resolve", side_effect=self.fake_resolve):
+            results = dict(self.resolver.resolve_many(["bad", "good"], Type.MX, Class.IN))
+        self.assertEqual(results["bad"], (RCode.ServFail, [], [], []))
+        self.assertEqual(results["good"][0], RCode.NoError)
+
+
+
+class RetryBudgetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.resolver = Resolver(1, False, 0, nameservers=["10.0.0.1"], use_rs=False)
+        self.query = Message(Header(1, 0, 1, 0, 0, 0), [Question(Name("www.test."), Type.A, Class.IN)])
+        self.query.add_edns(1232)
+
+    def fake_query(self, query, address, timeout):
+        #FORMERR to EDNS, nothing without recursion, then too big for UDP
+        header = Header(query.header.ident, 0, 1, 0, 0, 0)
+        header.qr = 1
+        if query.edns is not None:
+            header.rcode = RCode.FormErr
+        elif query.header.rd:
+            header.tc = 1
+        return Message(header, query.questions)
+
+    def ask(self, budget, server="10.0.0.1"):
+        with patch.object(self.resolver.udp_pool, "query", side_effect=self.fake_query), \
+                patch.object(self.resolver, "ask_server_tcp", return_value="over tcp") as tcp:
+            return self.resolver.ask_server(self.query, server, budget), tcp.call_count
+
+    def test_retries_charged(self):
+        budget = Budget(queries=3)
+        self.assertEqual(self.ask(budget), ("over tcp", 1))
+        self.assertEqual(budget.queries, 0)
+
+    def test_retries_exhausted(self):
+        budget = Budget(queries=2)
+        self.assertEqual(self.ask(budget), (None, 0))
+        self.assertEqual(budget.queries, 0)
+
+    def test_no_recursion_from_referred_servers(self):
+        budget = Budget(queries=3)
+        response, tcp = self.ask(budget, "10.0.0.9")
+        self.assertEqual((response.answers, tcp), ([], 0))
+        self.assertEqual(budget.queries, 2)
+
+
+class AskServerTCPTestCase(unittest.TestCase):
+    def test_garbage_reply(self):
+        resolver = Resolver(1, False, 0, use_rs=False)
+        query = Message(Header(1, 0, 1, 0, 0, 0), [Question(Name("www.test."), Type.A, Class.IN)])
+        ours, theirs = socket.socketpair()
+        dns.tcp.send_message(theirs, b"\x00\x01\x02")
+        with patch.object(resolver.tcp_pool, "acquire", return_value=(ours, False)):
+            self.assertIsNone(resolver.ask_server_tcp(query, "10.0.0.1"))
+        self.assertEqual(ours.fileno(), -1)
+        theirs.close()
+
+
+class FakePool(object):
+    """ Stands in for the SocketPool: servers answer after a delay, with an rcode, or never """
+
+    def __init__(self, answers):
+        """ answers maps a server to the seconds it takes to answer and the rcode it answers with """
+        self.answers = answers
+        self.sent = []#Servers the query was sent to and when
+        self.cancelled = []
+
+    def resolve_address(self, address):
+        return address
+
+    def send(self, query, address, replies):
+        self.sent.append((address[0], time.time()))
+        if address[0] not in self.answers:
+            return
+        delay, rcode = self.answers[address[0]]
+        header = Header(query.header.ident, 0, 1, 0, 0, 0)
+        header.qr = 1
+        header.aa = 1
+        header.rcode = rcode
+        response = Message(header, query.questions, [record(str(query.questions[0].qname), Type.A, ARecordData(address[0]))])
+        timer = threading.Timer(delay, replies.put, [(address, response)])
+        timer.daemon = True
+        timer.start()
+
+    def cancel(self, query, address, replies):
+        self.cancelled.append(address[0])
+
+
+class StaggerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.resolver = Resolver(0.3, False, 0, use_rs=False)#Servers are waited for 0.3 seconds
+        self.query = Message(Header(1, 0, 1, 0, 0, 0), [Question(Name("www.test."), Type.A, Class.IN)])
+        self.servers = ["10.0.0.{}".format(i) for i in range(1, 6)]
+
+    def ask(self, answers):
+        self.pool = FakePool(answers)
+        with patch.object(self.resolver, "udp_pool", self.pool), \
+                patch.object(self.resolver.infra, "stagger_delay", return_value=0.1):
+            start = time.time()
+            response, asked = self.resolver.ask_servers(self.query, self.servers)
+        self.sent = [(server, sent - start) for server, sent in self.pool.sent]
+        return response, asked
+
+    def test_next_server_after_delay(self):
+        response, asked = self.ask({"10.0.0.2": (0, RCode.NoError)})
+        self.assertEqual(asked, ["10.0.0.1", "10.0.0.2"])
+        self.assertLess(self.sent[0][1], 0.05)
+        self.assertGreaterEqual(self.sent[1][1], 0.1)
+        self.assertEqual(str(response.answers[0].rdata.address), "10.0.0.2")
+
+    def test_parallel_cap(self):
+        response, asked = self.ask({"10.0.0.5": (0, RCode.NoError)})
+        self.assertIsNone(response)
+        self.assertEqual(asked, self.servers[:dns.consts.MAX_PARALLEL_QUERIES])
+        self.assertEqual([server for server, _ in self.sent], asked)
+
+    def test_first_usable_answer_wins(self):
+        response, asked = self.ask({"10.0.0.1": (0, RCode.ServFail), "10.0.0.2": (0.05, RCode.NoError),
+                                    "10.0.0.3": (0, RCode.NoError)})
+        self.assertEqual(str(response.answers[0].rdata.address), "10.0.0.2")
+        self.assertEqual(asked, ["10.0.0.1", "10.0.0.2"])
+        self.assertLess(self.sent[1][1], 0.05)#The SERVFAIL made it ask the next server right away
+
+    def test_late_replies_dropped(self):
+        self.servers = ["10.0.0.1"]
+        response, asked = self.ask({"10.0.0.1": (0.5, RCode.NoError)})
+        self.assertEqual((response, asked), (None, ["10.0.0.1"]))
+        self.assertEqual(self.pool.cancelled, ["10.0.0.1"])#The pool stops waiting for the reply
+
+
+class UpstreamMetricsTestCase(unittest.TestCase):
+    def test_referred_servers_share_a_label(self):
+        resolver = Resolver(0.1, False, 0, nameservers=["10.0.0.1"], use_rs=False)
+        query = Message(Header(1, 0, 1, 0, 0, 0), [Question(Name("www.test."), Type.A, Class.IN)])
+        configured, other = dns.metrics.upstream_timeouts.labels("10.0.0.1"), dns.metrics.upstream_timeouts.labels("other")
+        before = configured.value, other.value
+        with patch.object(resolver, "udp_pool", FakePool({})):
+            self.assertEqual(resolver.ask_servers(query, ["10.0.0.1", "10.0.0.9"]), (None, ["10.0.0.1", "10.0.0.9"]))
+        self.assertEqual((configured.value - before[0], other.value - before[1]), (1, 1))
+        self.assertNotIn(("10.0.0.9",), dns.metrics.upstream_timeouts.children)
+
+
+def record(name, type_, rdata):
+    return ResourceRecord(Name(name), type_, Class.IN, 60, rdata)
+
+
+def referral(zone, nameserver, address=None):
+    glue = [record(nameserver, Type.A, ARecordData(address))] if address else []
+    return [], [record(zone, Type.NS, NSRecordData(Name(nameserver)))], glue
+
+
+def answer(name, address):
+    return [record(name, Type.A, ARecordData(address))], [], []
+
+
+#Referrals of the root server (10.0.0.1) per TLD
+ROOT = {
+    "test": referral("test.", "ns.test.", "10.0.0.2"),
+    "other": referral("other.", "ns.other.", "10.0.0.3"),
+    "com": referral("com.", "ns.com.", "10.0.0.5"),
+}
+
+#Server and question name to the sections of the response, and its rcode if it isn't NOERROR
+HIERARCHY = {
+    ("10.0.0.2", "www.test."): answer("www.test.", "192.0.2.1"),
+    ("10.0.0.2", "alias.test."): ([record("alias.test.", Type.CNAME, CNAMERecordData(Name("www.other.")))], [], []),
+    ("10.0.0.2", "glueless.test."): referral("glueless.test.", "ns.glueless.other."),
+    ("10.0.0.2", "www.glueless.test."): referral("glueless.test.", "ns.glueless.other."),
+    ("10.0.0.2", "loop.test."): referral("loop.test.", "ns.loop.test."),
+    ("10.0.0.2", "ns.loop.test."): referral("loop.test.", "ns.loop.test."),
+    ("10.0.0.2", "b.www.test."): ([], [], []),
+    ("10.0.0.2", "a.b.www.test."): answer("a.b.www.test.", "192.0.2.4"),
+    ("10.0.0.2", "x.test."): ([], [], [], RCode.NXDomain),
+    ("10.0.0.2", "y.x.test."): answer("y.x.test.", "192.0.2.5"),
+    ("10.0.0.2", "www.evil.test."): referral("com.", "ns.evil.test.", "10.0.0.66"),
+    ("10.0.0.2", "sub.test."): referral("sub.test.", "ns.sub.other.", "10.0.0.66"),
+    ("10.0.0.2", "sibling.test."): referral("sibling.test.", "ns.other.test.", "10.0.0.8"),
+    ("10.0.0.8", "sibling.test."): answer("sibling.test.", "192.0.2.10"),
+    ("10.0.0.3", "ns.sub.other."): answer("ns.sub.other.", "10.0.0.7"),
+    ("10.0.0.5", "www.bank.com."): answer("www.bank.com.", "192.0.2.7"),
+    ("10.0.0.7", "sub.test."): answer("sub.test.", "192.0.2.8"),
+    ("10.0.0.2", "poison.test."): ([record("poison.test.", Type.CNAME, CNAMERecordData(Name("www.other."))),
+                                    record("www.other.", Type.A, ARecordData("10.0.0.66"))], [], []),
+    ("10.0.0.2", "extra.test."): ([record("extra.test.", Type.A, ARecordData("192.0.2.9"))],
+                                  [record("other.", Type.NS, NSRecordData(Name("ns.other.")))],
+                                  [record("ns.other.", Type.A, ARecordData("10.0.0.66"))]),
+    ("10.0.0.3", "www.other."): answer("www.other.", "192.0.2.2"),
+    ("10.0.0.3", "ns.glueless.other."): answer("ns.glueless.other.", "10.0.0.4"),
+    ("10.0.0.4", "glueless.test."): answer("glueless.test.", "192.0.2.3"),
+    ("10.0.0.4", "www.glueless.test."): answer("www.glueless.test.", "192.0.2.6"),
+}
+
+
+class HierarchyTestCase(unittest.TestCase):
+    """ Resolves against the fake servers of HIERARCHY """
+
+    def setUp(self):
+        self.resolver = Resolver(1, False, 0, nameservers=["10.0.0.1"], use_rs=False, minimise=False)
+        self.asked = []
+        self.queries = []
+
+    def fake_ask_servers(self, query, servers, on_send=None, budget=None):
+        server, qname = servers[0], str(query.questions[0].qname).lower()
+        if budget is not None:
+            budget.take()
+        self.asked.append((server, qname))
+        self.queries.append(query)
+        header = Header(query.header.ident, 0, 1, 0, 0, 0)
+        header.qr = 1
+        if qname.endswith("deep.test."):#Every server refers to another one, a label further down
+            zone = ".".join(qname.split(".")[-len(self.asked) - 2:])
+            sections = referral(zone, "ns." + zone, "10.1.0.{}".format(len(self.asked)))
+        elif server == "10.0.0.1":
+            sections = ROOT[qname.rstrip(".").split(".")[-1]]
+        else:
+            sections = HIERARCHY[(server, qname)]
+        header.aa = int(bool(sections[0]) or not sections[1])#Authoritative unless it is a referral
+        if len(sections) > 3:
+            header.rcode = sections[3]
+        return Message(header, query.questions, *[list(section) for section in sections[:3]]), [server]
+
+    def resolve(self, name, budget=None):
+        with patch.object(self.resolver, "ask_servers", side_effect=self.fake_ask_servers):
+            root = self.resolver.start_step(name, Type.A, Class.IN, False)
+            return self.resolver.iterate(root, budget)
+
+
+class IterateTestCase(HierarchyTestCase):
+    def test_referral(self):
+        rcode, answers, _, _ = self.resolve("www.test.")
+        self.assertEqual((rcode, [str(answer.rdata.address) for answer in answers]), (RCode.NoError, ["192.0.2.1"]))
+        self.assertEqual(self.asked, [("10.0.0.1", "www.test."), ("10.0.0.2", "www.test.")])
+
+    def test_cname(self):
+        rcode, answers, _, _ = self.resolve("alias.test.")
+        self.assertEqual([answer.type_ for answer in answers], [Type.CNAME, Type.A])
+        self.assertEqual(str(answers[1].rdata.address), "192.0.2.2")
+
+    def test_glueless(self):
+        rcode, answers, _, _ = self.resolve("glueless.test.")
+        self.assertEqual(str(answers[0].rdata.address), "192.0.2.3")
+        self.assertIn(("10.0.0.3", "ns.glueless.other."), self.asked)
+
+    def test_glueless_traced(self):
+        tracer = dns.trace.tracer
+        tracer.threshold = 60
+        try:
+            root = tracer.begin("query")
+            with patch.object(self.resolver, "ask_servers", side_effect=self.fake_ask_servers):
+                rcode, answers, _, _ = self.resolver.resolve("glueless.test.", Type.A)
+            tracer.finish(root)
+        finally:
+            tracer.threshold = None
+        self.assertEqual(str(answers[0].rdata.address), "192.0.2.3")
+        nameservers = [child for child in root.to_dict()["children"] if child["name"] == "nameserver"]
+        self.assertEqual([child["nsdname"] for child in nameservers], ["ns.glueless.other."])
+
+    def test_out_of_bailiwick_referral(self):
+        self.assertEqual(self.resolve("www.evil.test.")[0], RCode.ServFail)
+        self.assertNotIn("10.0.0.66", [server for server, _ in self.asked])
+
+    def test_out_of_bailiwick_glue(self):
+        rcode, answers, _, _ = self.resolve("sub.test.")
+        self.assertEqual(str(answers[0].rdata.address), "192.0.2.8")
+        self.assertIn(("10.0.0.3", "ns.sub.other."), self.asked)
+        self.assertNotIn("10.0.0.66", [server for server, _ in self.asked])
+
+    def test_sibling_glue(self):
+        rcode, answers, _, _ = self.resolve("sibling.test.")
+        self.assertEqual(str(answers[0].rdata.address), "192.0.2.10")
+        self.assertEqual(self.asked, [("10.0.0.1", "sibling.test."), ("10.0.0.2", "sibling.test."), ("10.0.0.8", "sibling.test.")])
+
+    def test_out_of_bailiwick_answer(self):
+        rcode, answers, _, _ = self.resolve("poison.test.")
+        self.assertEqual([str(answer.rdata.address) for answer in answers[1:]], ["192.0.2.2"])
+        self.assertIn(("10.0.0.3", "www.other."), self.asked)
+
+    def test_out_of_bailiwick_sections(self):
+        rcode, answers, authorities, additionals = self.resolve("extra.test.")
+        self.assertEqual((str(answers[0].rdata.address), authorities, additionals), ("192.0.2.9", [], []))
+
+    def test_cycle(self):
+        rcode, answers, _, _ = self.resolve("loop.test.")
+        self.assertEqual((rcode, answers), (RCode.ServFail, []))
+        self.assertLess(len(self.asked), 10)
+
+    def test_query_budget(self):
+        self.assertEqual(self.resolve("a." * 20 + "deep.test.", Budget(queries=5))[0], RCode.ServFail)
+        self.assertEqual(len(self.asked), 5)
+
+    def test_time_budget(self):
+        self.assertEqual(self.resolve("www.test.", Budget(seconds=0))[0], RCode.ServFail)
+        self.assertEqual(self.asked, [])
+
+    def test_parsed_name(self):
+        name = parse_hostname("www.test")
+        with patch.object(self.resolver, "ask_servers", side_effect=self.fake_ask_servers):
+            hostname, _, addresses = self.resolver.gethostbyname("www.test")
+        self.assertEqual((hostname, addresses), ("www.test.", ["192.0.2.1"]))
+        self.assertTrue(all(query.questions[0].qname is name for query in self.queries))
+
+    def test_no_recursion_desired(self):
+        self.resolve("www.test.")
+        self.assertEqual([query.header.rd for query in self.queries], [0, 0])
+
+
+class MinimiseTestCase(HierarchyTestCase):
+    def setUp(self):
+        super(MinimiseTestCase, self).setUp()
+        self.resolver.minimise = True
+
+    def test_minimise(self):
+        rcode, answers, _, _ = self.resolve("a.b.www.test.")
+        self.assertEqual(str(answers[0].rdata.address), "192.0.2.4")
+        self.assertEqual(self.asked, [("10.0.0.1", "test."), ("10.0.0.2", "www.test."),
+                                      ("10.0.0.2", "b.www.test."), ("10.0.0.2", "a.b.www.test.")])
+        self.assertEqual([query.questions[0].qtype for query in self.queries], [Type.A] * 4)
+
+    def test_minimise_nxdomain(self):
+        rcode, answers, _, _ = self.resolve("y.x.test.")
+        self.assertEqual(str(answers[0].rdata.address), "192.0.2.5")
+        self.assertEqual(self.asked[-2:], [("10.0.0.2", "x.test."), ("10.0.0.2", "y.x.test.")])
+
+
+class ZoneCutTestCase(HierarchyTestCase):
+    def setUp(self):
+        super(ZoneCutTestCase, self).setUp()
+        with patch.object(RecordCache, "read_cache_file"):
+            self.resolver = Resolver(1, True, 0, nameservers=["10.0.0.1"], use_rs=False, minimise=False)
+
+    def test_zone_cut(self):
+        self.resolve("www.test.")
+        self.asked = []
+        self.resolve("alias.test.")
+        self.assertEqual(self.asked, [("10.0.0.2", "alias.test."), ("10.0.0.1", "www.other."), ("10.0.0.3", "www.other.")])
+
+    def test_out_of_bailiwick_not_cached(self):
+        self.resolve("www.evil.test.")
+        self.asked = []
+        rcode, answers, _, _ = self.resolve("www.bank.com.")
+        self.assertEqual(str(answers[0].rdata.address), "192.0.2.7")
+        self.assertEqual(self.asked, [("10.0.0.1", "www.bank.com."), ("10.0.0.5", "www.bank.com.")])
+
+    def test_out_of_bailiwick_answer_not_cached(self):
+        self.resolve("poison.test.")
+        self.asked = []
+        rcode, answers, _, _ = self.resolve("www.other.")
+        self.assertEqual(str(answers[0].rdata.address), "192.0.2.2")
+
+    def test_glueless_cached(self):
+        self.resolve("glueless.test.")
+        self.asked = []
+        rcode, answers, _, _ = self.resolve("www.glueless.test.")
+        self.assertEqual(str(answers[0].rdata.address), "192.0.2.6")
+        self.assertEqual(self.asked, [("10.0.0.4", "www.glueless.test.")])
+
+
+class CacheMetricsTestCase(HierarchyTestCase):
+    def setUp(self):
+        super(CacheMetricsTestCase, self).setUp()
+        with patch.object(RecordCache, "read_cache_file"):
+            self.resolver = Resolver(1, True, 0, nameservers=["10.0.0.1"], use_rs=False, minimise=False)
+
+    def counts(self):
+        counters = [dns.metrics.response_hits, dns.metrics.response_misses, dns.metrics.rrset_hits,
+                    dns.metrics.rrset_misses, dns.metrics.stale_hits, dns.metrics.stale_misses]
+        return [counter.value for counter in counters] + [dns.metrics.cache_time.count]
+
+    def test_counted_once(self):
+        before = self.counts()
+        with patch.object(self.resolver, "ask_servers", side_effect=self.fake_ask_servers):
+            self.resolver.resolve_or_stale("www.test.", Type.A, Class.IN)#A miss
+            self.resolver.resolve_or_stale("www.test.", Type.A, Class.IN)#A hit
+        self.assertEqual([after - count for after, count in zip(self.counts(), before)], [1, 1, 0, 1, 0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
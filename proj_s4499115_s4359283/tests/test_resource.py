@@ -4,7 +4,7 @@ from unittest.mock import MagicMock, patch
 
 from util import DNSTestCase
 
-from dns.resource import ResourceRecord, ARecordData
+from dns.resource import ResourceRecord, RecordData, ARecordData, SOARecordData, MXRecordData, TXTRecordData, AAAARecordData, GenericRecordData
 from dns.name import Name
 from dns.rtypes import Type
 from dns.classes import Class
@@ -46,6 +46,17 @@ class ResourceRecordTestCase(DNSTestCase):
         MockName.from_bytes.assert_called_with(packet, 0)
         MockRData.create_from_bytes.assert_called_with(Type.A, packet, 23, 4)
 
+    def test_unknown_type_round_trip(self):
+        packet = (b"\x07example\x03com\x00\x00\x2e\x00\x01\x00\x00\x00\x03\x00"
+                  b"\x03\x01\x02\x03")
+        record, offset = ResourceRecord.from_bytes(packet, 0)
+        self.assertEqual((record.type_, record.class_, offset), (46, Class.IN, len(packet)))
+        self.assertIsInstance(record.rdata, GenericRecordData)
+        self.assertEqual(record.to_bytes(0, {}), packet)
+        record2 = ResourceRecord.from_dict(record.to_dict())
+        self.assertEqual(record2.type_, record.type_)
+        self.assertEqual(record2.rdata.data, b"\x01\x02\x03")
+
 
 class RecordDataTestCase(DNSTestCase):
     pass
@@ -53,3 +64,28 @@ class RecordDataTestCase(DNSTestCase):
 
 class ARecordDataTestCase(DNSTestCase):
     pass
+
+
+class SOARecordDataTestCase(DNSTestCase):
+    def test_soa_round_trip(self):
+        rdata = SOARecordData(Name("ns1.example.com"), Name("hostmaster.example.com"),
+                              7, 10800, 15, 86400, 3600)
+        packet = rdata.to_bytes(0, {})
+        rdata2 = SOARecordData.from_bytes(packet, 0, len(packet))
+        self.assertEqual(rdata2.to_dict(), rdata.to_dict())
+
+
+class OtherRecordDataTestCase(DNSTestCase):
+    def test_round_trip(self):
+        for type_, rdata in [(Type.MX, MXRecordData(10, Name("mail.example.com"))),
+                             (Type.TXT, TXTRecordData([b"v=spf1 -all", b"\xff"])),
+                             (Type.AAAA, AAAARecordData("2001:db8::1"))]:
+            packet = rdata.to_bytes(0, {})
+            rdata2 = RecordData.create_from_bytes(type_, packet, 0, len(packet))
+            self.assertEqual(rdata2.to_dict(), rdata.to_dict())
+            rdata3 = RecordData.create_from_dict(type_, rdata.to_dict())
+            self.assertEqual(rdata3.to_bytes(0, {}), packet)
+
+    def test_generic_to_dict(self):
+        rdata = GenericRecordData(b"\x00\x01\x02")
+        self.assertEqual(GenericRecordData.from_dict(rdata.to_dict()).data, b"\x00\x01\x02")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from dns.server import Server, ZoneWatcher
+
+ZONE = "ru.nl. 3600 IN SOA ns1.ru.nl. hostmaster.ru.nl. (1 3H 15 1w 3h)\nru.nl. 3600 IN A {}\n"
+
+
+class ReloadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.zone_file = os.path.join(self.directory, "zone.txt")
+        self.write(ZONE.format("131.174.78.60"))
+        self.server = Server(0, False, 0, zone_file=self.zone_file)
+
+    def tearDown(self):
+        self.server.shutdown()
+        shutil.rmtree(self.directory)
+
+    def write(self, content):
+        with open(self.zone_file, "w") as outfile:
+            outfile.write(content)
+
+    def addresses(self, catalog):
+        _, zone = catalog.find_zone("ru.nl")
+        return [str(record.rdata.address) for record in zone.get_records("ru.nl.") if hasattr(record.rdata, "address")]
+
+    def test_reload(self):
+        old = self.server.catalog
+        self.write(ZONE.format("131.174.78.61"))
+        self.assertTrue(self.server.reload())
+        self.assertIsNot(self.server.catalog, old)
+        self.assertEqual(self.server.catalog.version, old.version + 1)
+        self.assertEqual(self.addresses(self.server.catalog), ["131.174.78.61"])
+        self.assertEqual(self.addresses(old), ["131.174.78.60"])#Handlers that hold the old catalog are unaffected
+
+    def test_failed_reload(self):
+        old = self.server.catalog
+        for content in ("ru.nl. 3600 IN BOGUS x\n", "garbage\n"):
+            self.write(content)
+            self.assertFalse(self.server.reload())
+            self.assertIs(self.server.catalog, old)
+            self.assertEqual(self.server.catalog.version, old.version)
+        os.remove(self.zone_file)
+        self.assertFalse(self.server.reload())
+        self.assertIs(self.server.catalog, old)
+
+    def test_watcher(self):
+        watcher = ZoneWatcher(self.server, 0.01)
+        watcher.start()
+        self.write(ZONE.format("131.174.78.61"))
+        os.utime(self.zone_file, (time.time() + 10, time.time() + 10))#Make sure the mtime changes
+        deadline = time.time() + 2
+        while self.server.catalog.version == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.server.catalog.version, 1)
+        self.assertEqual(self.addresses(self.server.catalog), ["131.174.78.61"])
+        self.server.done = True
+        watcher.join(1)
+        self.assertFalse(watcher.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
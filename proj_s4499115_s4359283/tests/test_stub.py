@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from dns.stub import StubServer
+from dns.message import Message, Header, Question
+from dns.name import Name
+from dns.rcodes import RCode
+from dns.rtypes import Type
+from dns.classes import Class
+
+
+def query(name, qtype=Type.A):
+    return Message(Header(1, 0, 1, 0, 0, 0), [Question(Name(name), qtype, Class.IN)])
+
+
+class StubServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = StubServer(("127.0.0.1", 0), ".", {"bench.": ("ns.bench.", "127.0.0.3")})
+        self.leaf = StubServer(("127.0.0.1", 0), "zone.bench.", synthesize=True)
+
+    def test_referral(self):
+        response = self.root.answer(query("h1.zone.bench."))
+        self.assertEqual(response.header.aa, 0)
+        self.assertEqual([str(r.rdata.nsdname) for r in response.authorities], ["ns.bench."])
+        self.assertEqual([r.rdata.address for r in response.additionals], ["127.0.0.3"])
+
+    def test_synthesized(self):
+        response = self.leaf.answer(query("h258.zone.bench."))
+        self.assertEqual([r.rdata.address for r in response.answers], ["10.0.1.2"])
+
+        response = self.leaf.answer(query("c2-5.zone.bench."))
+        self.assertEqual([str(r.rdata.cname) for r in response.answers], ["c1-5.zone.bench."])
+        response = self.leaf.answer(query("c1-5.zone.bench."))
+        self.assertEqual([str(r.rdata.cname) for r in response.answers], ["h5.zone.bench."])
+
+    def test_negative(self):
+        response = self.leaf.answer(query("nx1.zone.bench."))
+        self.assertEqual(response.header.rcode, RCode.NXDomain)
+        self.assertEqual([r.type_ for r in response.authorities], [Type.SOA])
+
+        response = self.leaf.answer(query("h1.zone.bench.", Type.MX))
+        self.assertEqual((response.header.rcode, response.answers), (RCode.NoError, []))
+        self.assertEqual([r.type_ for r in response.authorities], [Type.SOA])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import socket
+import unittest
+
+import dns.tcp
+from dns.tcp import ConnectionPool
+
+
+class TCPTestCase(unittest.TestCase):
+    def test_message_round_trip(self):
+        left, right = socket.socketpair()
+        dns.tcp.send_message(left, b"\x01\x02\x03")
+        dns.tcp.send_message(left, b"")
+        self.assertEqual(dns.tcp.recv_message(right), b"\x01\x02\x03")
+        self.assertEqual(dns.tcp.recv_message(right), b"")
+        left.close()
+        self.assertIsNone(dns.tcp.recv_message(right))
+        right.close()
+
+    def test_pool_reuses_connections(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        address = listener.getsockname()
+        pool = ConnectionPool(size=1)
+
+        sock, reused = pool.acquire(address, 1)
+        self.assertFalse(reused)
+        pool.release(address, sock)
+        sock2, reused = pool.acquire(address, 1)
+        self.assertTrue(reused)
+        self.assertIs(sock, sock2)
+
+        pool.release(address, sock2)
+        pool.close()
+        listener.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import tempfile
+import time
+import unittest
+
+from dns.trace import Sampler, Tracer, NULL_SPAN
+import dns.log
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TracerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.handler = ListHandler()
+        dns.log.slow_logger.addHandler(self.handler)
+        dns.log.slow_logger.propagate = False
+
+    def tearDown(self):
+        dns.log.slow_logger.removeHandler(self.handler)
+        dns.log.slow_logger.propagate = True
+
+    def test_disabled(self):
+        tracer = Tracer()
+        self.assertIsNone(tracer.begin("query"))
+        self.assertIs(tracer.span("resolve"), NULL_SPAN)
+        tracer.event("reply", server="192.0.2.1")
+
+    def test_tree(self):
+        tracer = Tracer(0)
+        root = tracer.begin("query", qname="example.com.")
+        with tracer.span("resolve"):
+            tracer.event("reply", server="192.0.2.1", rtt_ms=1.0)
+            with tracer.span("cname", target="www.example.com."):
+                pass
+        now = time.perf_counter()
+        tracer.record("send", now, now + 0.001)
+        tracer.finish(root)
+
+        self.assertIs(tracer.span("after"), NULL_SPAN)
+        tree = root.to_dict()
+        self.assertEqual(tree["qname"], "example.com.")
+        self.assertEqual([child["name"] for child in tree["children"]], ["resolve", "send"])
+        resolve = tree["children"][0]
+        self.assertEqual([child["name"] for child in resolve["children"]], ["reply", "cname"])
+        self.assertEqual(resolve["children"][0]["server"], "192.0.2.1")
+        self.assertEqual(len(self.handler.records), 1)
+        logged = json.loads(self.handler.records[0].getMessage().split(": ", 1)[1])
+        self.assertEqual(logged["name"], "query")
+
+    def test_fast_query(self):
+        tracer = Tracer(60)
+        tracer.finish(tracer.begin("query"))
+        self.assertEqual(self.handler.records, [])
+
+
+class SamplerTestCase(unittest.TestCase):
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.folded")
+            sampler = Sampler(0, path)
+            sampler.sample()
+            sampler.write()
+            with open(path) as infile:
+                lines = infile.read().splitlines()
+        self.assertEqual(sampler.samples, 1)
+        mine = [line for line in lines if "test_profile (test_trace.py:" in line]
+        self.assertEqual(len(mine), 1)
+        self.assertRegex(mine[0], r";sample \(trace.py:\d+\) 1$")
+
+
+if __name__ == "__main__":
+    unittest.main()
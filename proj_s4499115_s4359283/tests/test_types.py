@@ -2,7 +2,7 @@
 
 import unittest
 
-from dns.rtypes import Type
+from dns.rtypes import Type, type_from_code
 
 
 class TypeTestCase(unittest.TestCase):
@@ -15,6 +15,18 @@ class TypeTestCase(unittest.TestCase):
     def test_type_int(self):
         self.assertEqual(Type.A, 1)
 
+    def test_unknown_type(self):
+        rrsig = Type(46)
+        self.assertEqual((rrsig, str(rrsig)), (46, "TYPE46"))
+        self.assertIs(Type(46), rrsig)
+        self.assertIs(type_from_code(46), rrsig)
+        self.assertIs(Type.from_name("TYPE46"), rrsig)
+        self.assertRaises(ValueError, Type, 0x10000)
+        self.assertRaises(KeyError, Type.from_name, "RRSIG")
+
+    def test_type_from_code(self):
+        self.assertIs(type_from_code(28), Type.AAAA)
+
 
 if __name__  == '__main__':
     unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import dns.consts
+from dns.udp import SocketPool
+from dns.message import Message, Header, Question
+from dns.name import Name
+from dns.rtypes import Type
+from dns.classes import Class
+
+
+class SocketPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.address = self.server.getsockname()
+        self.pool = SocketPool(size=2)
+
+    def tearDown(self):
+        self.server.close()
+        for sock in self.pool.sockets:
+            sock.close()
+
+    def reply(self, ident_offset=0, to=None):
+        data, address = self.server.recvfrom(512)
+        response = Message.from_bytes(data)
+        response.header.ident = (response.header.ident + ident_offset) % 65536
+        response.header.qr = 1
+        self.server.sendto(response.to_bytes(), to(address) if to else address)
+
+    def make_query(self, ident):
+        return Message(Header(ident, 0, 1, 0, 0, 0),
+                       [Question(Name("example.com"), Type.A, Class.IN)])
+
+    def test_query_gets_response(self):
+        thread = threading.Thread(target=self.reply)
+        thread.start()
+        response = self.pool.query(self.make_query(42), self.address, 2)
+        thread.join()
+        self.assertEqual(response.header.ident, 42)
+        self.assertEqual(self.pool.waiters, {})
+
+    def test_mismatched_response_is_dropped(self):
+        thread = threading.Thread(target=self.reply, args=(1,))
+        thread.start()
+        response = self.pool.query(self.make_query(42), self.address, 0.5)
+        thread.join()
+        self.assertIsNone(response)
+        self.assertEqual(self.pool.waiters, {})
+
+    def test_response_to_other_socket_is_dropped(self):
+        def other_socket(address):
+            port = next(sock.getsockname()[1] for sock in self.pool.sockets if sock.getsockname()[1] != address[1])
+            return (address[0], port)
+        thread = threading.Thread(target=self.reply, kwargs={"to": other_socket})
+        thread.start()
+        response = self.pool.query(self.make_query(42), self.address, 0.5)
+        thread.join()
+        self.assertIsNone(response)
+
+    def test_sockets_are_replaced(self):
+        with patch.object(dns.consts, "UDP_POLL_INTERVAL", 0.05):
+            pool = SocketPool(size=1, queries_per_socket=1)
+            old = pool.sockets[0]
+            thread = threading.Thread(target=self.reply)
+            thread.start()
+            response = pool.query(self.make_query(42), self.address, 2)
+            thread.join()
+            self.assertEqual(response.header.ident, 42)#Still answered on the replaced socket
+            self.assertIsNot(pool.sockets[0], old)
+            deadline = time.time() + 2
+            while old.fileno() != -1 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(old.fileno(), -1)
+            self.assertEqual(list(pool.expected), pool.sockets)
+            pool.sockets[0].close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from dns.zone import Catalog, Zone
+from dns.resource import ResourceRecord, ARecordData
+from dns.name import Name
+from dns.rcodes import RCode
+from dns.rtypes import Type
+from dns.classes import Class
+
+
+ZONE = """$TTL 3600
+example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. (
+    7 ; serial
+    3H ; refresh
+    15 ; retry
+    1w ; expire
+    3h ; minimum
+    )
+example.com. 1337 IN A 192.168.0.1
+www.example.com. 1337 IN A 192.168.0.2
+"""
+
+
+LOOKUP_ZONE = """$TTL 3600
+example.com. 3600 IN SOA ns1.example.com. hostmaster.example.com. (7 3H 15 1w 300)
+example.com. 3600 IN NS ns1.example.com.
+ns1.example.com. 3600 IN A 192.168.0.53
+www.example.com. 1337 IN A 192.168.0.2
+alias.example.com. 1337 IN CNAME www.example.com.
+away.example.com. 1337 IN CNAME www.example.org.
+host.deep.example.com. 1337 IN A 192.168.0.3
+*.wild.example.com. 60 IN A 192.168.0.4
+sub.example.com. 3600 IN NS ns.sub.example.com.
+ns.sub.example.com. 3600 IN A 192.168.0.5
+"""
+
+
+def a_record(name, address):
+    return ResourceRecord(Name(name), Type.A, Class.IN, 60, ARecordData(address))
+
+
+class ZoneTestCase(unittest.TestCase):
+    def setUp(self):
+        self.zone = Zone()
+        self.zone.load_and_parse(ZONE)
+
+    def test_zone_soa(self):
+        self.assertEqual(self.zone.serial, 7)
+        self.assertEqual(self.zone.soa.rdata.retry, 15)
+
+    def test_zone_record_sets(self):
+        records = self.zone.get_records("EXAMPLE.com")
+        self.assertEqual(sorted(str(r.type_) for r in records), ["A", "SOA"])
+        self.assertEqual(records[0].ttl, 3600)
+
+    def test_zone_update(self):
+        serial = self.zone.update([a_record("www.example.com", "192.168.0.2")],
+                                  [a_record("ftp.example.com", "192.168.0.3")])
+        self.assertEqual(serial, 8)
+        self.assertEqual(self.zone.get_records("www.example.com"), [])
+        self.assertEqual(len(self.zone.get_records("ftp.example.com")), 1)
+
+    def test_zone_ixfr_records(self):
+        self.zone.update([], [a_record("ftp.example.com", "192.168.0.3")])
+        records = self.zone.ixfr_records(7)
+        self.assertEqual([str(r.type_) for r in records], ["SOA", "SOA", "SOA", "A", "SOA"])
+        self.assertEqual([r.rdata.serial for r in records if r.type_ == Type.SOA], [8, 7, 8, 8])
+        self.assertEqual(self.zone.ixfr_records(8), [self.zone.soa])
+        self.assertIsNone(self.zone.ixfr_records(3))
+
+    def test_zone_apply_ixfr(self):
+        secondary = Zone()
+        secondary.apply_transfer(self.zone.axfr_records())
+        self.zone.update([], [a_record("ftp.example.com", "192.168.0.3")])
+        self.zone.update([a_record("example.com", "192.168.0.1")], [])
+        self.assertEqual(secondary.apply_transfer(self.zone.ixfr_records(7)), 9)
+        self.assertEqual(len(secondary.get_records("ftp.example.com")), 1)
+        self.assertEqual([str(r.type_) for r in secondary.get_records("example.com")], ["SOA"])
+        self.assertEqual(len(secondary.journal), 2)
+
+
+class CatalogTestCase(unittest.TestCase):
+    def test_catalog_find_zone(self):
+        catalog = Catalog()
+        catalog.add_zone("example.com", Zone())
+        catalog.add_zone("sub.example.com", Zone())
+        self.assertEqual(catalog.find_zone("www.sub.example.com.")[0], "sub.example.com")
+        self.assertEqual(catalog.find_zone("www.example.com.")[0], "example.com")
+        self.assertEqual(catalog.find_zone("example.org."), (None, None))
+
+
+class ZoneLookupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.zone = Zone()
+        self.zone.load_and_parse(LOOKUP_ZONE)
+
+    def lookup(self, name, qtype=Type.A):
+        return self.zone.lookup(name, qtype, "example.com")
+
+    def test_names(self):
+        self.assertIn("deep.example.com.", self.zone.names)
+        self.zone.update([], [a_record("a.b.example.com", "192.168.0.9")])
+        self.assertIn("b.example.com.", self.zone.names)
+        self.zone.update([a_record("a.b.example.com", "192.168.0.9")], [])
+        self.assertNotIn("b.example.com.", self.zone.names)
+
+    def test_exact(self):
+        rcode, answers, authorities, additionals, aa = self.lookup("WWW.example.com.")
+        self.assertEqual((rcode, aa), (RCode.NoError, True))
+        self.assertEqual([str(answer.rdata.address) for answer in answers], ["192.168.0.2"])
+
+    def test_cname(self):
+        rcode, answers, _, _, _ = self.lookup("alias.example.com.")
+        self.assertEqual([answer.type_ for answer in answers], [Type.CNAME, Type.A])
+        rcode, answers, _, _, _ = self.lookup("away.example.com.")
+        self.assertEqual((rcode, [answer.type_ for answer in answers]), (RCode.NoError, [Type.CNAME]))
+
+    def test_nodata(self):
+        rcode, answers, authorities, _, aa = self.lookup("www.example.com.", Type.MX)
+        self.assertEqual((rcode, answers, aa), (RCode.NoError, [], True))
+        self.assertEqual([authority.type_ for authority in authorities], [Type.SOA])
+        self.assertEqual(authorities[0].ttl, 300)#The minimum of the SOA record
+
+    def test_empty_non_terminal(self):
+        rcode, answers, authorities, _, _ = self.lookup("deep.example.com.")
+        self.assertEqual((rcode, answers), (RCode.NoError, []))
+        self.assertEqual([authority.type_ for authority in authorities], [Type.SOA])
+
+    def test_nxdomain(self):
+        rcode, answers, authorities, _, aa = self.lookup("nope.example.com.")
+        self.assertEqual((rcode, answers, aa), (RCode.NXDomain, [], True))
+        self.assertEqual([authority.type_ for authority in authorities], [Type.SOA])
+        self.assertEqual(self.lookup("nope.deep.example.com.")[0], RCode.NXDomain)
+
+    def test_wildcard(self):
+        rcode, answers, _, _, _ = self.lookup("anything.wild.example.com.")
+        self.assertEqual(rcode, RCode.NoError)
+        self.assertEqual(str(answers[0].name), "anything.wild.example.com.")
+        self.assertEqual(str(answers[0].rdata.address), "192.168.0.4")
+        self.assertEqual(self.lookup("a.b.wild.example.com.")[0], RCode.NoError)
+        self.assertEqual(self.lookup("anything.wild.example.com.", Type.MX)[:2], (RCode.NoError, []))
+        self.assertEqual(self.lookup("wild.example.com.")[:2], (RCode.NoError, []))#Empty non-terminal, not a wildcard match
+
+    def test_referral(self):
+        rcode, answers, authorities, additionals, aa = self.lookup("www.sub.example.com.")
+        self.assertEqual((rcode, answers, aa), (RCode.NoError, [], False))
+        self.assertEqual([str(authority.rdata.nsdname) for authority in authorities], ["ns.sub.example.com."])
+        self.assertEqual([str(additional.rdata.address) for additional in additionals], ["192.168.0.5"])
+
+
+if __name__ == '__main__':
+    unittest.main()